@@ -0,0 +1,426 @@
+"""Local JSON API over the dashboard's analytics.
+
+Usage: python api.py [--host 127.0.0.1] [--port 8502] [--data dataset.csv]
+
+A small HTTP/1.1 server on asyncio streams (no web framework) serving what the dashboard
+computes for its filter panel:
+
+- ``GET /`` lists the dataset version, the endpoints and the accepted filter values.
+- ``GET /regions`` returns the regional summary. ``level=country`` with an optional
+  ``in_region=...`` returns the country summary instead.
+- ``GET /outliers`` returns the metros whose GDP-per-capita z-score within the filter is
+  beyond ``threshold`` (default 2). Use ``side=high|low|both`` to pick a side.
+- ``GET /rankings`` returns the metros sorted by ``sort`` (``gdp_per_capita``, ``gdp`` or
+  ``population``). Add ``ascending=1`` to reverse the order.
+
+Every endpoint accepts the filter panel's options:
+
+- ``region`` (repeat it, or separate regions with commas)
+- ``gdp_min`` and ``gdp_max`` in billions
+- ``population``, a population size label such as ``Medium (1-5M)``
+
+Every endpoint also accepts ``page`` (from 1) and ``page_size`` (at most 500).
+
+``GET /ready`` reports the warm-up (`warmup.WarmUp`) that computes the filtered rows of the
+most common filter states when the server starts. It answers 200 once every state is done,
+and 503 with the progress so far before that.
+
+The data comes from a watched `store.MetroStore`, so edits to the CSV are served once they
+are processed. An ETag is the dataset version plus a digest of the normalized query. A
+request whose If-None-Match still matches is answered with 304 before anything is computed.
+Responses are gzip-compressed when the client's Accept-Encoding gives gzip a q-value above 0.
+A parameter that is not valid for the data, including a non-finite number, is answered with
+400; any other failure with 500. A request body longer than `MAX_REQUEST_BODY` is refused with
+413 without being read.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import math
+import os
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from binning import BUCKETINGS, PopulationBinner
+from cache import cache
+from metro_data import CITY, COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from ranks import SORT_MEASURES
+from results import file_fingerprint
+from rollup import RollupCube
+from store import MetroStore
+from warmup import WarmUp, filter_states, warmup_enabled
+
+MAX_PAGE_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+# Bodies smaller than this are sent uncompressed; gzip would barely shrink them
+MIN_GZIP_BYTES = 1024
+# GET and HEAD carry no meaningful body; a longer one is refused with 413 instead of read
+MAX_REQUEST_BODY = 64 * 1024
+SORT_KEYS = {'gdp_per_capita': GDP_PER_CAPITA, 'gdp': GDP, 'population': POPULATION}
+METRO_COLUMNS = {CITY: 'metro', COUNTRY: 'country', REGION: 'region', GDP: 'gdp', POPULATION: 'population', GDP_PER_CAPITA: 'gdp_per_capita'}
+STATUS = {
+    200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Content Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _records(frame):
+    # NaN becomes null; numpy scalars become plain JSON numbers
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict('records')
+
+
+def _json_default(value):
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _number(params, name, default=None, convert=float):
+    values = params.get(name)
+    if not values or values[-1] == '':
+        return default
+    try:
+        number = convert(values[-1])
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a number, got {values[-1]!r}")
+    if not math.isfinite(number):
+        # NaN and infinities would also reach the response, which JSON cannot carry
+        raise BadRequest(f"'{name}' must be a finite number, got {values[-1]!r}")
+    return number
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip: listed, or covered by ``*``, with a q-value above 0."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, *options = [part.strip() for part in item.split(';')]
+        weight = 1.0
+        for option in options:
+            name, _, value = option.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    # A malformed weight is read as a refusal rather than a guess
+                    weight = 0.0
+        if coding:
+            weights[coding.lower()] = weight
+    return weights.get('gzip', weights.get('x-gzip', weights.get('*', 0.0))) > 0
+
+
+def _flag(params, name):
+    return params.get(name, ['0'])[-1].lower() in ('1', 'true', 'yes')
+
+
+def parse_filters(params, regions):
+    """Normalized (regions, gdp_min, gdp_max, population) of a query, validated against the data."""
+    selected = [region.strip() for value in params.get('region', []) for region in value.split(',') if region.strip()]
+    unknown = sorted(set(selected) - set(regions))
+    if unknown:
+        raise BadRequest(f"Unknown region(s): {', '.join(unknown)}")
+    population = params.get('population', ['All'])[-1] or 'All'
+    if population != 'All' and population not in BUCKETINGS['pop_filter'][1]:
+        raise BadRequest(f"'population' must be All or one of: {', '.join(BUCKETINGS['pop_filter'][1])}")
+    return (
+        tuple(sorted(selected or regions)),
+        _number(params, 'gdp_min', 0.0),
+        _number(params, 'gdp_max', math.inf),
+        population
+    )
+
+
+def parse_page(params):
+    page = _number(params, 'page', 1, int)
+    page_size = _number(params, 'page_size', DEFAULT_PAGE_SIZE, int)
+    if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise BadRequest(f"'page' must be at least 1 and 'page_size' between 1 and {MAX_PAGE_SIZE}")
+    return page, page_size
+
+
+class MetroAnalytics:
+    """The dashboard's filter panel and the analytics behind it, over the store's current snapshot.
+
+    Per-filter results (the filter mask and the rollup cube of the filtered rows) are kept in
+    the ``api`` cache namespace, keyed by the snapshot version and the filters.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @property
+    def snapshot(self):
+        return self.store.snapshot
+
+    def regions(self, snapshot):
+        return sorted(snapshot.df[REGION].dropna().unique().tolist())
+
+    def _binner(self, snapshot):
+        return cache('analytics').get_or_compute(('api.binner', snapshot.version), lambda: PopulationBinner(snapshot.df[POPULATION]))
+
+    def filtered(self, snapshot, filters):
+        """(mask, rollup cube) of the rows of `snapshot` that pass `filters`."""
+        # The mask covers every row, so it is keyed by the whole snapshot's version
+        key = (snapshot.version, filters)
+        return cache('api').get_or_compute(key, lambda: self._filter(snapshot, filters))
+
+    def _filter(self, snapshot, filters):
+        regions, gdp_min, gdp_max, population = filters
+        df = snapshot.df
+        mask = df[REGION].isin(regions) & df[GDP].between(gdp_min, gdp_max)
+        if population != 'All':
+            mask &= self._binner(snapshot).mask('pop_filter', [population])
+        mask = mask.to_numpy()
+        # The unfiltered cube is kept up to date by the store itself
+        cube = snapshot.cube if mask.all() else RollupCube(df[mask])
+        return mask, cube
+
+    def region_summary(self, snapshot, filters, level='region', region=None):
+        if level not in ('region', 'country'):
+            raise BadRequest("'level' must be region or country")
+        _, cube = self.filtered(snapshot, filters)
+        return cube.summary(level, region=region if level == 'country' else None)
+
+    def outliers(self, snapshot, filters, threshold=2.0, side='both'):
+        """Metros whose GDP-per-capita z-score within the filter is beyond `threshold`, most extreme first."""
+        if side not in ('high', 'low', 'both'):
+            raise BadRequest("'side' must be high, low or both")
+        mask, _ = self.filtered(snapshot, filters)
+        rows = snapshot.df[mask].dropna(subset=[GDP_PER_CAPITA, POPULATION, GDP])
+        values = rows[GDP_PER_CAPITA]
+        # Population z-score (ddof=0), as scipy.stats.zscore computes it for the dashboard
+        z_score = (values - values.mean()) / values.std(ddof=0) if len(rows) > 1 else values * 0.0
+        keep = (z_score > threshold) if side == 'high' else (z_score < -threshold) if side == 'low' else (z_score.abs() > threshold)
+        outliers = rows.loc[keep, list(METRO_COLUMNS)].rename(columns=METRO_COLUMNS)
+        outliers['z_score'] = z_score[keep]
+        return outliers.reindex(outliers['z_score'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+    def rankings(self, snapshot, filters, sort, page, page_size, ascending=False):
+        """(rows, total rows, page) of the filtered metros sorted by `sort`; past the end is the last page."""
+        measure = SORT_KEYS.get(sort) or SORT_MEASURES.get(sort)
+        if measure is None:
+            raise BadRequest(f"'sort' must be one of: {', '.join(SORT_KEYS)}")
+        mask, _ = self.filtered(snapshot, filters)
+        positions, total = snapshot.rank_index.page(measure, page - 1, page_size, mask=mask, ascending=ascending)
+        rows = snapshot.df.iloc[positions][list(METRO_COLUMNS)].rename(columns=METRO_COLUMNS)
+        page = min(page, _last_page(total, page_size))
+        first = (page - 1) * page_size
+        rows.insert(0, 'rank', np.arange(first + 1, first + len(rows) + 1))
+        return rows.reset_index(drop=True), total, page
+
+
+def _last_page(total, page_size):
+    return max(1, -(-total // page_size))
+
+
+def _paged(frame, page, page_size):
+    """(rows, total rows, page) of one page of `frame`, clamped to the last page like the rank index does."""
+    page = min(page, _last_page(len(frame), page_size))
+    start = (page - 1) * page_size
+    return frame.iloc[start:start + page_size], len(frame), page
+
+
+class AnalyticsAPI:
+    """Route GET requests to `MetroAnalytics` and answer with JSON, ETags and gzip."""
+
+    def __init__(self, analytics, warmup=None):
+        self.analytics = analytics
+        self.warmup = warmup
+        self.routes = {'/': self.index, '/regions': self.regions, '/outliers': self.outliers, '/rankings': self.rankings}
+
+    def index(self, snapshot, params):
+        return {
+            'version': snapshot.version,
+            'generation': snapshot.generation,
+            'metros': len(snapshot.df),
+            'endpoints': sorted(path for path in self.routes if path != '/'),
+            'filters': {
+                'region': self.analytics.regions(snapshot),
+                'population': ['All'] + list(BUCKETINGS['pop_filter'][1]),
+                'gdp_min': 0.0,
+                'gdp_max': float(snapshot.df[GDP].max()),
+                'sort': sorted(SORT_KEYS)
+            }
+        }
+
+    def _page_body(self, snapshot, filters, page_size, rows, total, page):
+        regions, gdp_min, gdp_max, population = filters
+        return {
+            'version': snapshot.version,
+            'filters': {'region': list(regions), 'gdp_min': gdp_min, 'gdp_max': None if math.isinf(gdp_max) else gdp_max, 'population': population},
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'pages': _last_page(total, page_size),
+            'rows': _records(rows)
+        }
+
+    def regions(self, snapshot, params):
+        filters = parse_filters(params, self.analytics.regions(snapshot))
+        page, page_size = parse_page(params)
+        summary = self.analytics.region_summary(
+            snapshot, filters, params.get('level', ['region'])[-1], params.get('in_region', [None])[-1]
+        )
+        return self._page_body(snapshot, filters, page_size, *_paged(summary, page, page_size))
+
+    def outliers(self, snapshot, params):
+        filters = parse_filters(params, self.analytics.regions(snapshot))
+        page, page_size = parse_page(params)
+        outliers = self.analytics.outliers(snapshot, filters, _number(params, 'threshold', 2.0), params.get('side', ['both'])[-1])
+        return self._page_body(snapshot, filters, page_size, *_paged(outliers, page, page_size))
+
+    def rankings(self, snapshot, params):
+        filters = parse_filters(params, self.analytics.regions(snapshot))
+        page, page_size = parse_page(params)
+        ranked = self.analytics.rankings(
+            snapshot, filters, params.get('sort', ['gdp_per_capita'])[-1], page, page_size, _flag(params, 'ascending')
+        )
+        return self._page_body(snapshot, filters, page_size, *ranked)
+
+    async def respond(self, method, target, headers):
+        """(status, headers, body) for one request."""
+        if method not in ('GET', 'HEAD'):
+            return self._error(405, 'Only GET and HEAD are supported')
+        url = urlsplit(target)
+        if url.path.rstrip('/') == '/ready':
+            return self.ready()
+        route = self.routes.get(url.path.rstrip('/') or '/')
+        if route is None:
+            return self._error(404, f'No endpoint {url.path}')
+        # One snapshot per request, so the ETag and the body describe the same data
+        snapshot = self.analytics.snapshot
+        params = parse_qs(url.query, keep_blank_values=True)
+        query = json.dumps(sorted((key, sorted(values)) for key, values in params.items()))
+        gzipped = accepts_gzip(headers.get('accept-encoding', ''))
+        etag = f'"{snapshot.version}-{hashlib.sha1((url.path + query).encode("utf-8")).hexdigest()[:16]}'
+        etag += '-gz"' if gzipped else '"'
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return 304, response_headers, b''
+        try:
+            # pandas work runs off the event loop so slow queries do not stall other clients
+            payload = await asyncio.to_thread(route, snapshot, params)
+        except BadRequest as error:
+            return self._error(400, str(error))
+        body = json.dumps(payload, default=_json_default, separators=(',', ':'), allow_nan=False).encode('utf-8')
+        response_headers['Content-Type'] = 'application/json'
+        if gzipped and len(body) >= MIN_GZIP_BYTES:
+            body = gzip.compress(body, compresslevel=6)
+            response_headers['Content-Encoding'] = 'gzip'
+        return 200, response_headers, body
+
+    def ready(self):
+        """200 once warm-up is done (or off), 503 while it runs; never cached, unlike the data endpoints."""
+        status = self.warmup.status() if self.warmup is not None else {'ready': True}
+        body = json.dumps(status, default=_json_default, separators=(',', ':')).encode('utf-8')
+        return 200 if status['ready'] else 503, {'Content-Type': 'application/json', 'Cache-Control': 'no-store'}, body
+
+    def _error(self, status, message):
+        return status, {'Content-Type': 'application/json'}, json.dumps({'error': message}).encode('utf-8')
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection, keeping it open between them unless asked not to."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length') or '0'
+                if not length.isdigit() or int(length) > MAX_REQUEST_BODY:
+                    # The body is left unread, so the connection cannot carry another request
+                    error = self._error(413, f'Request bodies are limited to {MAX_REQUEST_BODY} bytes') if length.isdigit() else self._error(400, 'Invalid Content-Length')
+                    await self._send(writer, method, *error, keep_alive=False)
+                    break
+                if int(length):
+                    await reader.readexactly(int(length))
+
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except Exception:
+                    # A failing request gets an answer instead of a dropped connection
+                    traceback.print_exc()
+                    status, response_headers, body = self._error(500, 'Internal server error')
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                await self._send(writer, method, status, response_headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, method, status, response_headers, body, keep_alive):
+        response_headers['Content-Length'] = str(len(body))
+        response_headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        head = f'HTTP/1.1 {status} {STATUS[status]}\r\n' + ''.join(f'{name}: {value}\r\n' for name, value in response_headers.items())
+        writer.write(head.encode('latin-1') + b'\r\n' + (b'' if method == 'HEAD' else body))
+        await writer.drain()
+
+
+def warmup_tasks(analytics):
+    """(label, task) pairs filtering the current snapshot by the most common filter states."""
+    tasks = []
+    for regions, population in filter_states(analytics.snapshot.df):
+        # Normalized the way `parse_filters` normalizes a query without GDP bounds
+        filters = (tuple(sorted(regions)), 0.0, math.inf, population)
+        label = regions[0] if len(regions) == 1 else f'{population} metros'
+        tasks.append((label, lambda filters=filters: analytics.filtered(analytics.snapshot, filters)))
+    return tasks
+
+
+async def serve(store, host='127.0.0.1', port=8502):
+    analytics = MetroAnalytics(store)
+    # METRO_WARMUP=0 turns off precomputing the most common filter states
+    warmup = WarmUp(warmup_tasks(analytics), name='api-warmup').start() if warmup_enabled() else None
+    api = AnalyticsAPI(analytics, warmup)
+    server = await asyncio.start_server(api.handle, host, port)
+    print(f"Serving the metro analytics API on http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset.csv'))
+    args = parser.parse_args()
+
+    # Fingerprinted before it is read, so an edit made while loading is picked up by the watcher
+    fingerprint = file_fingerprint(args.data)
+    store = MetroStore(clean_metros(pd.read_csv(args.data)))
+    store.watch(args.data, fingerprint)
+    try:
+        asyncio.run(serve(store, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,6 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 from streamlit_extras.stoggle import stoggle 
 from streamlit_extras.colored_header import colored_header
 from streamlit_extras.metric_cards import style_metric_cards
@@ -10,9 +8,36 @@ import pycountry
 import altair as alt
 import time
 import os
+import functools
 from plotly.subplots import make_subplots
 import math
 import scipy.stats as stats
+from assets import inject_assets
+from backends import backend_name, make_backend, read_metros
+from binning import BUCKETINGS, PopulationBinner, bin_range
+from bootstrap import BootstrapRunner
+from cache import cache_stats, cached, result_store
+from charts import (
+    bubble_chart, country_metros_chart, globe_view, metro_growth_chart, metro_map, outlier_quadrants,
+    outlier_scatter, outlier_zscores, peer_comparison, rank_movers_chart, region_countries_chart,
+    region_growth_chart, regional_comparison, regional_composition, regional_matrix, regional_performance_view,
+    scaling_chart, size_distribution, size_efficiency_chart, size_efficiency_view, size_histogram_view, size_scatter,
+    top_bar_chart, top_radar_chart, top_treemap, world_map
+)
+from figures import compact_figure, render_figure
+from geo import ClusterIndex, per_metro_positions, view_query
+from metro_data import clean_metros, dataset_version
+from peers import PeerIndex
+from ranks import SORT_MEASURES
+from regression import grouped_ols
+from report import DEFAULT_SORT, FIGURES as REPORT_FIGURES, RANDOM_STATE, ReportInputs
+from search import SearchIndex
+from store import MetroSnapshot, MetroStore
+from vega import render_chart
+from vintages import VintageStore
+from warmup import WarmUp, filter_states, warmup_enabled
+from rollup import RollupCube
+from weighted import grouped_weighted_stats, weighted_mean
 
 # Page configuration
 st.set_page_config(
@@ -31,615 +56,17 @@ def colored_header(label, description=None, color_name=None):
     else:
         st.markdown(f'<h2 class="header-with-bg {color_name}">{label}</h2>', unsafe_allow_html=True)
 
-# Custom CSS
-st.markdown("""
-<style>
-    /* Power BI inspired corporate theme */
-    :root {
-        --primary-color: #0078D4;
-        --secondary-color: #0050B3;
-        --accent-color: #107C10;
-        --text-color: #252525;
-        --light-bg: #F6F8FA;
-        --card-border: #E0E0E0;
-        --card-bg: #FFFFFF;
-        --header-bg: #0078D4;
-        --header-text: #FFFFFF;
-        --subtitle-color: #605E5C;
-        --filter-bg: #EFF6FC;
-        --hover-bg: #F3F2F1;
-    }
-    
-    /* General styles */
-    .stApp {
-        background-color: var(--light-bg);
-    }
-    
-    h1, h2, h3, h4, h5, h6 {
-        color: var(--text-color);
-        font-family: 'Segoe UI', sans-serif;
-        font-weight: 600;
-        margin-bottom: 0.5rem;
-    }
-    
-    p {
-        color: var(--text-color);
-        line-height: 1.6;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    /* Navigation bar */
-    .navbar {
-        background-color: var(--primary-color);
-        padding: 0.75rem;
-        position: sticky;
-        top: 0;
-        z-index: 999;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        margin-bottom: 1rem;
-    }
-    
-    .nav-title {
-        color: white;
-        font-size: 1.1rem;
-        font-weight: 600;
-        margin: 0;
-        flex-grow: 0;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    .nav-buttons {
-        display: flex;
-        gap: 5px;
-        flex-grow: 1;
-        justify-content: center;
-    }
-    
-    .nav-button {
-        background-color: rgba(255,255,255,0.1);
-        color: white;
-        border: none;
-        padding: 6px 12px;
-        border-radius: 2px;
-        cursor: pointer;
-        transition: background-color 0.2s;
-        font-size: 0.85rem;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    .nav-button:hover {
-        background-color: rgba(255,255,255,0.2);
-    }
-    
-    /* Header styles */
-    .header-with-bg {
-        background-color: var(--primary-color);
-        color: var(--header-text) !important;
-        padding: 0.75rem 1rem;
-        border-radius: 3px;
-        margin-top: 1rem;
-        margin-bottom: 0.5rem;
-        font-family: 'Segoe UI', sans-serif;
-        font-weight: 600;
-    }
-    
-    .header-description {
-        font-size: 1rem;
-        color: var(--subtitle-color);
-        margin-bottom: 1rem;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    .blue-green-70 {
-        background: linear-gradient(90deg, var(--primary-color), var(--accent-color));
-    }
-    
-    /* Cards and insight boxes */
-    .insight-box {
-        background-color: var(--card-bg);
-        border-radius: 3px;
-        padding: 1.25rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        height: 100%;
-        border-top: 3px solid var(--primary-color);
-    }
-    
-    .insight-box h3 {
-        color: var(--primary-color);
-        margin-bottom: 0.75rem;
-        font-size: 1.1rem;
-        font-family: 'Segoe UI', sans-serif;
-        font-weight: 600;
-    }
-    
-    .insight-box h4 {
-        color: var(--text-color);
-        margin-top: 0.75rem;
-        margin-bottom: 0.5rem;
-        font-size: 1rem;
-        font-family: 'Segoe UI', sans-serif;
-        font-weight: 600;
-    }
-    
-    .insight-box ul {
-        padding-left: 1.25rem;
-    }
-    
-    .insight-box li {
-        margin-bottom: 0.4rem;
-        color: var(--text-color);
-    }
-    
-    .highlight {
-        background-color: #E7F3E8;
-        padding: 0 0.3rem;
-        border-radius: 2px;
-        font-weight: 500;
-        color: var(--accent-color);
-    }
-    
-    /* Metric cards */
-    .metric-container {
-        display: flex;
-        justify-content: space-between;
-        gap: 0.75rem;
-        margin-bottom: 1rem;
-    }
-    
-    .metric-card {
-        background-color: var(--card-bg);
-        border-radius: 3px;
-        padding: 1.25rem;
-        flex: 1;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        text-align: center;
-        border-left: 3px solid var(--primary-color);
-    }
-    
-    .metric-value {
-        font-size: 1.8rem;
-        font-weight: 600;
-        color: var(--primary-color);
-        margin: 0.5rem 0;
-    }
-    
-    .metric-label {
-        color: var(--subtitle-color);
-        font-size: 0.9rem;
-        margin: 0;
-        font-weight: 400;
-    }
-    
-    /* Section dividers */
-    .section-divider {
-        height: 1px;
-        background: var(--card-border);
-        margin: 2rem 0;
-    }
-    
-    /* Animations */
-    .fadeIn {
-        animation: fadeIn 0.5s ease-in-out;
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(10px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    /* Footer */
-    .footer {
-        background-color: var(--primary-color);
-        color: rgba(255,255,255,0.8);
-        padding: 1.25rem;
-        text-align: center;
-        margin-top: 2rem;
-        border-radius: 3px;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    .footer p {
-        margin: 0.3rem 0;
-        color: rgba(255,255,255,0.8);
-        font-size: 0.85rem;
-    }
-    
-    .author-info {
-        margin-top: 12px;
-        padding-top: 12px;
-        border-top: 1px solid rgba(255,255,255,0.2);
-    }
-    
-    .social-links a {
-        color: rgba(255,255,255,0.9);
-        text-decoration: none;
-        margin: 0 5px;
-        transition: color 0.2s;
-    }
-    
-    .social-links a:hover {
-        color: white;
-        text-decoration: underline;
-    }
-    
-    /* Streamlit element customization */
-    div.stTabs [data-baseweb="tab-list"] {
-        gap: 2px;
-        background-color: var(--light-bg);
-        padding: 0.25rem;
-        border-radius: 3px;
-        margin-bottom: 0.5rem;
-    }
-    
-    div.stTabs [data-baseweb="tab"] {
-        border-radius: 2px;
-        padding: 0.35rem 0.75rem;
-        font-size: 0.85rem;
-    }
-    
-    div.stTabs [aria-selected="true"] {
-        background-color: var(--primary-color) !important;
-        color: white !important;
-        font-weight: 400;
-    }
-    
-    .stButton button {
-        background-color: var(--primary-color);
-        color: white;
-        border: none;
-        padding: 0.35rem 0.75rem;
-        border-radius: 2px;
-        font-weight: 400;
-        font-size: 0.85rem;
-    }
-    
-    /* Title styling */
-    .dashboard-header {
-        display: flex;
-        align-items: center;
-        background-color: var(--primary-color);
-        border-radius: 3px;
-        padding: 1.25rem;
-        margin-bottom: 1.5rem;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        animation: fadeIn 0.5s ease-out;
-    }
-    
-    .title-container {
-        flex-grow: 1;
-    }
-    
-    .main-title {
-        color: white;
-        font-size: 1.8rem;
-        margin: 0;
-        padding: 0;
-        line-height: 1.2;
-        font-weight: 600;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    .subtitle {
-        color: rgba(255,255,255,0.95);
-        font-size: 1rem;
-        margin-top: 0.5rem;
-        line-height: 1.5;
-        font-weight: 400;
-        max-width: 800px;
-        font-family: 'Segoe UI', sans-serif;
-    }
-    
-    /* Main content area */
-    .main-content {
-        padding: 0.75rem;
-        background-color: var(--light-bg);
-    }
-    
-    /* Custom styling for Streamlit metrics */
-    div[data-testid="stMetricValue"] {
-        font-size: 1.75rem !important;
-        font-weight: 600 !important;
-        color: var(--primary-color) !important;
-        font-family: 'Segoe UI', sans-serif !important;
-    }
-    
-    div[data-testid="stMetricLabel"] {
-        color: var(--subtitle-color) !important;
-        font-size: 0.9rem !important;
-        font-weight: 400 !important;
-        font-family: 'Segoe UI', sans-serif !important;
-    }
-    
-    div[data-testid="stMetricDelta"] {
-        color: var(--accent-color) !important;
-        font-family: 'Segoe UI', sans-serif !important;
-    }
-    
-    div[data-testid="stExpander"] {
-        border-radius: 3px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        margin-bottom: 1rem;
-        border: 1px solid var(--card-border);
-    }
-    
-    div[data-testid="stExpanderContent"] {
-        background-color: var(--card-bg);
-    }
-    
-    /* Filter panel styling */
-    .filter-panel {
-        background-color: var(--filter-bg);
-        padding: 1rem;
-        border-radius: 3px;
-        margin-bottom: 1rem;
-        border: 1px solid var(--card-border);
-    }
-    
-    /* Chart container styling */
-    .chart-container {
-        background-color: var(--card-bg);
-        border-radius: 3px;
-        padding: 1rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-        margin-bottom: 1rem;
-        border: 1px solid var(--card-border);
-    }
-    
-    /* About section styling */
-    .about-section {
-        background-color: var(--card-bg);
-        border-radius: 3px;
-        padding: 1rem;
-        margin-bottom: 1rem;
-        border-left: 3px solid var(--primary-color);
-    }
-    
-    /* Outlier container styling */
-    .outlier-container {
-        display: flex;
-        align-items: stretch;
-        margin-bottom: 1.5rem;
-    }
-    
-    .outlier-container > div {
-        display: flex;
-        flex-direction: column;
-    }
-    
-    .outlier-container .stTabs {
-        height: 100%;
-    }
-    
-    .outlier-container .stTab > div:first-child {
-        height: 100%;
-    }
-    
-    /* Navigation styling */
-    .navbar {
-        background-color: #FFFFFF;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-        position: sticky;
-        top: 0;
-        z-index: 999;
-        padding: 0.5rem 1rem;
-        display: flex;
-        flex-wrap: wrap;
-        justify-content: center;
-        align-items: center;
-        border-bottom: 2px solid #F0F0F0;
-    }
-    
-    .nav-button {
-        background-color: transparent;
-        color: #252525;
-        border: none;
-        padding: 0.5rem 1rem;
-        margin: 0 0.3rem;
-        border-radius: 4px;
-        font-weight: 600;
-        font-size: 0.9rem;
-        cursor: pointer;
-        transition: all 0.3s;
-    }
-    
-    .nav-button:hover {
-        background-color: #F0F2F5;
-        color: #0078D4;
-    }
-    
-    .nav-button.active {
-        color: #0078D4;
-        border-bottom: 2px solid #0078D4;
-        background-color: rgba(0, 120, 212, 0.1);
-    }
-    
-    /* Page title */
-    .title-container {
-        text-align: center;
-        padding: 1rem 0;
-        margin-bottom: 1rem;
-    }
-    
-    .dashboard-title {
-        color: #252525;
-        font-size: 1.6rem;
-        font-weight: 600;
-        margin-bottom: 0.5rem;
-    }
-    
-    .dashboard-subtitle {
-        color: #605E5C;
-        font-size: 1rem;
-        font-weight: 400;
-        max-width: 800px;
-        margin: 0 auto;
-    }
-    
-    /* Metrics row styling */
-    .metric-container {
-        background-color: white;
-        border-radius: 4px;
-        padding: 1rem;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.05);
-        display: flex;
-        flex-direction: column;
-        margin-bottom: 1rem;
-    }
-    
-    /* Section styling */
-    .section-header {
-        display: flex;
-        align-items: center;
-        margin: 1.5rem 0 1rem 0;
-        padding-bottom: 0.5rem;
-        border-bottom: 1px solid #E1DFDD;
-    }
-    
-    .section-header h2 {
-        color: #252525;
-        font-size: 1.4rem;
-        font-weight: 600;
-        margin: 0;
-    }
-    
-    .section-description {
-        color: #605E5C;
-        font-size: 0.95rem;
-        margin-bottom: 1.5rem;
-        max-width: 900px;
-    }
-    
-    .section-divider {
-        height: 2px;
-        background: linear-gradient(to right, rgba(0,0,0,0), #E1DFDD, rgba(0,0,0,0));
-        margin: 2rem 0;
-    }
-    
-    /* Chart container styling */
-    .chart-container {
-        background-color: white;
-        border-radius: 4px;
-        padding: 1rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.08);
-        margin-bottom: 1rem;
-        border-top: 3px solid #0078D4;
-    }
-    
-    /* Insight box styling */
-    .insight-box {
-        background-color: white;
-        border-radius: 4px;
-        padding: 1.5rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.08);
-        height: 100%;
-        border-left: 3px solid #0078D4;
-    }
-    
-    /* Filter panel styling */
-    .filter-panel {
-        background-color: white;
-        border-radius: 4px;
-        padding: 1rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.08);
-        margin: 1rem 0;
-        border-left: 3px solid #0078D4;
-    }
-    
-    /* About section styling */
-    .about-section {
-        background-color: white;
-        border-radius: 4px;
-        padding: 1rem;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.08);
-        margin-bottom: 1rem;
-    }
-    
-    /* Streamlit element overrides */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 2px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        height: 2.5rem;
-        white-space: pre-wrap;
-        background-color: #F0F2F5;
-        border-radius: 4px 4px 0 0;
-        padding: 0 1rem;
-        font-size: 0.9rem;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: white !important;
-        font-weight: 600;
-        color: #0078D4 !important;
-        border-top: 2px solid #0078D4 !important;
-    }
-    
-    /* Fix the tab height issue */
-    .stTabs > div[data-baseweb="tab-panel"] {
-        height: 100%;
-    }
-    
-    /* Hide Streamlit branding */
-    #MainMenu, footer, header {
-        visibility: hidden;
-    }
-    
-    div[data-testid="stToolbar"] {
-        visibility: hidden;
-        height: 0;
-        margin: 0;
-        padding: 0;
-    }
-    
-    /* Make metrics stand out */
-    div[data-testid="stMetric"] {
-        background-color: white;
-        padding: 1rem;
-        border-radius: 4px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-    }
-    
-    div[data-testid="stMetric"] > div {
-        padding: 0;
-    }
-    
-    div[data-testid="stMetric"] label {
-        color: #605E5C;
-        font-size: 0.85rem;
-    }
-    
-    div[data-testid="stMetricValue"] {
-        color: #0078D4 !important;
-        font-size: 1.5rem !important;
-        font-weight: 600 !important;
-    }
-    
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        font-weight: 600;
-        font-size: 1rem;
-        color: #252525;
-        background-color: white;
-        border-radius: 4px;
-        border: none !important;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-    }
-    
-    .streamlit-expanderContent {
-        background-color: white;
-        border-radius: 0 0 4px 4px;
-        border: none !important;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-    }
-</style>
-""", unsafe_allow_html=True)
+# Dashboard stylesheet and icons, served from static/ and cached by the browser
+inject_assets()
 
 # Load data
-@st.cache_data
+@cached('data')
+def read_dataset(path, fingerprint, engine):
+    # Keyed by a fingerprint of the file's content, so a cold worker reads an unchanged file
+    # back from the result store. With METRO_BACKEND=polars the
+    # CSV is scanned and cleaned in one Polars plan; otherwise by pandas and clean_metros
+    return read_metros(path, engine)
+
 def load_data():
     try:
         # Check if file exists first using relative path
@@ -657,81 +84,241 @@ def load_data():
             absolute_path = r"D:\visualization project\Global GDP\dataset.csv"
             if os.path.exists(absolute_path):
                 st.info(f"Found dataset at absolute path: {absolute_path}")
-                df = pd.read_csv(absolute_path)
+                dataset_path = absolute_path
             else:
                 st.error(f"Dataset also not found at absolute path: {absolute_path}")
                 return None
-        else:
-            # Try to load the file using relative path
-            df = pd.read_csv(dataset_path)
+        
+        # Numeric columns, GDP per capita and regions, shared with the analytics backends
+        metro_store = get_metro_store(dataset_path)
         
         # Display success message
         st.success("Dataset loaded successfully!")
         
-        # Clean population column - remove spaces, commas and convert to numeric
-        df['Metropolitian Population'] = df['Metropolitian Population'].str.replace(',', '').str.strip()
-        df['Metropolitian Population'] = pd.to_numeric(df['Metropolitian Population'], errors='coerce')
-        
-        # Ensure GDP column is numeric
-        df['Official est. GDP(billion US$)'] = pd.to_numeric(df['Official est. GDP(billion US$)'], errors='coerce')
-        
-        # Calculate GDP per capita more efficiently
-        df['GDP_per_capita'] = df['Official est. GDP(billion US$)'] * 1000 / (df['Metropolitian Population'] / 1_000_000)
-        df['GDP_per_capita'] = df['GDP_per_capita'].round(2)
-        
-        # Add region information based on country
-        df['Region'] = df['Country/Region'].map(get_region)
-        
-        return df
+        return metro_store
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         import traceback
         st.error(f"Traceback: {traceback.format_exc()}")
         return None
 
-def get_region(country_name):
-    regions = {
-        'United States': 'North America',
-        'Canada': 'North America',
-        'Mexico': 'North America',
-        'China': 'East Asia',
-        'Japan': 'East Asia',
-        'South Korea': 'East Asia',
-        'Taiwan': 'East Asia',
-        'India': 'South Asia',
-        'Pakistan': 'South Asia',
-        'Bangladesh': 'South Asia',
-        'United Kingdom': 'Europe',
-        'Germany': 'Europe',
-        'France': 'Europe',
-        'Italy': 'Europe',
-        'Spain': 'Europe',
-        'Russia': 'Europe',
-        'Brazil': 'South America',
-        'Argentina': 'South America',
-        'Colombia': 'South America',
-        'Australia': 'Oceania',
-        'New Zealand': 'Oceania',
-        'South Africa': 'Africa',
-        'Nigeria': 'Africa',
-        'Egypt': 'Africa',
-        'Saudi Arabia': 'Middle East',
-        'United Arab Emirates': 'Middle East',
-        'Israel': 'Middle East',
-        'Singapore': 'Southeast Asia',
-        'Malaysia': 'Southeast Asia',
-        'Indonesia': 'Southeast Asia',
-        'Thailand': 'Southeast Asia',
-        'Vietnam': 'Southeast Asia',
-        'Philippines': 'Southeast Asia'
-    }
-    
-    # Return the region if found, otherwise return 'Other'
-    return regions.get(country_name, 'Other')
+@cached('analytics')
+def get_population_binner(_df, version):
+    # Sorted once per dataset version; bin codes are cached inside the binner per edge set
+    return PopulationBinner(_df['Metropolitian Population'])
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_analytics_backend(_df, version, name):
+    # METRO_BACKEND=pandas|duckdb|polars; an engine that is not installed falls back to pandas.
+    # The DuckDB backend holds a copy of the table, so only the current and previous versions are kept
+    return make_backend(name, _df, version)
+
+@cached('analytics')
+def get_rollup_cube(_df, version, filter_key, _backend, _filters):
+    # One cube per filter state and version of the selected regions' rows
+    return RollupCube(_df, country_sums=_backend.country_sums(**_filters))
+
+@st.cache_resource(show_spinner=False)
+def get_bootstrap_runner():
+    # One background runner per server process; it caches CIs per dataset version and filter state
+    return BootstrapRunner()
+
+def highlight_metro(fig, city):
+    """Dim every metro except `city` in the scatter, map and bar traces of a Plotly figure."""
+    if not city:
+        return fig
+    selections = []
+    for trace in fig.data:
+        names = trace.hovertext if 'selectedpoints' in trace else None
+        if names is None and trace.type == 'bar':
+            names = trace.y if trace.orientation == 'h' else trace.x
+        if names is None or isinstance(names, str):
+            selections.append(None)
+        else:
+            selections.append([i for i, name in enumerate(names) if name == city])
+    # Leave the chart untouched when the metro is not on it
+    if not any(selections):
+        return fig
+    for trace, selected in zip(fig.data, selections):
+        if selected is not None:
+            trace.selectedpoints = selected
+            trace.unselected = dict(marker=dict(opacity=0.2))
+    return fig
+
+def figure_key(name, version, filter_key, *inputs):
+    # Everything a dashboard figure is drawn from: the data, the filter panel and the figure's
+    # own inputs, such as the sort order or a drill-down selection
+    return (name, version, filter_key) + inputs
+
+def plotly_chart(name, build, *inputs, highlight=False, **options):
+    """Draw the figure `build()` returns through the figure transport and record its payload size.
+
+    The figure is cached under `name`, the data version, the filter panel and `inputs`, so
+    `build` only runs when one of them changes. With `highlight` the highlighted metro is
+    picked out in the figure, and is part of its key.
+    """
+    if highlight:
+        build, inputs = (lambda draw=build: highlight_metro(draw(), highlight_city)), inputs + (highlight_city,)
+    payload = render_figure(
+        build,
+        figure_key(name, data_version, filter_key, *inputs),
+        # METRO_FIGURE_TRANSPORT=json|binary; binary draws each chart in the typed-array component
+        transport=os.environ.get('METRO_FIGURE_TRANSPORT', 'json'),
+        measure=st.session_state.get('measure_payloads', False),
+        **options
+    )
+    if payload is not None:
+        figure_payloads.append(payload)
+
+def vega_chart(chart):
+    """Draw an Altair chart from its server-side aggregates and record its payload size."""
+    payload = render_chart(chart, measure=st.session_state.get('measure_payloads', False))
+    if payload is not None:
+        figure_payloads.append(payload)
+
+@cached('analytics')
+def build_snapshot(_df, version):
+    # Persisted with the other analytics, so a cold worker loads the indexes instead of building them
+    return MetroSnapshot.build(_df)
+
+@st.cache_resource(show_spinner=False)
+def get_metro_store(path):
+    # One store per source file for the life of the server. Its watcher rebuilds edits to the
+    # file in the background, so a rerun only reads `store.snapshot` and never touches the CSV
+    engine = backend_name()
+    return MetroStore.from_csv(
+        path,
+        read=lambda path, fingerprint: read_dataset(path, fingerprint, engine),
+        build=lambda df: build_snapshot(df, dataset_version(df)),
+        prepare=warm_snapshot
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_uploaded_store(_df, version):
+    # An uploaded file has no source to watch; each distinct upload gets its own store
+    return MetroStore(_df, prepare=warm_snapshot, snapshot=build_snapshot(_df, version))
+
+@st.cache_resource(show_spinner=False)
+def get_vintage_store():
+    # Partition results live for the whole server process; refresh() only recomputes changed years
+    return VintageStore(os.path.join(os.getcwd(), "vintages"), base_csv=os.path.join(os.getcwd(), "dataset.csv"))
+
+@cached('analytics')
+def get_search_index(_df, version):
+    # Trie and n-gram postings are built once per dataset version and reused for every query
+    return SearchIndex(_df)
+
+@cached('analytics')
+def get_map_clusters(_df, version):
+    # Quadtree clusters for every map zoom level, built once per dataset version. Metros placed at
+    # their country's centroid never split into clusters, so there is no index for them (None)
+    return ClusterIndex(_df) if per_metro_positions(_df) else None
+
+def warm_snapshot(snapshot):
+    # Fill the per-version caches before the store publishes a snapshot, so no viewer builds them
+    get_population_binner(snapshot.df, snapshot.version)
+    get_search_index(snapshot.df, snapshot.version)
+    get_map_clusters(snapshot.df, snapshot.version)
+
+@cached('analytics')
+def get_peer_index(_df, version, filter_key, by_region):
+    return PeerIndex(_df, by_region=by_region)
+
+@cached('analytics')
+def get_scaling_fits(_frame, version, filter_key, group_column):
+    # All group regressions of log(GDP per capita) on log(population) in one pass
+    return grouped_ols(
+        np.log(_frame['Metropolitian Population']),
+        np.log(_frame['GDP_per_capita']),
+        _frame[group_column]
+    )
+
+def warm_filter_state(snapshot, regions, selected_pop, analytics_backend, bootstrap_runner):
+    """Compute the per-filter results a session's first run with this filter panel reads."""
+    df = snapshot.df
+    max_gdp = float(df['Official est. GDP(billion US$)'].max())
+    filter_mask = df['Region'].isin(regions) & df['Official est. GDP(billion US$)'].between(0.0, max_gdp)
+    if selected_pop != "All":
+        filter_mask &= get_population_binner(df, snapshot.version).mask('pop_filter', [selected_pop])
+    filtered_df = df[filter_mask]
+    if filtered_df.empty:
+        return
+    # Keyed exactly as the page keys them, with the GDP slider at its full range
+    filter_key = (tuple(regions), 0.0, max_gdp, selected_pop)
+    filter_version = snapshot.filter_version(regions)
+    if not filter_mask.all():
+        backend_filters = dict(
+            regions=regions,
+            gdp_range=(0.0, max_gdp),
+            population_range=None if selected_pop == "All" else bin_range('pop_filter', selected_pop)
+        )
+        get_rollup_cube(filtered_df, filter_version, filter_key, analytics_backend, backend_filters)
+    clean_df = filtered_df.dropna(subset=['GDP_per_capita', 'Metropolitian Population', 'Official est. GDP(billion US$)'])
+    get_scaling_fits(clean_df, filter_version, filter_key, 'Region')
+    get_peer_index(clean_df, filter_version, filter_key, False)
+    # Bootstrap CIs run on the runner's own workers; submitting them is enough
+    bootstrap_runner.submit((filter_version, filter_key, 'region'), clean_df['GDP_per_capita'], clean_df['Region'])
+    bootstrap_runner.submit(
+        (filter_version, filter_key, 'size_trend'),
+        clean_df['GDP_per_capita'],
+        get_population_binner(df, snapshot.version).categorize('size_trend').reindex(clean_df.index)
+    )
+
+# The figure inputs a new session passes to `plotly_chart` for each report figure, before it
+# picks a sort order, a map view, a highlighted metro or a scaling level. CI figures are warmed
+# with their intervals drawn
+DEFAULT_FIGURE_INPUTS = {
+    'world-map': (None,),
+    'globe': (None,),
+    'bubble-chart': (None,),
+    'top-metros': (SORT_MEASURES[DEFAULT_SORT], None),
+    'top-metros-radar': (SORT_MEASURES[DEFAULT_SORT],),
+    'top-metros-treemap': (SORT_MEASURES[DEFAULT_SORT],),
+    'size-scatter': (None,),
+    'size-distribution': (None,),
+    'size-efficiency': (True,),
+    'scaling-by-region': ('Region', 5),
+    'regional-comparison': (True,),
+    'regional-composition': (),
+    'regional-matrix': (),
+    'outlier-distribution': (None,),
+    'outlier-zscores': (None,),
+    'outlier-quadrants': (None,),
+}
+
+def warm_default_figures(snapshot):
+    # The report draws every section with the filter panel at its defaults, as a new session does,
+    # and caches each figure under the key that session looks it up by
+    inputs = ReportInputs(snapshot)
+    df = snapshot.df
+    default_filter = (tuple(sorted(df['Region'].unique().tolist())), 0.0, float(df['Official est. GDP(billion US$)'].max()), 'All')
+    for name, build in REPORT_FIGURES.items():
+        viewport = name == 'world-map' and get_map_clusters(df, snapshot.version) is not None
+        figure_inputs = ((None,) if viewport else ()) + DEFAULT_FIGURE_INPUTS[name]
+        compact_figure(
+            functools.partial(build, inputs),
+            figure_key(name, snapshot.version, default_filter, *figure_inputs),
+            os.environ.get('METRO_FIGURE_TRANSPORT', 'json'),
+            viewport=viewport
+        )
+
+@st.cache_resource(show_spinner=False)
+def get_warmup(_snapshot, version):
+    # Started by the first run after the server starts; every later session reads its progress.
+    # Streamlit-cached resources are resolved here, on the script thread, and handed to the tasks
+    analytics_backend = get_analytics_backend(_snapshot.df, version, backend_name())
+    bootstrap_runner = get_bootstrap_runner()
+    tasks = []
+    for regions, selected_pop in filter_states(_snapshot.df):
+        label = regions[0] if len(regions) == 1 else f"{selected_pop} metros"
+        tasks.append((label, functools.partial(warm_filter_state, _snapshot, regions, selected_pop, analytics_backend, bootstrap_runner)))
+    # Right after the default filter state, which every new session opens on
+    tasks.insert(1, ("default figures", functools.partial(warm_default_figures, _snapshot)))
+    return WarmUp(tasks).start()
 
 # Load the data
-df = load_data()
-if df is not None:
+metro_store = load_data()
+if metro_store is not None:
     data_loaded = True
 else:
     data_loaded = False
@@ -741,21 +328,8 @@ else:
     uploaded_file = st.file_uploader("Upload dataset.csv file", type=["csv"])
     if uploaded_file is not None:
         try:
-            df = pd.read_csv(uploaded_file)
-            
-            # Clean population column - remove spaces, commas and convert to numeric
-            df['Metropolitian Population'] = df['Metropolitian Population'].str.replace(',', '').str.strip()
-            df['Metropolitian Population'] = pd.to_numeric(df['Metropolitian Population'], errors='coerce')
-            
-            # Ensure GDP column is numeric
-            df['Official est. GDP(billion US$)'] = pd.to_numeric(df['Official est. GDP(billion US$)'], errors='coerce')
-            
-            # Calculate GDP per capita more efficiently
-            df['GDP_per_capita'] = df['Official est. GDP(billion US$)'] * 1000 / (df['Metropolitian Population'] / 1_000_000)
-            df['GDP_per_capita'] = df['GDP_per_capita'].round(2)
-            
-            # Add region information based on country
-            df['Region'] = df['Country/Region'].map(get_region)
+            df = clean_metros(pd.read_csv(uploaded_file))
+            metro_store = get_uploaded_store(df, dataset_version(df))
             
             data_loaded = True
             st.success("Dataset uploaded successfully!")
@@ -764,6 +338,21 @@ else:
             data_loaded = False
 
 if data_loaded:
+    figure_payloads = []
+    # METRO_AGGREGATE_RENDERER=plotly|vega; vega draws the aggregate views with Altair from server-side aggregates
+    aggregate_renderer = os.environ.get('METRO_AGGREGATE_RENDERER', 'plotly')
+    metro_snapshot = metro_store.snapshot
+    df = metro_snapshot.df
+    data_version = metro_snapshot.version
+    population_binner = get_population_binner(df, data_version)
+    # METRO_WARMUP=0 turns off precomputing the default and most common filter states
+    warmup = get_warmup(metro_snapshot, data_version) if warmup_enabled() else None
+    if warmup is not None and not warmup.ready:
+        st.progress(
+            warmup.progress,
+            text=f"Precomputing common views: {warmup.done} of {warmup.total} done" + (f" ({warmup.current})" if warmup.current else "")
+        )
+
     # Navigation bar (sticky)
     with st.container():
         st.markdown('<div class="navbar">', unsafe_allow_html=True)
@@ -799,7 +388,9 @@ if data_loaded:
     total_metros = len(df)
     total_population = df['Metropolitian Population'].sum()
     total_gdp = df['Official est. GDP(billion US$)'].sum()
-    avg_gdp_per_capita = df['GDP_per_capita'].mean()
+    # Population-weighted, so the average describes the typical resident rather than the typical metro
+    avg_gdp_per_capita = weighted_mean(df['GDP_per_capita'], df['Metropolitian Population'])
+    unweighted_gdp_per_capita = df['GDP_per_capita'].mean()
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -820,7 +411,11 @@ if data_loaded:
         
     with col4:
         st.markdown('<div class="metric-container">', unsafe_allow_html=True)
-        st.metric("Avg GDP per Capita", f"${avg_gdp_per_capita:,.0f}")
+        st.metric(
+            "Avg GDP per Capita",
+            f"${avg_gdp_per_capita:,.0f}",
+            help=f"Population-weighted across all metros. Unweighted mean of metros: ${unweighted_gdp_per_capita:,.0f}"
+        )
         st.markdown('</div>', unsafe_allow_html=True)
     
     style_metric_cards()
@@ -890,6 +485,33 @@ if data_loaded:
             """, unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
+    # Small updates are merged into the loaded data instead of replacing dataset.csv
+    with st.expander("🔄 Apply a Data Update"):
+        st.markdown(
+            "Upload a CSV of added or changed metros with any of the dataset.csv columns. Rows are matched "
+            "on `Index` (or the metro name when there is no Index column); unmatched rows are added as new metros."
+        )
+        delta_file = st.file_uploader("Update CSV", type=["csv"], key="delta_file")
+        if delta_file is not None and st.button("Apply update", key="delta_apply"):
+            try:
+                st.session_state['delta_report'] = metro_store.apply_delta(pd.read_csv(delta_file))
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error processing update file: {str(e)}")
+        delta_report = st.session_state.get('delta_report')
+        if delta_report and delta_report['version'] == data_version:
+            st.success(
+                f"Updated {delta_report['updated']} and added {delta_report['added']} metros "
+                f"({', '.join(delta_report['regions'])}). Results for other regions stay cached."
+            )
+        if metro_store.source:
+            st.caption(
+                f"Serving data version {metro_snapshot.generation} ({data_version}). Changes to dataset.csv "
+                "are picked up in the background and swapped in once they are fully processed."
+            )
+    if metro_store.last_error:
+        st.warning(f"The latest dataset.csv could not be loaded ({metro_store.last_error}); showing the previous version.")
+    
     # Add filter controls in a Power BI style panel
     st.markdown('<div class="filter-panel">', unsafe_allow_html=True)
     filter_cols = st.columns([1, 1, 1, 1])
@@ -905,7 +527,7 @@ if data_loaded:
     
     with filter_cols[2]:
         st.markdown('<p style="font-size: 0.85rem; font-family: \'Segoe UI\', sans-serif; font-weight: 600; margin-bottom: 0.3rem; color: #252525;">Population Size</p>', unsafe_allow_html=True)
-        pop_options = ["All", "Small (<1M)", "Medium (1-5M)", "Large (5-10M)", "Mega (>10M)"]
+        pop_options = ["All"] + list(BUCKETINGS['pop_filter'][1])
         selected_pop = st.selectbox("", pop_options, key="pop_filter", label_visibility="collapsed")
     
     with filter_cols[3]:
@@ -913,10 +535,73 @@ if data_loaded:
         sort_options = ["GDP per Capita (High to Low)", "Total GDP (High to Low)", "Population (High to Low)"]
         selected_sort = st.selectbox("", sort_options, key="sort_filter", label_visibility="collapsed")
     
+    # Metro search: accent-insensitive autocomplete over metro and country names
+    search_index = get_search_index(df, data_version)
+    search_cols = st.columns([1, 1])
+    
+    with search_cols[0]:
+        st.markdown('<p style="font-size: 0.85rem; font-family: \'Segoe UI\', sans-serif; font-weight: 600; margin-bottom: 0.3rem; color: #252525;">Find a Metro</p>', unsafe_allow_html=True)
+        search_query = st.text_input("", key="metro_search", placeholder="Metro or country, e.g. A Coruna", label_visibility="collapsed")
+    
+    with search_cols[1]:
+        st.markdown('<p style="font-size: 0.85rem; font-family: \'Segoe UI\', sans-serif; font-weight: 600; margin-bottom: 0.3rem; color: #252525;">Highlight in Charts</p>', unsafe_allow_html=True)
+        search_matches = search_index.search(search_query, limit=15)['Metropolitian Area/City'].tolist()
+        highlight_city = st.selectbox(
+            "",
+            search_matches,
+            key="metro_highlight",
+            label_visibility="collapsed",
+            disabled=not search_matches,
+            placeholder="No matches" if search_query else "Type to search"
+        )
+    
     st.markdown('</div>', unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
     
+    # Apply the filter panel to every section below it
+    filter_mask = df['Region'].isin(selected_regions) & df['Official est. GDP(billion US$)'].between(min_gdp, max_gdp)
+    if selected_pop != "All":
+        filter_mask &= population_binner.mask('pop_filter', [selected_pop])
+    filtered_df = df[filter_mask]
+    if filtered_df.empty:
+        st.warning("No metropolitan areas match the current filters. Widen the region, GDP or population selection.")
+        st.stop()
+    filter_key = (tuple(selected_regions), min_gdp, max_gdp, selected_pop)
+    rank_index = metro_snapshot.rank_index
+    # Per-filter results are keyed by the selected regions' rows, so a delta elsewhere keeps them
+    filter_version = metro_snapshot.filter_version(selected_regions)
+    sort_measure = SORT_MEASURES[selected_sort]
+    sort_label = selected_sort.replace(" (High to Low)", "")
+    if highlight_city:
+        highlight_row = filtered_df[filtered_df['Metropolitian Area/City'] == highlight_city]
+        if highlight_row.empty:
+            st.caption(f"{highlight_city} is hidden by the current filters.")
+        else:
+            highlight_row = highlight_row.iloc[0]
+            rank_text = []
+            for partition, scope in [(None, "globally"), ('Region', f"in {highlight_row['Region']}"), ('Size', f"among {rank_index.label_of(highlight_city, 'Size')} metros")]:
+                position, out_of = rank_index.rank(highlight_city, sort_measure, partition)
+                if position is not None:
+                    rank_text.append(f"#{position:,} of {out_of:,} {scope}")
+            st.caption(
+                f"Highlighting **{highlight_city}** ({highlight_row['Country/Region']}, {highlight_row['Region']}): "
+                f"GDP per capita ${highlight_row['GDP_per_capita']:,.0f}, population {highlight_row['Metropolitian Population']:,.0f}. "
+                f"{sort_label} rank: " + ", ".join(rank_text)
+            )
+    if filter_mask.all():
+        # The unfiltered cube is kept up to date by the store itself
+        rollup_cube = metro_snapshot.cube
+    else:
+        analytics_backend = get_analytics_backend(df, data_version, backend_name())
+        backend_filters = dict(
+            regions=selected_regions,
+            gdp_range=(min_gdp, max_gdp),
+            population_range=None if selected_pop == "All" else bin_range('pop_filter', selected_pop)
+        )
+        rollup_cube = get_rollup_cube(filtered_df, filter_version, filter_key, analytics_backend, backend_filters)
+    bootstrap_runner = get_bootstrap_runner()
+    
     # Add a section divider
     st.markdown('<div class="section-divider"></div><div id="global-map"></div>', unsafe_allow_html=True)
     
@@ -937,140 +622,36 @@ if data_loaded:
         
         with map_tabs[0]:
             # Create a copy of the dataframe and handle NaN values
-            map_df = df.copy()
+            map_df = filtered_df.copy()
             # Fill NaN values in GDP with a small value for visualization purposes
             map_df['Official est. GDP(billion US$)'] = map_df['Official est. GDP(billion US$)'].fillna(1)
             # Also handle NaN values in GDP per capita
             map_df['GDP_per_capita'] = map_df['GDP_per_capita'].fillna(0)
             
-            # Create the map visualization
-            fig = px.scatter_geo(
-                map_df,
-                locations="Country/Region",
-                locationmode="country names",
-                color="GDP_per_capita",
-                size="Official est. GDP(billion US$)",
-                hover_name="Metropolitian Area/City",
-                size_max=50,
-                color_continuous_scale="Viridis",
-                title="Metropolitan Areas by GDP and GDP per Capita",
-                hover_data={
-                    "Country/Region": True,
-                    "Official est. GDP(billion US$)": ":.1f",
-                    "Metropolitian Population": ":,.0f",
-                    "GDP_per_capita": ":$,.0f"
-                }
-            )
-            fig.update_layout(
-                height=600, 
-                margin=dict(l=0, r=0, t=30, b=0),
-                geo=dict(
-                    showland=True,
-                    landcolor="rgb(217, 217, 217)",
-                    coastlinecolor="white",
-                    countrycolor="rgb(200, 200, 200)",
-                    showocean=True,
-                    oceancolor="rgb(237, 250, 255)"
+            map_clusters = get_map_clusters(df, data_version)
+            if map_clusters is not None:
+                # Only the clusters in the current viewport are drawn, at most one per visible quadtree cell
+                map_view = st.session_state.get('world_map_view')
+                map_zoom, map_bounds = view_query(map_view)
+                clusters = map_clusters.query(map_zoom, map_bounds, mask=None if filter_mask.all() else filter_mask.to_numpy())
+                view_key = tuple(sorted(map_view.items())) if map_view else None
+                plotly_chart('world-map', lambda: world_map(clusters, map_view), view_key, highlight=True, key='world_map_view', viewport=True)
+                st.caption(
+                    f"{len(clusters):,} clusters covering {clusters['count'].sum():,} metros at zoom {map_zoom}. "
+                    "Zoom in to split clusters."
                 )
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            else:
+                # Metros placed at their country's centroid would never split into separate clusters
+                plotly_chart('world-map', lambda: metro_map(map_df), highlight=True)
+                st.caption("Metros are placed at their country's location; add Latitude/Longitude columns to place and cluster them individually.")
             
         with map_tabs[1]:
             # 3D Globe visualization
-            fig = px.scatter_geo(
-                map_df,
-                locations="Country/Region",
-                locationmode="country names",
-                color="GDP_per_capita",
-                size="Official est. GDP(billion US$)",
-                hover_name="Metropolitian Area/City",
-                size_max=50,
-                color_continuous_scale="Plasma",
-                title="3D Globe View of Metropolitan Economies",
-                hover_data={
-                    "Country/Region": True,
-                    "Official est. GDP(billion US$)": ":.1f",
-                    "Metropolitian Population": ":,.0f",
-                    "GDP_per_capita": ":$,.0f"
-                },
-                projection="orthographic"
-            )
-            fig.update_layout(
-                height=600,
-                margin=dict(l=0, r=0, t=30, b=0),
-                geo=dict(
-                    showland=True,
-                    landcolor="rgb(217, 217, 217)",
-                    countrycolor="rgb(200, 200, 200)",
-                    showcountries=True,
-                    showocean=True,
-                    oceancolor="rgb(220, 240, 255)"
-                )
-            )
-            # Add animation for rotation
-            frames = []
-            for i in range(0, 361, 10):
-                frames.append(go.Frame(
-                    layout=dict(
-                        geo=dict(
-                            projection_rotation_lon=i
-                        )
-                    )
-                ))
-            fig.frames = frames
-            
-            # Add animation buttons
-            animation_buttons = [
-                dict(
-                    args=[None, {"frame": {"duration": 50, "redraw": True}, "fromcurrent": True}],
-                    label="Play",
-                    method="animate"
-                ),
-                dict(
-                    args=[[None], {"frame": {"duration": 0, "redraw": True}, "mode": "immediate"}],
-                    label="Pause",
-                    method="animate"
-                )
-            ]
-            fig.update_layout(
-                updatemenus=[dict(
-                    type="buttons",
-                    showactive=False,
-                    buttons=animation_buttons,
-                    x=0.1,
-                    y=0,
-                    xanchor="right",
-                    yanchor="top"
-                )]
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('globe', lambda: globe_view(map_df), highlight=True)
             
         with map_tabs[2]:
             # Create a bubble chart of population vs GDP with regions
-            fig = px.scatter(
-                map_df,
-                x="Metropolitian Population",
-                y="Official est. GDP(billion US$)",
-                size="GDP_per_capita",
-                color="Region",
-                hover_name="Metropolitian Area/City",
-                log_x=True,
-                log_y=True,
-                size_max=60,
-                color_discrete_sequence=px.colors.qualitative.Bold,
-                title="Metropolitan Population vs GDP (bubble size = GDP per capita)",
-                hover_data={
-                    "Country/Region": True,
-                    "GDP_per_capita": ":$,.0f"
-                }
-            )
-            fig.update_layout(
-                height=600,
-                xaxis_title="Metropolitan Population (log scale)",
-                yaxis_title="GDP in billions USD (log scale)"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('bubble-chart', lambda: bubble_chart(map_df), highlight=True)
     
     with col2:
         st.markdown("""
@@ -1101,12 +682,17 @@ if data_loaded:
     st.markdown('<div class="fadeIn">', unsafe_allow_html=True)
     colored_header(
         label="Top Economic Performers",
-        description="Metropolitan areas with the highest GDP per capita",
+        description=f"Metropolitan areas ranked by {sort_label}",
         color_name="blue-green-70"
     )
     
-    # Get top 15 metros by GDP per capita, handling NaN values
-    top_gdp_per_capita = df.dropna(subset=['GDP_per_capita']).nlargest(15, 'GDP_per_capita')
+    # Top 15 metros for the Sort By option, read off the presorted permutation under the filter mask
+    top_metros_df = df.iloc[rank_index.top(sort_measure, 15, mask=filter_mask.to_numpy())]
+    top_text_template = {
+        'GDP_per_capita': '$%{text:,.0f}',
+        'Official est. GDP(billion US$)': '$%{text:,.1f}B',
+        'Metropolitian Population': '%{text:,.0f}'
+    }[sort_measure]
     
     col1, col2 = st.columns([1, 3])
     
@@ -1140,76 +726,11 @@ if data_loaded:
         
         with top_tabs[0]:
             # Enhanced bar chart
-            fig = px.bar(
-                top_gdp_per_capita,
-                x='GDP_per_capita',
-                y='Metropolitian Area/City',
-                color='Region',
-                orientation='h',
-                color_discrete_sequence=px.colors.qualitative.Bold,
-                title="Top 15 Metropolitan Areas by GDP per Capita",
-                hover_data={
-                    "Country/Region": True,
-                    "Official est. GDP(billion US$)": ":.1f",
-                    "Metropolitian Population": ":,.0f",
-                    "GDP_per_capita": ":$,.0f"
-                },
-                text='GDP_per_capita'
-            )
-            fig.update_layout(
-                height=600, 
-                yaxis={'categoryorder':'total ascending'},
-                xaxis_title="GDP per Capita (USD)",
-                yaxis_title="",
-                bargap=0.2
-            )
-            fig.update_traces(
-                texttemplate='$%{text:,.0f}', 
-                textposition='outside'
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('top-metros', lambda: top_bar_chart(top_metros_df, sort_measure, sort_label, top_text_template), sort_measure, highlight=True)
             
         with top_tabs[1]:
             # Radar chart comparing top 5 cities
-            top_5 = top_gdp_per_capita.head(5)
-            
-            # Normalize metrics for radar chart
-            metrics = ['GDP_per_capita', 'Official est. GDP(billion US$)', 'Metropolitian Population']
-            
-            # Create a copy to avoid modifying the original
-            radar_df = top_5.copy()
-            
-            # Normalize each metric to a 0-100 scale for radar chart
-            for metric in metrics:
-                max_val = radar_df[metric].max()
-                radar_df[f'{metric}_normalized'] = (radar_df[metric] / max_val) * 100
-            
-            # Create radar chart using plotly
-            fig = go.Figure()
-            
-            for i, row in radar_df.iterrows():
-                fig.add_trace(go.Scatterpolar(
-                    r=[
-                        row['GDP_per_capita_normalized'],
-                        row['Official est. GDP(billion US$)_normalized'],
-                        row['Metropolitian Population_normalized']
-                    ],
-                    theta=['GDP per Capita', 'Total GDP', 'Population'],
-                    fill='toself',
-                    name=row['Metropolitian Area/City']
-                ))
-            
-            fig.update_layout(
-                polar=dict(
-                    radialaxis=dict(
-                        visible=True,
-                        range=[0, 100]
-                    )
-                ),
-                height=600,
-                title="Top 5 Metropolitan Areas - Key Metrics Comparison"
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('top-metros-radar', lambda: top_radar_chart(top_metros_df), sort_measure)
             
             st.markdown("""
             <div style="font-size: 0.85rem; color: #666; margin-top: -20px;">
@@ -1218,22 +739,12 @@ if data_loaded:
             """, unsafe_allow_html=True)
             
         with top_tabs[2]:
-            # Treemap of top performers by region
-            fig = px.treemap(
-                top_gdp_per_capita,
-                path=[px.Constant("All Regions"), 'Region', 'Metropolitian Area/City'],
-                values='GDP_per_capita',
-                color='GDP_per_capita',
-                color_continuous_scale='Viridis',
-                title="Top Performers Grouped by Region",
-                hover_data={
-                    "Country/Region": True,
-                    "GDP_per_capita": ":$,.0f"
-                }
+            # Treemap of top performers by region, with the hierarchy taken from the rollup cube
+            plotly_chart(
+                'top-metros-treemap',
+                lambda: top_treemap(rollup_cube.hierarchy(top_metros_df, sort_measure), sort_label, top_text_template),
+                sort_measure
             )
-            fig.update_layout(height=600)
-            fig.update_traces(textinfo="label+value")
-            st.plotly_chart(fig, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -1252,201 +763,83 @@ if data_loaded:
     
     with col1:
         # Create scatter plot of population vs GDP per capita, handling NaN values
-        scatter_df = df.dropna(subset=['Metropolitian Population', 'GDP_per_capita', 'Official est. GDP(billion US$)'])
+        scatter_df = filtered_df.dropna(subset=['Metropolitian Population', 'GDP_per_capita', 'Official est. GDP(billion US$)'])
+        
+        # Both size bucketings come from the same sorted pass over population
+        size_stats = population_binner.grouped_stats(
+            scatter_df[['GDP_per_capita', 'Official est. GDP(billion US$)']],
+            ['size_category', 'size_trend']
+        )
         
         # Create tabs for different visualizations
-        scatter_tabs = st.tabs(["Interactive Scatter", "Size Distribution", "Regression Analysis"])
+        scatter_tabs = st.tabs(["Interactive Scatter", "Size Distribution", "Regression Analysis", "Scaling by Region"])
         
         with scatter_tabs[0]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            fig = px.scatter(
-                scatter_df,
-                x='Metropolitian Population',
-                y='GDP_per_capita',
-                color='Region',
-                size='Official est. GDP(billion US$)',
-                hover_name='Metropolitian Area/City',
-                log_x=True,
-                log_y=True,
-                size_max=60,
-                opacity=0.7,
-                color_discrete_sequence=px.colors.qualitative.Bold,
-                title="Population vs. GDP per Capita (log scales)",
-                hover_data={
-                    "Country/Region": True,
-                    "Official est. GDP(billion US$)": ":.1f",
-                    "Metropolitian Population": ":,.0f",
-                    "GDP_per_capita": ":$,.0f"
-                }
-            )
-            
-            # Add trendline
-            trendline = px.scatter(
-                scatter_df,
-                x='Metropolitian Population',
-                y='GDP_per_capita',
-                log_x=True,
-                log_y=True,
-                trendline="ols",
-                trendline_scope="overall",
-                trendline_color_override="red"
-            )
-            
-            # Add trendline trace to main figure
-            for trace in trendline.data:
-                if trace.mode == 'lines':
-                    trace.name = "Regression Trend"
-                    trace.line.width = 3
-                    fig.add_trace(trace)
-            
-            # Add annotation for optimal city size range
-            fig.add_shape(
-                type="rect",
-                x0=1_000_000, 
-                y0=fig.data[0].y.min(), 
-                x1=5_000_000, 
-                y1=fig.data[0].y.max(),
-                line=dict(color="rgba(0,200,0,0.3)", width=2),
-                fillcolor="rgba(0,200,0,0.1)",
-                layer="below"
-            )
-            
-            fig.add_annotation(
-                x=2_500_000,
-                y=fig.data[0].y.max() * 0.8,
-                text="Optimal City Size Range",
-                showarrow=True,
-                arrowhead=1,
-                arrowcolor="green",
-                font=dict(color="green")
-            )
-            
-            fig.update_layout(
-                height=600,
-                xaxis_title="Metropolitan Population (log scale)",
-                yaxis_title="GDP per Capita USD (log scale)",
-                legend_title="Region"
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('size-scatter', lambda: size_scatter(scatter_df), highlight=True)
             st.markdown('</div>', unsafe_allow_html=True)
         
         with scatter_tabs[1]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
             # Create population size categories
-            scatter_df['Population Size Category'] = pd.cut(
-                scatter_df['Metropolitian Population'], 
-                bins=[0, 1_000_000, 5_000_000, 10_000_000, 50_000_000],
-                labels=['Small (<1M)', 'Medium (1-5M)', 'Large (5-10M)', 'Mega (>10M)']
-            )
-            
-            # Box plot of GDP per capita by population size category
-            fig = px.box(
-                scatter_df,
-                x='Population Size Category',
-                y='GDP_per_capita',
-                color='Population Size Category',
-                title="GDP per Capita Distribution by Metropolitan Size",
-                points="all",
-                hover_name='Metropolitian Area/City',
-                hover_data={
-                    "Country/Region": True,
-                    "Official est. GDP(billion US$)": ":.1f",
-                    "Metropolitian Population": ":,.0f",
-                    "GDP_per_capita": ":$,.0f"
-                }
-            )
+            scatter_df['Population Size Category'] = population_binner.categorize('size_category').reindex(scatter_df.index).cat.remove_unused_categories()
             
-            fig.update_layout(
-                height=600,
-                xaxis_title="Metropolitan Size Category",
-                yaxis_title="GDP per Capita (USD)",
-                showlegend=False
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            if aggregate_renderer == 'vega':
+                # Histogram of GDP per capita stacked by size category; only the bin counts are sent
+                vega_chart(size_histogram_view(scatter_df))
+            else:
+                # Box plot of GDP per capita by population size category
+                plotly_chart(
+                    'size-distribution',
+                    lambda: size_distribution(scatter_df, size_stats['size_category'][('GDP_per_capita', 'count')]),
+                    highlight=True
+                )
             st.markdown('</div>', unsafe_allow_html=True)
         
         with scatter_tabs[2]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            # Calculate city size vs efficiency metrics
-            size_efficiency = pd.DataFrame()
-            
-            # Create population bins and calculate average GDP per capita
-            pop_bins = [0, 500000, 1000000, 2000000, 5000000, 10000000, 50000000]
-            pop_labels = ['<500K', '500K-1M', '1M-2M', '2M-5M', '5M-10M', '>10M']
-            
-            scatter_df['Pop_Bin'] = pd.cut(scatter_df['Metropolitian Population'], bins=pop_bins, labels=pop_labels)
-            size_efficiency = scatter_df.groupby('Pop_Bin').agg({
-                'GDP_per_capita': ['mean', 'median', 'std', 'count'],
-                'Official est. GDP(billion US$)': 'mean'
-            }).reset_index()
-            
-            # Flatten multi-level columns
-            size_efficiency.columns = ['Population_Size', 'Mean_GDP_Per_Capita', 'Median_GDP_Per_Capita', 
-                                     'Std_GDP_Per_Capita', 'Count', 'Mean_GDP_Billion']
-            
-            # Create multi-line chart
-            fig = go.Figure()
-            
-            fig.add_trace(go.Scatter(
-                x=size_efficiency['Population_Size'],
-                y=size_efficiency['Mean_GDP_Per_Capita'],
-                mode='lines+markers',
-                name='Mean GDP per Capita',
-                line=dict(color='#0078D4', width=3),
-                marker=dict(size=10)
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=size_efficiency['Population_Size'],
-                y=size_efficiency['Median_GDP_Per_Capita'],
-                mode='lines+markers',
-                name='Median GDP per Capita',
-                line=dict(color='#107C10', width=3, dash='dash'),
-                marker=dict(size=10)
-            ))
-            
-            # Add error bars using standard deviation
-            fig.add_trace(go.Scatter(
-                x=size_efficiency['Population_Size'],
-                y=size_efficiency['Mean_GDP_Per_Capita'] + size_efficiency['Std_GDP_Per_Capita'],
-                mode='lines',
-                line=dict(width=0),
-                showlegend=False
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=size_efficiency['Population_Size'],
-                y=size_efficiency['Mean_GDP_Per_Capita'] - size_efficiency['Std_GDP_Per_Capita'],
-                mode='lines',
-                line=dict(width=0),
-                fill='tonexty',
-                fillcolor='rgba(0, 120, 212, 0.2)',
-                name='Std Deviation'
-            ))
-            
-            # Add sample size as text
-            for i, row in size_efficiency.iterrows():
-                fig.add_annotation(
-                    x=row['Population_Size'],
-                    y=row['Mean_GDP_Per_Capita'] + row['Std_GDP_Per_Capita'] + 5000,
-                    text=f"n={row['Count']}",
-                    showarrow=False,
-                    font=dict(size=10)
-                )
-            
-            fig.update_layout(
-                title="City Size vs. Economic Efficiency Analysis",
-                xaxis_title="Metropolitan Population Size",
-                yaxis_title="GDP per Capita (USD)",
-                height=600,
-                hovermode="x unified",
-                plot_bgcolor='rgba(246,248,250,0.8)',
-                paper_bgcolor='rgba(246,248,250,0)'
+            # Calculate city size vs efficiency metrics from the shared population bins
+            trend_stats = size_stats['size_trend']
+            trend_sketches = population_binner.bin_sketches(scatter_df['GDP_per_capita'], 'size_trend')
+            trend_ci = bootstrap_runner.result(
+                (filter_version, filter_key, 'size_trend'),
+                scatter_df['GDP_per_capita'],
+                population_binner.categorize('size_trend').reindex(scatter_df.index)
             )
+            trend_weighted = grouped_weighted_stats(
+                scatter_df['GDP_per_capita'],
+                scatter_df['Metropolitian Population'],
+                population_binner.categorize('size_trend').reindex(scatter_df.index)
+            ).reindex(trend_stats.index)
+            size_efficiency = pd.DataFrame({
+                'Population_Size': trend_stats.index,
+                'Mean_GDP_Per_Capita': trend_stats[('GDP_per_capita', 'mean')].to_numpy(),
+                'Median_GDP_Per_Capita': [trend_sketches[label].median() for label in trend_stats.index],
+                'Std_GDP_Per_Capita': trend_stats[('GDP_per_capita', 'std')].to_numpy(),
+                'Count': trend_stats[('GDP_per_capita', 'count')].to_numpy(),
+                'Mean_GDP_Billion': trend_stats[('Official est. GDP(billion US$)', 'mean')].to_numpy(),
+                'Weighted_Mean_GDP_Per_Capita': trend_weighted['mean'].to_numpy()
+            })
+            
+            if aggregate_renderer == 'vega':
+                # The same view declared over the metro rows; vega.py aggregates them before sending
+                trend_rows = pd.DataFrame({
+                    'Population_Size': population_binner.categorize('size_trend').reindex(scatter_df.index),
+                    'GDP_per_capita': scatter_df['GDP_per_capita'],
+                    'Population': scatter_df['Metropolitian Population']
+                })
+                vega_chart(size_efficiency_view(trend_rows, list(BUCKETINGS['size_trend'][1]), trend_ci))
+            else:
+                # Create multi-line chart
+                plotly_chart('size-efficiency', lambda: size_efficiency_chart(size_efficiency, trend_ci), trend_ci is not None)
             
-            st.plotly_chart(fig, use_container_width=True)
+            trend_ci_error = bootstrap_runner.error((filter_version, filter_key, 'size_trend'))
+            if trend_ci_error is not None:
+                st.warning(f"The bootstrap confidence intervals could not be computed: {trend_ci_error}")
+                st.button("Retry", key="retry_trend_ci", on_click=bootstrap_runner.discard, args=((filter_version, filter_key, 'size_trend'),))
+            elif trend_ci is None:
+                st.caption("95% bootstrap confidence intervals for the mean are being computed in the background.")
+                st.button("Show confidence intervals", key="refresh_trend_ci")
             
             # Display regression results in an expander
             with st.expander("View Statistical Analysis"):
@@ -1471,6 +864,37 @@ if data_loaded:
                 Interpretation: A 1% increase in population is associated with a {model.params[1]:.4f}% change in GDP per capita.
                 """)
             st.markdown('</div>', unsafe_allow_html=True)
+        
+        with scatter_tabs[3]:
+            st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+            scaling_cols = st.columns(2)
+            with scaling_cols[0]:
+                scaling_level = st.radio("Group by", ["Region", "Country"], horizontal=True, key="scaling_level")
+            with scaling_cols[1]:
+                min_metros = st.slider("Minimum metros per group", 3, 30, 5, key="scaling_min_metros")
+            
+            scaling_column = 'Country/Region' if scaling_level == "Country" else 'Region'
+            scaling_fits = get_scaling_fits(scatter_df, filter_version, filter_key, scaling_column)
+            scaling_fits = scaling_fits[scaling_fits['n'] >= min_metros].dropna(subset=['slope']).sort_values('slope')
+            
+            if scaling_fits.empty:
+                st.info("No group has enough metropolitan areas for a regression with the current filters.")
+            else:
+                # Forest plot of scaling exponents with their confidence intervals
+                plotly_chart('scaling-by-region', lambda: scaling_chart(scaling_fits), scaling_level, min_metros)
+                
+                st.markdown("""
+                <div style="font-size: 0.85rem; color: #666; margin-top: -20px;">
+                <p><i>An exponent above 0 means larger metros are more productive per resident (GDP scales superlinearly with population, with GDP exponent = 1 + exponent). Groups whose interval crosses the dashed line show no significant size effect.</i></p>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                with st.expander("View Scaling Table"):
+                    st.dataframe(
+                        scaling_fits[['n', 'slope', 'ci_low', 'ci_high', 'se_slope', 'intercept', 'r_squared', 'p_value']].round(4),
+                        use_container_width=True
+                    )
+            st.markdown('</div>', unsafe_allow_html=True)
     
     with col2:
         st.markdown("""
@@ -1509,25 +933,13 @@ if data_loaded:
         color_name="blue-green-70"
     )
     
-    # Ensure data is clean for regional aggregations
-    clean_df = df.dropna(subset=['GDP_per_capita', 'Metropolitian Population', 'Official est. GDP(billion US$)', 'Region'])
-    
-    # Calculating regional aggregates
-    regional_summary = clean_df.groupby('Region').agg({
-        'Metropolitian Area/City': 'count',
-        'GDP_per_capita': ['mean', 'median', 'std'],
-        'Metropolitian Population': 'sum',
-        'Official est. GDP(billion US$)': 'sum'
-    }).reset_index()
+    # Regional aggregates are read from the rollup cube, including the population-weighted
+    # GDP per capita (Total GDP / Total Population)
+    regional_summary = rollup_cube.summary('region')
     
-    # Flatten the multi-index columns
-    regional_summary.columns = [
-        'Region', 'Metro_Count', 'Mean_GDP_per_capita', 'Median_GDP_per_capita', 
-        'Std_GDP_per_capita', 'Total_Population', 'Total_GDP'
-    ]
-    
-    # Calculate GDP productivity ratio (Total GDP / Total Population in millions)
-    regional_summary['Regional_Productivity'] = regional_summary['Total_GDP'] / (regional_summary['Total_Population'] / 1000000)
+    # Bootstrap CIs of each regional mean, computed in the background per filter state
+    region_rows = filtered_df.dropna(subset=['GDP_per_capita', 'Metropolitian Population', 'Official est. GDP(billion US$)'])
+    region_ci = bootstrap_runner.result((filter_version, filter_key, 'region'), region_rows['GDP_per_capita'], region_rows['Region'])
     
     col1, col2 = st.columns([1, 3])
     
@@ -1553,199 +965,61 @@ if data_loaded:
         """, unsafe_allow_html=True)
     
     with col2:
-        region_tabs = st.tabs(["Regional Comparison", "GDP Composition", "Performance Matrix"])
+        region_tabs = st.tabs(["Regional Comparison", "GDP Composition", "Performance Matrix", "Country Drill-down"])
         
         with region_tabs[0]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            # Create a comprehensive regional comparison chart
-            fig = go.Figure()
-            
-            # Add bar chart for Mean GDP per capita
-            fig.add_trace(go.Bar(
-                x=regional_summary['Region'],
-                y=regional_summary['Mean_GDP_per_capita'],
-                name='Mean GDP per Capita',
-                marker_color='#0078D4',
-                hovertemplate='<b>%{x}</b><br>Mean GDP per Capita: $%{y:,.0f}<br>Metro Count: %{customdata[0]}<extra></extra>',
-                customdata=np.column_stack((regional_summary['Metro_Count'], regional_summary['Median_GDP_per_capita']))
-            ))
-            
-            # Add line for Regional Productivity (economic efficiency)
-            fig.add_trace(go.Scatter(
-                x=regional_summary['Region'],
-                y=regional_summary['Regional_Productivity'],
-                mode='lines+markers',
-                name='Regional Productivity',
-                yaxis='y2',
-                line=dict(color='#107C10', width=3),
-                marker=dict(size=10, symbol='diamond'),
-                hovertemplate='<b>%{x}</b><br>Regional Productivity: $%{y:,.0f}<br>Total GDP: $%{customdata[0]:,.0f} billion<extra></extra>',
-                customdata=np.column_stack((regional_summary['Total_GDP'], regional_summary['Total_Population']))
-            ))
-            
-            # Update layout with dual y-axes
-            fig.update_layout(
-                title='Regional Economic Performance',
-                xaxis=dict(title='Region', tickangle=45),
-                yaxis=dict(
-                    title='Mean GDP per Capita (USD)',
-                    side='left',
-                    showgrid=True
-                ),
-                yaxis2=dict(
-                    title='Regional Productivity (GDP/Population in millions)',
-                    side='right',
-                    overlaying='y',
-                    showgrid=False
-                ),
-                height=600,
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1.02,
-                    xanchor="center",
-                    x=0.5
-                ),
-                hovermode='closest',
-                plot_bgcolor='rgba(246,248,250,0.8)',
-                paper_bgcolor='rgba(246,248,250,0)'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            if aggregate_renderer == 'vega':
+                # The same view declared over the metro rows; vega.py aggregates them before sending
+                vega_chart(regional_performance_view(region_rows, regional_summary['Region'].tolist(), region_ci))
+            else:
+                # Create a comprehensive regional comparison chart
+                plotly_chart('regional-comparison', lambda: regional_comparison(regional_summary, region_ci), region_ci is not None)
+            region_ci_error = bootstrap_runner.error((filter_version, filter_key, 'region'))
+            if region_ci_error is not None:
+                st.warning(f"The bootstrap confidence intervals could not be computed: {region_ci_error}")
+                st.button("Retry", key="retry_region_ci", on_click=bootstrap_runner.discard, args=((filter_version, filter_key, 'region'),))
+            elif region_ci is None:
+                st.caption("95% bootstrap confidence intervals for the regional means are being computed in the background.")
+                st.button("Show confidence intervals", key="refresh_region_ci")
             st.markdown('</div>', unsafe_allow_html=True)
         
         with region_tabs[1]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            # Create data for the sunburst chart
-            region_metro_data = []
-            
-            for region in clean_df['Region'].unique():
-                region_df = clean_df[clean_df['Region'] == region]
-                # Get top 5 metros by GDP in each region
-                top_metros = region_df.nlargest(5, 'Official est. GDP(billion US$)')
-                
-                # Add top metros individually
-                for _, metro in top_metros.iterrows():
-                    region_metro_data.append({
-                        'Region': region,
-                        'Metro': metro['Metropolitian Area/City'],
-                        'GDP': metro['Official est. GDP(billion US$)'],
-                        'Population': metro['Metropolitian Population'],
-                        'GDP_per_capita': metro['GDP_per_capita']
-                    })
-                
-                # Add "Other" category for remaining metros
-                other_metros = region_df.drop(top_metros.index)
-                if len(other_metros) > 0:
-                    region_metro_data.append({
-                        'Region': region,
-                        'Metro': f'Other {region} Metros',
-                        'GDP': other_metros['Official est. GDP(billion US$)'].sum(),
-                        'Population': other_metros['Metropolitian Population'].sum(),
-                        'GDP_per_capita': other_metros['Official est. GDP(billion US$)'].sum() * 1e9 / other_metros['Metropolitian Population'].sum()
-                    })
-            
-            # Convert to DataFrame
-            sunburst_df = pd.DataFrame(region_metro_data)
-            
-            # Create sunburst chart
-            fig = px.sunburst(
-                sunburst_df,
-                path=['Region', 'Metro'],
-                values='GDP',
-                color='GDP_per_capita',
-                color_continuous_scale='Blues',
-                title='Regional GDP Composition by Metropolitan Areas',
-                hover_data=['Population', 'GDP_per_capita'],
-                custom_data=['Population', 'GDP_per_capita']
-            )
-            
-            fig.update_traces(
-                hovertemplate='<b>%{label}</b><br>GDP: $%{value:.1f} billion<br>Population: %{customdata[0]:,.0f}<br>GDP per Capita: $%{customdata[1]:,.0f}<extra></extra>'
-            )
-            
-            fig.update_layout(
-                height=600,
-                margin=dict(t=50, l=0, r=0, b=0),
-                paper_bgcolor='rgba(246,248,250,0)'
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            # Top 5 metros by GDP in each region plus an "Other" remainder, from the rollup cube
+            plotly_chart('regional-composition', lambda: regional_composition(rollup_cube.sunburst(top_n=5)))
             st.markdown('</div>', unsafe_allow_html=True)
             
         with region_tabs[2]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
             # Create a quadrant chart comparing metrics across regions
             
-            # Calculate normalized metrics
-            regional_summary['Normalized_GDP_per_capita'] = (regional_summary['Mean_GDP_per_capita'] - regional_summary['Mean_GDP_per_capita'].min()) / (regional_summary['Mean_GDP_per_capita'].max() - regional_summary['Mean_GDP_per_capita'].min())
-            regional_summary['Normalized_Total_GDP'] = (regional_summary['Total_GDP'] - regional_summary['Total_GDP'].min()) / (regional_summary['Total_GDP'].max() - regional_summary['Total_GDP'].min())
-            regional_summary['Size'] = regional_summary['Metro_Count'] * 20 + 20  # Scale the size for visualization
-            
-            # Create the quadrant chart
-            fig = go.Figure()
-            
-            fig.add_trace(go.Scatter(
-                x=regional_summary['Normalized_Total_GDP'],
-                y=regional_summary['Normalized_GDP_per_capita'],
-                mode='markers+text',
-                marker=dict(
-                    size=regional_summary['Size'],
-                    color=regional_summary['Normalized_GDP_per_capita'],
-                    colorscale='Blues',
-                    line=dict(width=2, color='#0078D4'),
-                    showscale=True,
-                    colorbar=dict(title='Normalized GDP per Capita')
-                ),
-                text=regional_summary['Region'],
-                textposition='top center',
-                hovertemplate='<b>%{text}</b><br>GDP per Capita: $%{customdata[0]:,.0f}<br>Total GDP: $%{customdata[1]:,.0f} billion<br>Metros: %{customdata[2]}<extra></extra>',
-                customdata=np.column_stack((
-                    regional_summary['Mean_GDP_per_capita'],
-                    regional_summary['Total_GDP'],
-                    regional_summary['Metro_Count']
-                ))
-            ))
-            
-            # Add quadrant lines
-            fig.add_shape(
-                type='line',
-                x0=0.5, y0=0, x1=0.5, y1=1,
-                line=dict(color='#605E5C', width=1, dash='dash')
-            )
-            
-            fig.add_shape(
-                type='line',
-                x0=0, y0=0.5, x1=1, y1=0.5,
-                line=dict(color='#605E5C', width=1, dash='dash')
-            )
+            plotly_chart('regional-matrix', lambda: regional_matrix(regional_summary))
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        with region_tabs[3]:
+            st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+            # Drill from a region into its countries and then into a country's metros
+            drill_cols = st.columns(2)
+            with drill_cols[0]:
+                drill_region = st.selectbox("Region", regional_summary['Region'], key="drill_region")
+            country_summary = rollup_cube.summary('country', region=drill_region)
+            with drill_cols[1]:
+                drill_country = st.selectbox(
+                    "Country",
+                    country_summary.sort_values('Total_GDP', ascending=False)['Country/Region'],
+                    key="drill_country"
+                )
             
-            # Add quadrant labels
-            fig.add_annotation(x=0.25, y=0.75, text="High Efficiency<br>Low Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
-            fig.add_annotation(x=0.75, y=0.75, text="High Efficiency<br>High Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
-            fig.add_annotation(x=0.25, y=0.25, text="Low Efficiency<br>Low Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
-            fig.add_annotation(x=0.75, y=0.25, text="Low Efficiency<br>High Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
+            plotly_chart('region-countries', lambda: region_countries_chart(country_summary, drill_region), drill_region)
             
-            fig.update_layout(
-                title='Regional Economic Performance Matrix',
-                xaxis=dict(
-                    title='Normalized Total GDP (Economic Scale)',
-                    showgrid=True,
-                    zeroline=True,
-                    range=[-0.05, 1.05]
-                ),
-                yaxis=dict(
-                    title='Normalized GDP per Capita (Economic Efficiency)',
-                    showgrid=True,
-                    zeroline=True,
-                    range=[-0.05, 1.05]
-                ),
-                height=600,
-                plot_bgcolor='rgba(246,248,250,0.8)',
-                paper_bgcolor='rgba(246,248,250,0)'
+            plotly_chart(
+                'country-metros',
+                lambda: country_metros_chart(rollup_cube.metros(region=drill_region, country=drill_country), drill_country),
+                drill_region,
+                drill_country,
+                highlight=True
             )
-            
-            st.plotly_chart(fig, use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -1759,7 +1033,10 @@ if data_loaded:
     
     # Detect Outliers
     # Drop NaN values to ensure accurate outlier detection
-    clean_df = df.dropna(subset=['GDP_per_capita', 'Metropolitian Population', 'Official est. GDP(billion US$)'])
+    clean_df = filtered_df.dropna(subset=['GDP_per_capita', 'Metropolitian Population', 'Official est. GDP(billion US$)'])
+    
+    # Percentile thresholds for the outlier zones come from the mergeable quantile sketch
+    gdp_per_capita_q25, gdp_per_capita_q75 = rollup_cube.overall_sketch().quantile([0.25, 0.75])
     
     # Calculate Z-scores
     z_scores = stats.zscore(clean_df[['GDP_per_capita']])
@@ -1773,327 +1050,75 @@ if data_loaded:
     outlier_col1, outlier_col2 = st.columns([3, 2])
     
     with outlier_col1:
-        outlier_tabs = st.tabs(["Outlier Distribution", "Z-Score Analysis", "Performance Quadrants"])
+        outlier_tabs = st.tabs(["Outlier Distribution", "Z-Score Analysis", "Performance Quadrants", "Peer Comparison"])
         
         with outlier_tabs[0]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
             # Create a scatter plot with z-scores
-            fig = px.scatter(
-                clean_df, 
-                x='Metropolitian Population', 
-                y='GDP_per_capita',
-                size='Official est. GDP(billion US$)',
-                color='z_score',
-                color_continuous_scale='RdBu_r',
-                range_color=[-3, 3],
-                hover_name='Metropolitian Area/City',
-                hover_data={
-                    'Metropolitian Population': ':,',
-                    'GDP_per_capita': ':,',
-                    'Official est. GDP(billion US$)': ':.1f',
-                    'z_score': ':.2f',
-                    'Region': True
-                },
-                labels={
-                    'Metropolitian Population': 'Metropolitan Population',
-                    'GDP_per_capita': 'GDP per Capita (US$)',
-                    'Official est. GDP(billion US$)': 'GDP (billion US$)',
-                    'z_score': 'Z-Score'
-                }
-            )
-            
-            # Update layout
-            fig.update_layout(
-                title='Economic Outliers by Z-Score',
-                height=500,
-                plot_bgcolor='rgba(240, 242, 246, 0.8)',
-                paper_bgcolor='rgba(240, 242, 246, 0.0)',
-                font=dict(family="Segoe UI, sans-serif", color="#252525"),
-                margin=dict(l=20, r=20, t=50, b=20),
-                coloraxis_colorbar=dict(
-                    title="Z-Score",
-                    tickvals=[-3, -2, 0, 2, 3],
-                    ticktext=["Strong Underperformer", "Underperformer", "Average", "Overperformer", "Strong Overperformer"]
-                ),
-                xaxis=dict(
-                    type='log',
-                    title_font=dict(size=14, color="#252525"),
-                    tickfont=dict(size=12, color="#252525"),
-                    gridcolor='rgba(220, 220, 220, 0.8)',
-                    zerolinecolor='rgba(220, 220, 220, 0.8)'
-                ),
-                yaxis=dict(
-                    type='log',
-                    title_font=dict(size=14, color="#252525"),
-                    tickfont=dict(size=12, color="#252525"),
-                    gridcolor='rgba(220, 220, 220, 0.8)',
-                    zerolinecolor='rgba(220, 220, 220, 0.8)'
-                )
-            )
-            
-            # Add outlier zones
-            fig.add_shape(
-                type="rect",
-                x0=clean_df['Metropolitian Population'].min() * 0.8,
-                y0=clean_df['GDP_per_capita'].quantile(0.75) * 1.5,
-                x1=clean_df['Metropolitian Population'].max() * 1.2,
-                y1=clean_df['GDP_per_capita'].max() * 1.2,
-                line=dict(color="#0078D4", width=1, dash="dot"),
-                fillcolor="rgba(0, 120, 212, 0.1)",
-            )
-            
-            fig.add_shape(
-                type="rect",
-                x0=clean_df['Metropolitian Population'].min() * 0.8,
-                y0=clean_df['GDP_per_capita'].min() * 0.8,
-                x1=clean_df['Metropolitian Population'].max() * 1.2,
-                y1=clean_df['GDP_per_capita'].quantile(0.25) * 0.5,
-                line=dict(color="#D83B01", width=1, dash="dot"),
-                fillcolor="rgba(216, 59, 1, 0.1)",
-            )
-            
-            # Add annotations for outlier zones
-            fig.add_annotation(
-                x=clean_df['Metropolitian Population'].median(),
-                y=clean_df['GDP_per_capita'].max() * 0.95,
-                text="High Performers",
-                showarrow=False,
-                font=dict(size=14, color="#0078D4", family="Segoe UI, sans-serif"),
-                bgcolor="rgba(255, 255, 255, 0.7)",
-                bordercolor="#0078D4",
-                borderwidth=1,
-                borderpad=4
-            )
-            
-            fig.add_annotation(
-                x=clean_df['Metropolitian Population'].median(),
-                y=clean_df['GDP_per_capita'].min() * 1.05,
-                text="Low Performers",
-                showarrow=False,
-                font=dict(size=14, color="#D83B01", family="Segoe UI, sans-serif"),
-                bgcolor="rgba(255, 255, 255, 0.7)",
-                bordercolor="#D83B01",
-                borderwidth=1,
-                borderpad=4
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('outlier-distribution', lambda: outlier_scatter(clean_df, gdp_per_capita_q25, gdp_per_capita_q75), highlight=True)
             st.markdown('</div>', unsafe_allow_html=True)
         
         with outlier_tabs[1]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
             # Create a bar chart showing z-scores for outliers
-            combined_outliers = pd.concat([outliers_high, outliers_low])
-            
-            fig = px.bar(
-                combined_outliers.sort_values('z_score'), 
-                y='Metropolitian Area/City',
-                x='z_score',
-                color='z_score',
-                color_continuous_scale='RdBu_r',
-                range_color=[-3, 3],
-                text='GDP_per_capita',
-                hover_data={
-                    'GDP_per_capita': ':,',
-                    'Metropolitian Population': ':,',
-                    'Official est. GDP(billion US$)': ':.1f'
-                },
-                labels={
-                    'Metropolitian Area/City': 'Metropolitan Area',
-                    'z_score': 'Z-Score (GDP per Capita)',
-                    'GDP_per_capita': 'GDP per Capita (US$)'
-                }
-            )
-            
-            # Update layout
-            fig.update_layout(
-                title='Z-Score Analysis of Outliers',
-                plot_bgcolor='rgba(240, 242, 246, 0.8)',
-                paper_bgcolor='rgba(240, 242, 246, 0.0)',
-                height=600,
-                margin=dict(l=20, r=20, t=50, b=20),
-                font=dict(family="Segoe UI, sans-serif", color="#252525"),
-                xaxis=dict(
-                    title_font=dict(size=14, color="#252525"),
-                    tickfont=dict(size=12, color="#252525"),
-                    gridcolor='rgba(220, 220, 220, 0.8)',
-                    zerolinecolor='#605E5C'
-                ),
-                yaxis=dict(
-                    title=None,
-                    tickfont=dict(size=12, color="#252525")
-                )
-            )
-            
-            # Format text
-            fig.update_traces(
-                texttemplate='$%{text:,.0f}',
-                textposition='outside'
-            )
-            
-            # Add a vertical line at z=0
-            fig.add_shape(
-                type="line",
-                x0=0, y0=-0.5,
-                x1=0, y1=len(combined_outliers) - 0.5,
-                line=dict(color="#605E5C", width=1.5, dash="solid")
-            )
-            
-            # Add z-score interpretation bands
-            fig.add_shape(
-                type="rect",
-                x0=2, y0=-0.5,
-                x1=5, y1=len(combined_outliers) - 0.5,
-                line=dict(color="rgba(0,0,0,0)"),
-                fillcolor="rgba(0, 120, 212, 0.1)",
-                layer="below"
-            )
-            
-            fig.add_shape(
-                type="rect",
-                x0=-5, y0=-0.5,
-                x1=-2, y1=len(combined_outliers) - 0.5,
-                line=dict(color="rgba(0,0,0,0)"),
-                fillcolor="rgba(216, 59, 1, 0.1)",
-                layer="below"
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('outlier-zscores', lambda: outlier_zscores(outliers_high, outliers_low), highlight=True)
             st.markdown('</div>', unsafe_allow_html=True)
             
         with outlier_tabs[2]:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-            # Create a quadrant chart for outliers
-            # Normalize GDP per capita and population for plotting
-            clean_df['gdp_per_capita_norm'] = (clean_df['GDP_per_capita'] - clean_df['GDP_per_capita'].min()) / (clean_df['GDP_per_capita'].max() - clean_df['GDP_per_capita'].min())
-            clean_df['pop_norm'] = (clean_df['Metropolitian Population'] - clean_df['Metropolitian Population'].min()) / (clean_df['Metropolitian Population'].max() - clean_df['Metropolitian Population'].min())
-            
-            # Identify quadrant for each city
-            clean_df['quadrant'] = 'Average'
-            clean_df.loc[(clean_df['gdp_per_capita_norm'] > 0.5) & (clean_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Efficient'
-            clean_df.loc[(clean_df['gdp_per_capita_norm'] > 0.5) & (clean_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Efficient'
-            clean_df.loc[(clean_df['gdp_per_capita_norm'] < 0.5) & (clean_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Less Efficient'
-            clean_df.loc[(clean_df['gdp_per_capita_norm'] < 0.5) & (clean_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Less Efficient'
-            
-            # Filter outliers for chart
-            quadrant_df = pd.concat([
-                outliers_high,
-                outliers_low,
-                clean_df[(clean_df['z_score'] <= 2) & (clean_df['z_score'] >= -2)].sample(min(20, len(clean_df)))
-            ])
-            
-            # Apply the same normalization to the filtered dataframe
-            quadrant_df['gdp_per_capita_norm'] = (quadrant_df['GDP_per_capita'] - clean_df['GDP_per_capita'].min()) / (clean_df['GDP_per_capita'].max() - clean_df['GDP_per_capita'].min())
-            quadrant_df['pop_norm'] = (quadrant_df['Metropolitian Population'] - clean_df['Metropolitian Population'].min()) / (clean_df['Metropolitian Population'].max() - clean_df['Metropolitian Population'].min())
-            
-            # Set quadrant
-            quadrant_df['quadrant'] = 'Average'
-            quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] > 0.5) & (quadrant_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Efficient'
-            quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] > 0.5) & (quadrant_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Efficient'
-            quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] < 0.5) & (quadrant_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Less Efficient'
-            quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] < 0.5) & (quadrant_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Less Efficient'
-            
-            # Create scatter plot
-            fig = px.scatter(
-                quadrant_df,
-                x='pop_norm',
-                y='gdp_per_capita_norm',
-                color='z_score',
-                size='Official est. GDP(billion US$)',
-                hover_name='Metropolitian Area/City',
-                color_continuous_scale='RdBu_r',
-                range_color=[-3, 3],
-                hover_data={
-                    'gdp_per_capita_norm': False,
-                    'pop_norm': False,
-                    'GDP_per_capita': ':,',
-                    'Metropolitian Population': ':,',
-                    'quadrant': True,
-                    'z_score': ':.2f'
-                },
-                labels={
-                    'pop_norm': 'Population Size (normalized)',
-                    'gdp_per_capita_norm': 'GDP per Capita (normalized)',
-                    'z_score': 'Z-Score'
-                }
+            # Create a quadrant chart for outliers; a fixed sample keeps the figure the same on every rerun
+            plotly_chart(
+                'outlier-quadrants',
+                lambda: outlier_quadrants(clean_df, outliers_high, outliers_low, random_state=RANDOM_STATE),
+                highlight=True
             )
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+        with outlier_tabs[3]:
+            st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+            # Compare a metro with its nearest peers in (log population, log GDP) space
+            peer_cols = st.columns([2, 1, 1])
+            with peer_cols[0]:
+                peer_options = sorted(clean_df['Metropolitian Area/City'])
+                peer_default = peer_options.index(highlight_city) if highlight_city in peer_options else 0
+                peer_city = st.selectbox("Metropolitan area", peer_options, index=peer_default, key="peer_city")
+            with peer_cols[1]:
+                peer_k = st.slider("Peers", 5, 25, 10, key="peer_k")
+            with peer_cols[2]:
+                peer_by_region = st.checkbox("Same region only", value=False, key="peer_by_region")
+            
+            peer_index = get_peer_index(clean_df, filter_version, filter_key, peer_by_region)
+            if peer_city in peer_index:
+                peer_df, peer_percentile = peer_index.peers(peer_city, k=peer_k)
+            else:
+                peer_df, peer_percentile = peer_index.frame.iloc[:0], np.nan
             
-            # Update layout
-            fig.update_layout(
-                title='Performance Quadrants Analysis',
-                height=600,
-                plot_bgcolor='rgba(240, 242, 246, 0.8)',
-                paper_bgcolor='rgba(240, 242, 246, 0.0)',
-                font=dict(family="Segoe UI, sans-serif", color="#252525"),
-                margin=dict(l=20, r=20, t=50, b=20),
-                coloraxis_colorbar=dict(
-                    title="Z-Score",
-                    tickvals=[-3, -2, 0, 2, 3],
-                    ticktext=["Strong Underperformer", "Underperformer", "Average", "Overperformer", "Strong Overperformer"]
+            if peer_df.empty:
+                st.info("Not enough comparable metropolitan areas for this selection.")
+            else:
+                selected_row = peer_index.frame[peer_index.frame['Metropolitian Area/City'] == peer_city]
+                comparison_df = pd.concat([selected_row.assign(Distance=0.0), peer_df])
+                comparison_df['Role'] = np.where(comparison_df['Metropolitian Area/City'] == peer_city, 'Selected', 'Peer')
+                
+                st.metric(
+                    f"{peer_city}: percentile among {len(peer_df)} peers",
+                    f"{peer_percentile:.0f}th",
+                    help="Share of size- and output-comparable metros with a lower GDP per capita"
                 )
-            )
-            
-            # Add quadrant lines
-            fig.add_shape(
-                type="line",
-                x0=0.5, y0=0,
-                x1=0.5, y1=1,
-                line=dict(color="#605E5C", width=1, dash="dash")
-            )
-            
-            fig.add_shape(
-                type="line",
-                x0=0, y0=0.5,
-                x1=1, y1=0.5,
-                line=dict(color="#605E5C", width=1, dash="dash")
-            )
-            
-            # Add quadrant annotations
-            fig.add_annotation(
-                x=0.25, y=0.75,
-                text="Small & Efficient",
-                showarrow=False,
-                font=dict(size=12, color="#0078D4", family="Segoe UI, sans-serif"),
-                bgcolor="rgba(255, 255, 255, 0.7)",
-                bordercolor="#0078D4",
-                borderwidth=1,
-                borderpad=2
-            )
-            
-            fig.add_annotation(
-                x=0.75, y=0.75,
-                text="Large & Efficient",
-                showarrow=False,
-                font=dict(size=12, color="#0078D4", family="Segoe UI, sans-serif"),
-                bgcolor="rgba(255, 255, 255, 0.7)",
-                bordercolor="#0078D4",
-                borderwidth=1,
-                borderpad=2
-            )
-            
-            fig.add_annotation(
-                x=0.25, y=0.25,
-                text="Small & Less Efficient",
-                showarrow=False,
-                font=dict(size=12, color="#D83B01", family="Segoe UI, sans-serif"),
-                bgcolor="rgba(255, 255, 255, 0.7)",
-                bordercolor="#D83B01",
-                borderwidth=1,
-                borderpad=2
-            )
-            
-            fig.add_annotation(
-                x=0.75, y=0.25,
-                text="Large & Less Efficient",
-                showarrow=False,
-                font=dict(size=12, color="#D83B01", family="Segoe UI, sans-serif"),
-                bgcolor="rgba(255, 255, 255, 0.7)",
-                bordercolor="#D83B01",
-                borderwidth=1,
-                borderpad=2
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+                
+                plotly_chart('peer-comparison', lambda: peer_comparison(comparison_df, peer_city), peer_city, peer_k, peer_by_region)
+            
+            with st.expander("Peer-relative Outliers"):
+                # Batch mode: every metro scored against its own peer group at once
+                peer_scores = peer_index.peer_scores(k=peer_k).dropna(subset=['Peer_Z'])
+                score_columns = ['Metropolitian Area/City', 'Country/Region', 'GDP_per_capita', 'Peer_Median_GDP_per_capita', 'Peer_Percentile', 'Peer_Z']
+                over_col, under_col = st.columns(2)
+                with over_col:
+                    st.markdown("**Strongest overperformers vs. peers**")
+                    st.dataframe(peer_scores.nlargest(10, 'Peer_Z')[score_columns].round(2), hide_index=True, use_container_width=True)
+                with under_col:
+                    st.markdown("**Strongest underperformers vs. peers**")
+                    st.dataframe(peer_scores.nsmallest(10, 'Peer_Z')[score_columns].round(2), hide_index=True, use_container_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
     
     with outlier_col2:
@@ -2138,6 +1163,172 @@ if data_loaded:
     # Add a section divider
     st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
     
+    # Trends across annual vintages, read from per-year partition results
+    st.markdown('<div class="fadeIn">', unsafe_allow_html=True)
+    colored_header(
+        label="Economic Trends Across Vintages",
+        description="Growth and rank changes between annual releases of the metro data",
+        color_name="blue-green-70"
+    )
+    
+    vintage_store = get_vintage_store()
+    vintage_store.refresh()
+    
+    with st.expander("Add a Vintage"):
+        vintage_cols = st.columns([1, 3])
+        with vintage_cols[0]:
+            vintage_year = st.number_input("Year", min_value=1990, max_value=2100, value=max(vintage_store.years or [2023]) + 1, step=1, key="vintage_year")
+        with vintage_cols[1]:
+            vintage_file = st.file_uploader("Vintage CSV (same columns as dataset.csv)", type=["csv"], key="vintage_file")
+        if vintage_file is not None and st.button("Add vintage", key="vintage_add"):
+            try:
+                recomputed = vintage_store.add(vintage_year, pd.read_csv(vintage_file))
+                st.success(f"Stored the {vintage_year} vintage; recomputed partitions: {', '.join(map(str, recomputed)) or 'none'}")
+            except Exception as e:
+                st.error(f"Error processing vintage file: {str(e)}")
+    
+    vintage_years = vintage_store.years
+    if len(vintage_years) < 2:
+        st.info(
+            f"Only the {vintage_years[0] if vintage_years else 'base'} vintage is available. Add yearly files as "
+            "vintages/<year>.csv (same columns as dataset.csv) to compare growth rates and rank changes."
+        )
+    else:
+        vintage_range_cols = st.columns(2)
+        with vintage_range_cols[0]:
+            start_year = st.selectbox("From", vintage_years[:-1], index=0, key="vintage_start")
+        with vintage_range_cols[1]:
+            end_options = [year for year in vintage_years if year > start_year]
+            end_year = st.selectbox("To", end_options, index=len(end_options) - 1, key="vintage_end")
+        
+        # The two vintages' contents, so a replaced vintage file redraws the charts
+        vintage_key = (start_year, end_year) + vintage_store.fingerprints(start_year, end_year)
+        trend_tabs = st.tabs(["Growth Rates", "Rank Changes"])
+        
+        with trend_tabs[0]:
+            region_growth = vintage_store.region_growth(start_year, end_year)
+            region_growth = region_growth[region_growth['Region'].isin(selected_regions)]
+            plotly_chart('region-growth', lambda: region_growth_chart(region_growth, start_year, end_year), vintage_key)
+            
+            metro_growth = vintage_store.growth(start_year, end_year)
+            metro_growth = metro_growth[metro_growth['Region'].isin(selected_regions)].dropna(subset=['GDP_per_capita_cagr'])
+            growth_extremes = pd.concat([metro_growth.nlargest(10, 'GDP_per_capita_cagr'), metro_growth.nsmallest(10, 'GDP_per_capita_cagr')]).drop_duplicates()
+            plotly_chart('metro-growth', lambda: metro_growth_chart(growth_extremes), vintage_key, highlight=True)
+        
+        with trend_tabs[1]:
+            rank_changes = vintage_store.rank_change(start_year, end_year, sort_measure)
+            rank_changes = rank_changes[rank_changes['Region'].isin(selected_regions)]
+            movers = pd.concat([rank_changes.nlargest(10, 'Rank_change'), rank_changes.nsmallest(10, 'Rank_change')]).drop_duplicates()
+            plotly_chart('rank-movers', lambda: rank_movers_chart(movers, sort_label, start_year, end_year), vintage_key, sort_measure, highlight=True)
+            st.caption("Ranks are computed within each vintage over all metros it reports; only metros present in both vintages are compared.")
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Add a section divider
+    st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+    
+    # Metro Explorer: server-side sorted, paginated table of every metro in the filter
+    st.markdown('<div class="fadeIn">', unsafe_allow_html=True)
+    colored_header(
+        label="Metro Explorer",
+        description=f"Every metropolitan area matching the filters, sorted by {sort_label}",
+        color_name="blue-green-70"
+    )
+    
+    table_columns = {
+        'Country/Region': 'Country/Region',
+        'Region': 'Region',
+        'GDP (billion US$)': 'Official est. GDP(billion US$)',
+        'Population': 'Metropolitian Population',
+        'GDP per Capita (US$)': 'GDP_per_capita'
+    }
+    table_cols = st.columns([2, 1, 1, 1])
+    with table_cols[0]:
+        shown_columns = st.multiselect("Columns", list(table_columns), default=list(table_columns), key="table_columns")
+    with table_cols[1]:
+        table_ascending = st.checkbox("Ascending", value=False, key="table_ascending")
+    with table_cols[2]:
+        page_size = st.selectbox("Rows per page", [25, 50, 100], key="table_page_size")
+    
+    # Only the page's rows and the chosen columns leave the server
+    total_rows = int(filter_mask.sum())
+    page_count = max(1, -(-total_rows // page_size))
+    with table_cols[3]:
+        table_page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key="table_page")
+    
+    page_positions, total_rows = rank_index.page(sort_measure, table_page - 1, page_size, mask=filter_mask.to_numpy(), ascending=table_ascending)
+    projected = ['Metropolitian Area/City'] + [table_columns[column] for column in shown_columns]
+    page_df = df.iloc[page_positions, [df.columns.get_loc(column) for column in projected]]
+    page_df = page_df.rename(columns={source: label for label, source in table_columns.items()})
+    first_row = (min(table_page, page_count) - 1) * page_size
+    page_df.insert(0, 'Rank', np.arange(first_row + 1, first_row + len(page_df) + 1))
+    
+    st.dataframe(
+        page_df,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Metropolitian Area/City': st.column_config.TextColumn('Metropolitan Area'),
+            'GDP (billion US$)': st.column_config.NumberColumn(format="%.1f"),
+            'Population': st.column_config.NumberColumn(format="%d"),
+            'GDP per Capita (US$)': st.column_config.NumberColumn(format="$%.0f")
+        }
+    )
+    st.caption(f"Rows {first_row + 1 if len(page_df) else 0:,}-{first_row + len(page_df):,} of {total_rows:,} | Page {min(table_page, page_count)} of {page_count}")
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Add a section divider
+    st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+    
+    with st.expander("Figure Payloads"):
+        # Measuring serializes every figure on the page, so it is only done while this is ticked;
+        # the figures above read it on the rerun the checkbox triggers
+        st.checkbox("Measure figure payloads", key="measure_payloads")
+        if figure_payloads:
+            payload_table = pd.DataFrame(figure_payloads)
+            payload_table['Saved (%)'] = 100 * (1 - payload_table['compact_bytes'] / payload_table['json_bytes'])
+            st.caption(
+                f"{len(payload_table)} figures on this page: {payload_table['json_bytes'].sum() / 1024:,.0f} KB as full JSON, "
+                f"{payload_table['compact_bytes'].sum() / 1024:,.0f} KB as sent."
+            )
+            st.dataframe(
+                payload_table.rename(columns={'name': 'Figure', 'json_bytes': 'Full JSON (bytes)', 'compact_bytes': 'Sent (bytes)'}),
+                hide_index=True,
+                use_container_width=True,
+                column_config={'Saved (%)': st.column_config.NumberColumn(format="%.1f")}
+            )
+    
+    with st.expander("Cache Statistics"):
+        # Counters since the server started, shared by every session
+        stats_table = cache_stats()
+        stats_table['bytes'] = stats_table['bytes'] / 1024 ** 2
+        st.dataframe(
+            stats_table.rename(columns={
+                'namespace': 'Cache', 'entries': 'Entries', 'bytes': 'Size (MB)', 'hits': 'Hits', 'disk_hits': 'Disk Hits',
+                'misses': 'Misses', 'hit_rate': 'Hit Rate', 'evicted_lru': 'Evicted (LRU)', 'evicted_bytes': 'Evicted (size)', 'expired': 'Expired'
+            }),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Size (MB)': st.column_config.NumberColumn(format="%.1f"),
+                'Hit Rate': st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=1)
+            }
+        )
+        if warmup is not None:
+            warmup_status = warmup.status()
+            st.caption(
+                f"Warm-up {'finished' if warmup_status['ready'] else 'running'}: {warmup_status['done']} of {warmup_status['total']} "
+                f"tasks in {warmup_status['elapsed']:.1f}s" + (f", failed: {'; '.join(warmup_status['errors'])}" if warmup_status['errors'] else "")
+            )
+        results = result_store()
+        if results is not None:
+            stored = results.summary()
+            st.caption(
+                f"Result store {results.path} (code version {results.code_version}): "
+                f"{sum(entry['results'] for entry in stored.values())} results, "
+                f"{sum(entry['bytes'] for entry in stored.values()) / 1024 ** 2:.1f} MB; "
+                f"{results.reads} read and {results.writes} written by this process"
+            )
+    
     # Add a footer section
     st.markdown("""
     <div class="footer">
@@ -2146,37 +1337,12 @@ if data_loaded:
         <div class="author-info">
             <p><strong>Created by Manish Paneru</strong> | Data Analyst</p>
             <div class="social-links">
-                <a href="https://linkedin.com/in/manish.paneru1" target="_blank"><i class="fab fa-linkedin"></i> LinkedIn</a> |
-                <a href="https://github.com/manishpaneru" target="_blank"><i class="fab fa-github"></i> GitHub</a> |
-                <a href="https://www.analystpaneru.xyz" target="_blank"><i class="fa fa-globe"></i> Portfolio</a>
+                <a href="https://linkedin.com/in/manish.paneru1" target="_blank"><i class="icon icon-linkedin"></i> LinkedIn</a> |
+                <a href="https://github.com/manishpaneru" target="_blank"><i class="icon icon-github"></i> GitHub</a> |
+                <a href="https://www.analystpaneru.xyz" target="_blank"><i class="icon icon-globe"></i> Portfolio</a>
             </div>
         </div>
     </div>
     """, unsafe_allow_html=True)
-
-    # Add Font Awesome for social icons
-    st.markdown("""
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css">
-    <style>
-        .author-info {
-            margin-top: 15px;
-            padding-top: 15px;
-            border-top: 1px solid rgba(255,255,255,0.2);
-        }
-        .social-links {
-            margin-top: 5px;
-        }
-        .social-links a {
-            color: rgba(255,255,255,0.8);
-            text-decoration: none;
-            margin: 0 5px;
-            transition: color 0.3s;
-        }
-        .social-links a:hover {
-            color: white;
-            text-decoration: underline;
-        }
-    </style>
-    """, unsafe_allow_html=True)
 else:
     st.error("Could not load the dataset. Please check that dataset.csv exists in the current directory.") 
\ No newline at end of file
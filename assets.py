@@ -0,0 +1,35 @@
+"""Local stylesheet and icons for the dashboard.
+
+The files in ``static/`` are registered as a Streamlit component, so the server's component
+handler serves them with their real content type and a public Cache-Control header. A tiny
+frame links the stylesheet into the page head once; later reruns only resend the frame's
+arguments, which carry a content hash so an edited file is fetched again.
+"""
+import hashlib
+import os
+
+import streamlit.components.v1 as components
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STYLESHEETS = ('style.css',)
+
+_injector = components.declare_component('dashboard_assets', path=STATIC_DIR)
+_versions = {}
+
+
+def asset_version(name):
+    """Short content hash of a file in ``static/``, recomputed only when the file changes."""
+    path = os.path.join(STATIC_DIR, name)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _versions.get(name)
+    if cached is None or cached[0] != signature:
+        with open(path, 'rb') as handle:
+            cached = (signature, hashlib.sha1(handle.read()).hexdigest()[:12])
+        _versions[name] = cached
+    return cached[1]
+
+
+def inject_assets():
+    """Link the local stylesheets into the page; the browser fetches each version once."""
+    _injector(stylesheets=[f'{name}?v={asset_version(name)}' for name in STYLESHEETS], key='dashboard_assets', default=None)
@@ -0,0 +1,325 @@
+"""Pluggable analytics backends for the dashboard's filter-and-aggregate queries.
+
+Every backend answers the same questions over the cleaned metro data: the filtered metro
+rows, additive per-country sums (the input of the rollup cube) and GDP-per-capita statistics
+per population bin. Filters are plain keyword arguments:
+
+    regions           iterable of region names to keep (None keeps all)
+    gdp_range         inclusive (low, high) GDP bounds in billion US$
+    population_range  (low, high] population bounds, as produced by binning.bin_range
+
+pandas is always available and is the default; DuckDB and Polars are optional engines
+(``requirements-backends.txt``), chosen with ``METRO_BACKEND``. Results always come back as
+pandas frames, the format the Plotly charts consume.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from binning import BUCKETINGS
+from metro_data import CITY, COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, REGION, REGIONS, clean_metros
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# Rows without these values never enter an aggregate
+REQUIRED = [GDP_PER_CAPITA, POPULATION, GDP, REGION]
+
+# Short column names used inside SQL engines
+SQL_COLUMNS = {
+    CITY: 'city',
+    COUNTRY: 'country',
+    REGION: 'region',
+    GDP: 'gdp',
+    POPULATION: 'population',
+    GDP_PER_CAPITA: 'gdp_per_capita'
+}
+
+SUM_COLUMNS = ['count', 'gdp', 'population', 'gpc_sum', 'gpc_sumsq', 'gpc_wsum', 'gpc_wsumsq']
+
+
+class PandasBackend:
+    """Eager pandas implementation; the reference every other backend must agree with."""
+
+    name = 'pandas'
+
+    def __init__(self, df):
+        self.df = df.dropna(subset=REQUIRED)
+
+    def _filtered(self, regions=None, gdp_range=None, population_range=None):
+        df = self.df
+        mask = np.ones(len(df), dtype=bool)
+        if regions is not None:
+            mask &= df[REGION].isin(list(regions)).to_numpy()
+        if gdp_range is not None:
+            mask &= df[GDP].between(*gdp_range).to_numpy()
+        if population_range is not None:
+            low, high = population_range
+            mask &= ((df[POPULATION] > low) & (df[POPULATION] <= high)).to_numpy()
+        return df[mask]
+
+    def metros(self, **filters):
+        """Filtered metro rows with the dataset's column names."""
+        return self._filtered(**filters)[list(SQL_COLUMNS)].reset_index(drop=True)
+
+    def country_sums(self, **filters):
+        """Count, GDP, population and (weighted) GDP-per-capita moments per (region, country)."""
+        df = self._filtered(**filters)
+        gdp_per_capita = df[GDP_PER_CAPITA].to_numpy(dtype=float)
+        population = df[POPULATION].to_numpy(dtype=float)
+        parts = pd.DataFrame({
+            REGION: df[REGION].to_numpy(),
+            COUNTRY: df[COUNTRY].to_numpy(),
+            'count': 1,
+            'gdp': df[GDP].to_numpy(dtype=float),
+            'population': population,
+            'gpc_sum': gdp_per_capita,
+            'gpc_sumsq': gdp_per_capita ** 2,
+            'gpc_wsum': population * gdp_per_capita,
+            'gpc_wsumsq': population * gdp_per_capita ** 2
+        })
+        return parts.groupby([REGION, COUNTRY], sort=True)[SUM_COLUMNS].sum().reset_index()
+
+    def size_summary(self, bucketing='size_category', **filters):
+        """Count, mean, median and sample std of GDP per capita for every population bin."""
+        edges, labels = BUCKETINGS[bucketing]
+        df = self._filtered(**filters)
+        bins = pd.cut(df[POPULATION], list(edges), labels=list(labels))
+        stats = df[GDP_PER_CAPITA].groupby(bins, observed=False).agg(['count', 'mean', 'median', 'std'])
+        stats.index = pd.Index(labels, name='bin')
+        return stats
+
+
+class DuckDBBackend:
+    """In-process DuckDB over an in-memory table of the cleaned data.
+
+    The cleaned frame is copied once per dataset version into a DuckDB table, so
+    aggregations run as DuckDB's parallel, vectorized operators over its columnar storage.
+    Nothing is written to disk, so superseded versions leave no files behind. Each query
+    uses its own cursor, which keeps one backend safe to share across Streamlit sessions.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, df, version=None, threads=None):
+        if duckdb is None:
+            raise ImportError("DuckDBBackend needs the duckdb package")
+        self.version = version
+        self._con = duckdb.connect()
+        if threads:
+            self._con.execute(f'SET threads TO {int(threads)}')
+        frame = df.dropna(subset=REQUIRED)[list(SQL_COLUMNS)].rename(columns=SQL_COLUMNS)
+        frame = frame.astype({'gdp': float, 'population': float, 'gdp_per_capita': float})
+        self._con.register('cleaned', frame)
+        self._con.execute('CREATE TABLE metros AS SELECT * FROM cleaned')
+        self._con.unregister('cleaned')
+
+    @staticmethod
+    def _where(regions=None, gdp_range=None, population_range=None):
+        clauses, params = ['TRUE'], []
+        if regions is not None:
+            regions = list(regions)
+            if not regions:
+                clauses.append('FALSE')
+            else:
+                clauses.append(f"region IN ({', '.join('?' * len(regions))})")
+                params.extend(regions)
+        if gdp_range is not None:
+            clauses.append('gdp BETWEEN ? AND ?')
+            params.extend(float(bound) for bound in gdp_range)
+        if population_range is not None:
+            # The top bin is open-ended (upper bound inf)
+            low, high = population_range
+            clauses.append('population > ?')
+            params.append(float(low))
+            if np.isfinite(high):
+                clauses.append('population <= ?')
+                params.append(float(high))
+        return ' AND '.join(clauses), params
+
+    def _query(self, sql, params):
+        return self._con.cursor().execute(sql, params).df()
+
+    def metros(self, **filters):
+        where, params = self._where(**filters)
+        frame = self._query(f'SELECT * FROM metros WHERE {where}', params)
+        return frame.rename(columns={short: name for name, short in SQL_COLUMNS.items()})
+
+    def country_sums(self, **filters):
+        where, params = self._where(**filters)
+        sums = self._query(f"""
+            SELECT region, country,
+                   count(*) AS count,
+                   sum(gdp) AS gdp,
+                   sum(population) AS population,
+                   sum(gdp_per_capita) AS gpc_sum,
+                   sum(gdp_per_capita * gdp_per_capita) AS gpc_sumsq,
+                   sum(population * gdp_per_capita) AS gpc_wsum,
+                   sum(population * gdp_per_capita * gdp_per_capita) AS gpc_wsumsq
+            FROM metros
+            WHERE {where}
+            GROUP BY region, country
+            ORDER BY region, country
+        """, params)
+        sums = sums.rename(columns={'region': REGION, 'country': COUNTRY})
+        sums['count'] = sums['count'].astype(np.int64)
+        return sums
+
+    def size_summary(self, bucketing='size_category', **filters):
+        edges, labels = BUCKETINGS[bucketing]
+        where, params = self._where(**filters)
+        # Right-closed bins, matching pd.cut and the population binner
+        cases = ' '.join(
+            f'WHEN population > {float(low)}' + (f' AND population <= {float(high)}' if np.isfinite(high) else '') + f' THEN {i}'
+            for i, (low, high) in enumerate(zip(edges[:-1], edges[1:]))
+        )
+        stats = self._query(f"""
+            SELECT bin, count(gdp_per_capita) AS count, avg(gdp_per_capita) AS mean,
+                   median(gdp_per_capita) AS median, stddev_samp(gdp_per_capita) AS std
+            FROM (SELECT CASE {cases} END AS bin, gdp_per_capita FROM metros WHERE {where})
+            WHERE bin IS NOT NULL
+            GROUP BY bin
+        """, params)
+        stats = stats.set_index('bin').reindex(range(len(labels)))
+        stats['count'] = stats['count'].fillna(0).astype(np.int64)
+        stats.index = pd.Index(labels, name='bin')
+        return stats
+
+
+class PolarsBackend:
+    """Polars LazyFrame implementation.
+
+    Every query is one lazy plan from the source to the result, so Polars can push filters
+    and projections down, fuse the cleaning expressions into the scan and run the group-by
+    on all cores. Built with `from_csv`, the plan starts at the raw CSV and includes the
+    number parsing, GDP-per-capita and region mapping of `metro_data.clean_metros`.
+    Results are collected and converted to pandas only when returned.
+    """
+
+    name = 'polars'
+
+    def __init__(self, frame):
+        if pl is None:
+            raise ImportError("PolarsBackend needs the polars package")
+        if isinstance(frame, pd.DataFrame):
+            frame = pl.from_pandas(frame[list(SQL_COLUMNS)].rename(columns=SQL_COLUMNS)).lazy()
+        required = ['region', 'gdp', 'population', 'gdp_per_capita']
+        self._frame = frame.drop_nulls(required).drop_nans(required[1:])
+
+    @staticmethod
+    def scan_cleaned(path):
+        """Lazy plan reading dataset.csv and cleaning it as `metro_data.clean_metros` does."""
+        def number(column):
+            # Thousands separators and padding, as in metro_data.clean_metros
+            return pl.col(column).str.replace_all(',', '').str.strip_chars().cast(pl.Float64, strict=False)
+
+        frame = pl.scan_csv(path, infer_schema=False)
+        return frame.with_columns(
+            number(GDP).alias(GDP),
+            number(POPULATION).alias(POPULATION)
+        ).with_columns(
+            (pl.col(GDP) * 1e9 / pl.col(POPULATION)).alias(GDP_PER_CAPITA),
+            pl.col(COUNTRY).replace_strict(REGIONS, default='Other').alias(REGION)
+        )
+
+    @classmethod
+    def from_csv(cls, path):
+        """Scan dataset.csv lazily and clean it inside the query plan."""
+        return cls(cls.scan_cleaned(path).select(pl.col(name).alias(short) for name, short in SQL_COLUMNS.items()))
+
+    def _filtered(self, regions=None, gdp_range=None, population_range=None):
+        frame = self._frame
+        if regions is not None:
+            frame = frame.filter(pl.col('region').is_in(list(regions)))
+        if gdp_range is not None:
+            frame = frame.filter(pl.col('gdp').is_between(*gdp_range, closed='both'))
+        if population_range is not None:
+            low, high = population_range
+            frame = frame.filter((pl.col('population') > low) & (pl.col('population') <= high))
+        return frame
+
+    def metros(self, **filters):
+        frame = self._filtered(**filters).collect().to_pandas()
+        return frame.rename(columns={short: name for name, short in SQL_COLUMNS.items()})
+
+    def country_sums(self, **filters):
+        gdp_per_capita, population = pl.col('gdp_per_capita'), pl.col('population')
+        sums = self._filtered(**filters).group_by('region', 'country').agg(
+            pl.len().cast(pl.Int64).alias('count'),
+            pl.col('gdp').sum().alias('gdp'),
+            population.sum().alias('population'),
+            gdp_per_capita.sum().alias('gpc_sum'),
+            (gdp_per_capita * gdp_per_capita).sum().alias('gpc_sumsq'),
+            (population * gdp_per_capita).sum().alias('gpc_wsum'),
+            (population * gdp_per_capita * gdp_per_capita).sum().alias('gpc_wsumsq')
+        ).sort('region', 'country').collect().to_pandas()
+        return sums.rename(columns={'region': REGION, 'country': COUNTRY})
+
+    def size_summary(self, bucketing='size_category', **filters):
+        edges, labels = BUCKETINGS[bucketing]
+        # Right-closed bins, matching pd.cut and the population binner
+        bin_code = pl.lit(None, dtype=pl.Int64)
+        for i, (low, high) in reversed(list(enumerate(zip(edges[:-1], edges[1:])))):
+            inside = (pl.col('population') > low) & (pl.col('population') <= high)
+            bin_code = pl.when(inside).then(pl.lit(i, dtype=pl.Int64)).otherwise(bin_code)
+        stats = self._filtered(**filters).with_columns(bin_code.alias('bin')).drop_nulls('bin').group_by('bin').agg(
+            pl.col('gdp_per_capita').count().cast(pl.Int64).alias('count'),
+            pl.col('gdp_per_capita').mean().alias('mean'),
+            pl.col('gdp_per_capita').median().alias('median'),
+            pl.col('gdp_per_capita').std(ddof=1).alias('std')
+        ).collect().to_pandas()
+        stats = stats.set_index('bin').reindex(range(len(labels)))
+        stats['count'] = stats['count'].fillna(0).astype(np.int64)
+        stats.index = pd.Index(labels, name='bin')
+        return stats
+
+
+BACKENDS = {'pandas': PandasBackend, 'duckdb': DuckDBBackend, 'polars': PolarsBackend}
+
+# Optional engine module behind each backend
+_ENGINES = {'duckdb': duckdb, 'polars': pl}
+
+
+def available_backends():
+    """Names of the backends that can run in this environment."""
+    return [name for name in BACKENDS if name not in _ENGINES or _ENGINES[name] is not None]
+
+
+def backend_name():
+    """The backend chosen with METRO_BACKEND=pandas|duckdb|polars, pandas by default."""
+    return os.environ.get('METRO_BACKEND', 'pandas')
+
+
+def read_metros(path, name='pandas'):
+    """The cleaned frame of dataset.csv, parsed and cleaned by Polars' lazy plan for `name` polars.
+
+    Every other backend reads it with pandas and `metro_data.clean_metros`. Both give the same
+    frame: the CSV's columns (with numbers parsed), then GDP per capita and region.
+    """
+    if name != 'polars' or pl is None:
+        return clean_metros(pd.read_csv(path))
+    df = PolarsBackend.scan_cleaned(path).collect().to_pandas()
+    if 'Index' in df:
+        df['Index'] = pd.to_numeric(df['Index'])
+    population = df[POPULATION]
+    # pandas parses whole numbers without gaps as int64, as read_csv would
+    if population.notna().all() and (population % 1 == 0).all():
+        df[POPULATION] = population.astype(np.int64)
+    return df
+
+
+def make_backend(name, df, version):
+    """Build backend `name`, falling back to pandas when its engine is not installed."""
+    if name == 'duckdb' and duckdb is not None:
+        return DuckDBBackend(df, version)
+    if name == 'polars' and pl is not None:
+        return PolarsBackend(df)
+    return PandasBackend(df)
@@ -0,0 +1,104 @@
+"""Time the dashboard's aggregations on every available analytics backend.
+
+Usage: python benchmarks/backend_benchmark.py [--rows 1000000] [--repeat 5]
+
+The bundled dataset is replicated with multiplicative noise up to --rows metros, so the
+numbers reflect how each backend scales rather than the size of today's CSV.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import BACKENDS, PandasBackend, PolarsBackend, available_backends  # noqa: E402
+from binning import bin_range  # noqa: E402
+from metro_data import CITY, COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, clean_metros, dataset_version  # noqa: E402
+from weighted import per_capita  # noqa: E402
+
+QUERIES = {
+    'country_sums (all)': lambda backend: backend.country_sums(),
+    'country_sums (filtered)': lambda backend: backend.country_sums(
+        regions=['Europe', 'East Asia', 'North America'],
+        gdp_range=(10.0, 1000.0),
+        population_range=bin_range('pop_filter', 'Medium (1-5M)')
+    ),
+    'size_summary': lambda backend: backend.size_summary('size_trend'),
+    'metros (filtered)': lambda backend: backend.metros(regions=['Europe']),
+}
+
+
+def synthetic(df, rows, seed=0):
+    """Replicate `df` to `rows` metros, jittering GDP and population by up to +/-20%."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(df), rows)
+    frame = df.iloc[picks].reset_index(drop=True)
+    frame[CITY] = frame[CITY] + ' #' + pd.Series(np.arange(rows)).astype(str)
+    frame[GDP] = frame[GDP] * rng.uniform(0.8, 1.2, rows)
+    frame[POPULATION] = (frame[POPULATION] * rng.uniform(0.8, 1.2, rows)).round()
+    frame[GDP_PER_CAPITA] = per_capita(frame[GDP], frame[POPULATION])
+    return frame
+
+
+# End to end from the raw CSV: read, clean and aggregate
+FROM_CSV = {
+    'pandas': lambda path: PandasBackend(clean_metros(pd.read_csv(path))).country_sums(),
+    'polars': lambda path: PolarsBackend.from_csv(path).country_sums()
+}
+
+
+def build(name, df, version):
+    if name == 'duckdb':
+        return BACKENDS[name](df, version)
+    return BACKENDS[name](df)
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    df = clean_metros(pd.read_csv(os.path.join(root, 'dataset.csv')))
+    if args.rows != len(df):
+        df = synthetic(df, args.rows)
+    version = dataset_version(df)
+
+    print(f'{len(df):,} metros, median of {args.repeat} runs, milliseconds\n')
+    names = available_backends()
+    print('| query | ' + ' | '.join(names) + ' |')
+    print('|---|' + '---:|' * len(names))
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {}
+        build_ms = {}
+        for name in names:
+            start = time.perf_counter()
+            backends[name] = build(name, df, version)
+            build_ms[name] = (time.perf_counter() - start) * 1000
+        print('| build | ' + ' | '.join(f'{build_ms[name]:,.1f}' for name in names) + ' |')
+        for label, query in QUERIES.items():
+            print(f'| {label} | ' + ' | '.join(f'{timed(lambda: query(backends[name]), args.repeat):,.1f}' for name in names) + ' |')
+
+        csv_path = os.path.join(directory, 'metros.csv')
+        df[['Index', CITY, COUNTRY, GDP, POPULATION]].to_csv(csv_path, index=False)
+        cells = [f'{timed(lambda: FROM_CSV[name](csv_path), args.repeat):,.1f}' if name in FROM_CSV else '-' for name in names]
+        print('| csv -> country_sums | ' + ' | '.join(cells) + ' |')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Load-test the dashboard with concurrent simulated sessions against a local Streamlit server.
+
+Usage: python benchmarks/load_test.py [--sessions 1,5,10,20] [--actions 10] [--label NAME] [--compare OLD.json]
+
+The app is started once with ``streamlit run`` and warmed up by one session. Then, for every
+session count, that many websocket clients connect at the same time and each:
+
+- loads the page,
+- clicks the nav buttons,
+- changes the region, GDP, population and sort filters,
+- changes the drill-down and scaling controls,
+
+with a short random think time between actions. This is the Streamlit protocol the browser
+speaks. Tabs switch in the browser without a rerun, so only their content is exercised, which
+every rerun draws anyway.
+
+Each level reports:
+
+- rerun latency percentiles (from sending the widget change to the script finishing),
+- reruns per second,
+- the server's CPU use, from /proc, so Linux only,
+- the server's peak RSS, sampled while the sessions run.
+
+Results are written to ``benchmarks/results/<label>.json``. ``--compare`` prints them next
+to an earlier file, for checking one version of the app against another.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+PERCENTILES = (50, 95, 99)
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+WIDGET_TYPES = ('button', 'checkbox', 'multiselect', 'number_input', 'radio', 'selectbox', 'slider', 'text_input')
+
+# What a viewer does: widget key -> how to pick its next value from the widget's proto
+NAV_BUTTONS = ['nav_overview', 'nav_map', 'nav_top', 'nav_size', 'nav_regions', 'nav_outliers']
+ACTIONS = {
+    **{key: 'click' for key in NAV_BUTTONS},
+    'region_filter': 'subset',
+    'gdp_filter': 'range',
+    'pop_filter': 'option',
+    'sort_filter': 'option',
+    'drill_region': 'option',
+    'drill_country': 'option',
+    'scaling_level': 'option',
+    'scaling_min_metros': 'value',
+}
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as handle:
+        # Fields after the parenthesized command name; utime and stime are fields 14 and 15
+        fields = handle.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def _rss_mb(pid):
+    with open(f'/proc/{pid}/statm') as handle:
+        return int(handle.read().split()[1]) * PAGE_SIZE / 2 ** 20
+
+
+def start_server(app, port, timeout=120):
+    command = [
+        sys.executable, '-m', 'streamlit', 'run', app,
+        '--server.headless', 'true', '--server.port', str(port), '--server.fileWatcherType', 'none',
+        '--browser.gatherUsageStats', 'false'
+    ]
+    # app.py reads dataset.csv from the working directory
+    server = subprocess.Popen(command, cwd=os.path.dirname(app), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.25)
+    server.kill()
+    raise RuntimeError(f'Streamlit did not start on port {port} within {timeout}s')
+
+
+class Session:
+    """One simulated viewer: a websocket to the server and the widget values it has set."""
+
+    def __init__(self, url, rng):
+        self.url = url
+        self.rng = rng
+        self.widgets = {}
+        self.states = {}
+        self.latencies = []
+        self.exceptions = []
+        self.connection = None
+
+    async def connect(self):
+        self.connection = await websocket_connect(self.url, max_message_size=512 * 2 ** 20)
+
+    def _collect(self, message):
+        if message.WhichOneof('type') != 'delta' or message.delta.WhichOneof('type') != 'new_element':
+            return
+        element = message.delta.new_element
+        kind = element.WhichOneof('type')
+        if kind == 'exception':
+            self.exceptions.append(f'{element.exception.type}: {element.exception.message}')
+        elif kind in WIDGET_TYPES:
+            proto = getattr(element, kind)
+            # Widget ids end with the user key: "$$WIDGET_ID-<hash>-<key>"
+            self.widgets[proto.id.split('-', 2)[-1]] = (kind, proto)
+
+    async def rerun(self, state=None):
+        """Send the session's widget states (plus `state`) and wait for the script to finish; return seconds."""
+        states = list(self.states.values()) + ([state] if state is not None else [])
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.widget_states.widgets.extend(states)
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            raw = await self.connection.read_message()
+            if raw is None:
+                raise ConnectionError('The server closed the session')
+            reply = ForwardMsg()
+            reply.ParseFromString(raw)
+            self._collect(reply)
+            if reply.WhichOneof('type') == 'script_finished' and reply.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                elapsed = time.perf_counter() - start
+                self.latencies.append(elapsed)
+                return elapsed
+
+    def next_state(self):
+        """WidgetState of a random action among the widgets the last run drew."""
+        choices = [key for key in ACTIONS if key in self.widgets and not getattr(self.widgets[key][1], 'disabled', False)]
+        if not choices:
+            return None
+        key = self.rng.choice(choices)
+        kind, proto = self.widgets[key]
+        state = WidgetState(id=proto.id)
+        action = ACTIONS[key]
+        if action == 'click':
+            state.trigger_value = True
+            return state
+        if action == 'subset':
+            picked = sorted(self.rng.sample(range(len(proto.options)), self.rng.randint(1, len(proto.options))))
+            state.int_array_value.data.extend(picked)
+        elif action == 'range':
+            low, high = sorted(self.rng.uniform(proto.min, proto.max) for _ in range(2))
+            state.double_array_value.data.extend([low, high])
+        elif action == 'option':
+            state.int_value = self.rng.randrange(len(proto.options))
+        else:
+            # Sliders send a one-element array even for a single value
+            state.double_array_value.data.append(float(self.rng.randint(int(proto.min), int(proto.max))))
+        # Value widgets keep their value on later reruns; a click only fires once
+        self.states[proto.id] = state
+        return state
+
+    async def run(self, actions, think):
+        await self.connect()
+        try:
+            await self.rerun()
+            for _ in range(actions):
+                await asyncio.sleep(self.rng.expovariate(1 / think) if think > 0 else 0)
+                await self.rerun(self.next_state())
+        finally:
+            self.connection.close()
+
+
+async def _sample_rss(pid, peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], _rss_mb(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(url, pid, sessions, actions, think, seed):
+    """Run `sessions` concurrent sessions and return the level's latency and resource figures."""
+    simulated = [Session(url, random.Random(seed * 1000 + i)) for i in range(sessions)]
+    peak, stop = [_rss_mb(pid)], asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_rss(pid, peak, stop))
+    cpu_start, wall_start = _cpu_seconds(pid), time.perf_counter()
+    outcomes = await asyncio.gather(*(session.run(actions, think) for session in simulated), return_exceptions=True)
+    wall, cpu = time.perf_counter() - wall_start, _cpu_seconds(pid) - cpu_start
+    stop.set()
+    await sampler
+
+    latencies = np.array([latency for session in simulated for latency in session.latencies]) * 1000
+    level = {
+        'sessions': sessions,
+        'reruns': int(len(latencies)),
+        'failed_sessions': sum(isinstance(outcome, Exception) for outcome in outcomes),
+        'script_exceptions': sum(len(session.exceptions) for session in simulated),
+        'exception_messages': sorted({message for session in simulated for message in session.exceptions})[:5],
+        'wall_s': round(wall, 2),
+        'reruns_per_s': round(len(latencies) / wall, 2) if wall else None,
+        'mean_ms': round(float(latencies.mean()), 1) if len(latencies) else None,
+        'cpu_percent': round(100 * cpu / wall, 1) if wall else None,
+        'peak_rss_mb': round(peak[0], 1),
+    }
+    for q in PERCENTILES:
+        level[f'p{q}_ms'] = round(float(np.percentile(latencies, q)), 1) if len(latencies) else None
+    return level
+
+
+async def load_test(url, pid, levels, actions, think, seed):
+    # One untimed session first, so the levels measure a warm server rather than cache fills
+    await Session(url, random.Random(seed)).run(actions=len(ACTIONS), think=0)
+    results = []
+    for sessions in levels:
+        level = await run_level(url, pid, sessions, actions, think, seed)
+        print(
+            f"{level['sessions']:>4} sessions: p50 {level['p50_ms']} ms, p95 {level['p95_ms']} ms, p99 {level['p99_ms']} ms, "
+            f"{level['reruns_per_s']} reruns/s, CPU {level['cpu_percent']}%, peak RSS {level['peak_rss_mb']} MB"
+            + (f", {level['failed_sessions']} failed sessions" if level['failed_sessions'] else '')
+        )
+        results.append(level)
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    """Print each level's percentiles, throughput and resources next to an earlier run's."""
+    before = {level['sessions']: level for level in previous['levels']}
+    print(f"\n{previous['label']} -> {current['label']}")
+    print('| sessions | ' + ' | '.join(f'p{q} ms' for q in PERCENTILES) + ' | reruns/s | CPU % | peak RSS MB |')
+    print('|---:|' + '---:|' * (len(PERCENTILES) + 3))
+    for level in current['levels']:
+        old = before.get(level['sessions'], {})
+        cells = [f"{old.get(key, '-')} -> {level[key]}" for key in [f'p{q}_ms' for q in PERCENTILES] + ['reruns_per_s', 'cpu_percent', 'peak_rss_mb']]
+        print(f"| {level['sessions']} | " + ' | '.join(cells) + ' |')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', default='1,5,10,20', help="Comma-separated concurrent session counts")
+    parser.add_argument('--actions', type=int, default=10, help="Widget changes per session after the page load")
+    parser.add_argument('--think', type=float, default=0.5, help="Mean seconds between a session's actions")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--app', default=os.path.join(ROOT, 'app.py'))
+    parser.add_argument('--label', default=None, help="Results file name; defaults to the git revision")
+    parser.add_argument('--compare', default=None, help="Earlier results file to print next to this run")
+    args = parser.parse_args()
+
+    levels = [int(count) for count in args.sessions.split(',')]
+    port = _free_port()
+    server = start_server(os.path.abspath(args.app), port)
+    try:
+        url = f'ws://127.0.0.1:{port}/_stcore/stream'
+        results = asyncio.run(load_test(url, server.pid, levels, args.actions, args.think, args.seed))
+    finally:
+        server.terminate()
+        server.wait()
+
+    revision = _git_revision()
+    report = {
+        'label': args.label or revision or time.strftime('%Y%m%d-%H%M%S'),
+        'revision': revision,
+        'recorded': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cpus': os.cpu_count(),
+        'actions': args.actions,
+        'think_s': args.think,
+        'environment': {name: os.environ[name] for name in sorted(os.environ) if name.startswith('METRO_')},
+        'levels': results
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{report['label']}.json")
+    with open(path, 'w') as handle:
+        json.dump(report, handle, indent=1)
+    print(f'Results written to {path}')
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(report, json.load(handle))
+
+
+if __name__ == '__main__':
+    main()
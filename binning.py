@@ -0,0 +1,140 @@
+"""Population binning engine shared by the size-efficiency views and the filter panel."""
+import numpy as np
+import pandas as pd
+
+from sketches import KLLSketch
+
+# Bucketings used across the dashboard: name -> (edges, labels). Bins are right-closed like pd.cut.
+BUCKETINGS = {
+    'size_category': (
+        (0, 1_000_000, 5_000_000, 10_000_000, 50_000_000),
+        ('Small (<1M)', 'Medium (1-5M)', 'Large (5-10M)', 'Mega (>10M)')
+    ),
+    'size_trend': (
+        (0, 500_000, 1_000_000, 2_000_000, 5_000_000, 10_000_000, 50_000_000),
+        ('<500K', '500K-1M', '1M-2M', '2M-5M', '5M-10M', '>10M')
+    ),
+    'pop_filter': (
+        (0, 1_000_000, 5_000_000, 10_000_000, np.inf),
+        ('Small (<1M)', 'Medium (1-5M)', 'Large (5-10M)', 'Mega (>10M)')
+    )
+}
+
+
+def bin_range(bucketing, label):
+    """Return the (lower, upper] population bounds of one labelled bin."""
+    edges, labels = BUCKETINGS[bucketing] if isinstance(bucketing, str) else bucketing
+    i = list(labels).index(label)
+    return float(edges[i]), float(edges[i + 1])
+
+
+def bin_codes(values, bucketing):
+    """Return the bin code of every value (-1 = outside every bin) without sorting the values."""
+    edges, _ = BUCKETINGS[bucketing] if isinstance(bucketing, str) else bucketing
+    edges = np.asarray(edges, dtype=float)
+    # side='left' puts a value equal to an edge in the bin below it, so bins are right-closed
+    codes = np.searchsorted(edges, np.asarray(values, dtype=float), side='left') - 1
+    codes[codes >= len(edges) - 1] = -1
+    return codes
+
+
+class PopulationBinner:
+    """Sort a population column once and assign any edge set with searchsorted."""
+
+    def __init__(self, population, bucketings=None):
+        population = pd.Series(population)
+        values = population.to_numpy(dtype=float)
+        self.index = population.index
+        self.bucketings = dict(BUCKETINGS if bucketings is None else bucketings)
+        # NaN populations sort to the end and never fall inside a bin
+        self._order = np.argsort(values, kind='mergesort')
+        self._n_valid = int(np.count_nonzero(~np.isnan(values)))
+        self._sorted = values[self._order][:self._n_valid]
+        self._bounds = {}
+        self._codes = {}
+
+    def _resolve(self, bucketing):
+        if isinstance(bucketing, str):
+            edges, labels = self.bucketings[bucketing]
+        else:
+            edges, labels = bucketing
+        return tuple(float(e) for e in edges), tuple(labels)
+
+    def bounds(self, bucketing):
+        """Return slice boundaries of each bin within the sorted population."""
+        edges, _ = self._resolve(bucketing)
+        if edges not in self._bounds:
+            # side='right' gives right-closed (a, b] bins, matching pd.cut
+            self._bounds[edges] = np.searchsorted(self._sorted, edges, side='right')
+        return self._bounds[edges]
+
+    def codes(self, bucketing):
+        """Return per-row bin codes in the original row order (-1 = outside every bin)."""
+        edges, _ = self._resolve(bucketing)
+        if edges not in self._codes:
+            bounds = self.bounds(bucketing)
+            sorted_codes = np.full(len(self._order), -1, dtype=np.int64)
+            for i in range(len(edges) - 1):
+                sorted_codes[bounds[i]:bounds[i + 1]] = i
+            codes = np.empty_like(sorted_codes)
+            codes[self._order] = sorted_codes
+            self._codes[edges] = codes
+        return self._codes[edges]
+
+    def categorize(self, bucketing):
+        """Return the bin labels as a categorical Series aligned to the source index."""
+        _, labels = self._resolve(bucketing)
+        categories = pd.Categorical.from_codes(self.codes(bucketing), categories=list(labels), ordered=True)
+        return pd.Series(categories, index=self.index)
+
+    def mask(self, bucketing, selected):
+        """Return a boolean Series marking rows whose bin label is in `selected`."""
+        _, labels = self._resolve(bucketing)
+        wanted = [labels.index(label) for label in selected]
+        return pd.Series(np.isin(self.codes(bucketing), wanted), index=self.index)
+
+    def grouped_stats(self, frame, bucketings):
+        """Mean/median/std/count of every column in `frame` for each bucketing.
+
+        Rows of `frame` are aligned to the binned index (missing rows count as NaN), permuted
+        into population order once, and every bin of every bucketing is then a contiguous slice.
+        """
+        frame = pd.DataFrame(frame).reindex(self.index)
+        sorted_values = frame.to_numpy(dtype=float)[self._order][:self._n_valid]
+        columns = pd.MultiIndex.from_product([frame.columns, ['mean', 'median', 'std', 'count']])
+
+        results = {}
+        for bucketing in bucketings:
+            _, labels = self._resolve(bucketing)
+            bounds = self.bounds(bucketing)
+            rows = []
+            for i in range(len(labels)):
+                block = sorted_values[bounds[i]:bounds[i + 1]]
+                row = []
+                for j in range(block.shape[1]):
+                    column = block[:, j]
+                    column = column[~np.isnan(column)]
+                    n = len(column)
+                    row.extend([
+                        column.mean() if n else np.nan,
+                        np.median(column) if n else np.nan,
+                        column.std(ddof=1) if n > 1 else np.nan,
+                        n
+                    ])
+                rows.append(row)
+            stats = pd.DataFrame(rows, index=pd.Index(labels, name='bin'), columns=columns)
+            for column in frame.columns:
+                stats[(column, 'count')] = stats[(column, 'count')].astype(int)
+            key = bucketing if isinstance(bucketing, str) else labels
+            results[key] = stats
+        return results
+
+    def bin_sketches(self, values, bucketing, k=200):
+        """Return a quantile sketch of `values` for every bin of `bucketing`, keyed by label."""
+        _, labels = self._resolve(bucketing)
+        bounds = self.bounds(bucketing)
+        sorted_values = pd.Series(values).reindex(self.index).to_numpy(dtype=float)[self._order]
+        return {
+            label: KLLSketch(k=k).update(sorted_values[bounds[i]:bounds[i + 1]])
+            for i, label in enumerate(labels)
+        }
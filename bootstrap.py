@@ -0,0 +1,144 @@
+"""Bootstrap confidence intervals for group means, computed off the UI thread on a process pool."""
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+# Upper bound on the elements of one resampling index matrix, to cap per-call memory
+MAX_INDEX_ELEMENTS = 4_000_000
+
+
+def _bootstrap_batch(group_values, n_replicates, seed):
+    """Return a (groups x replicates) matrix of resampled means for one batch of replicates."""
+    rng = np.random.default_rng(seed)
+    means = np.full((len(group_values), n_replicates), np.nan)
+    for i, values in enumerate(group_values):
+        if len(values) == 0:
+            continue
+        # Many replicates per numpy call: each row of the index matrix is one resample
+        step = max(1, MAX_INDEX_ELEMENTS // len(values))
+        for start in range(0, n_replicates, step):
+            stop = min(start + step, n_replicates)
+            indices = rng.integers(0, len(values), size=(stop - start, len(values)))
+            means[i, start:stop] = values[indices].mean(axis=1)
+    return means
+
+
+def bootstrap_means(values, groups, n_boot=2000, confidence=0.95, batch_size=250, seed=0, executor=None):
+    """Percentile bootstrap CIs of the mean of `values` within each group.
+
+    Replicates are split into batches with independent seeds; batches run on `executor`
+    when one is given and serially otherwise, with identical results either way.
+    """
+    values = np.asarray(values, dtype=float)
+    codes, labels = pd.factorize(pd.Series(groups), sort=True)
+    keep = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[keep], codes[keep]
+    group_values = [values[codes == i] for i in range(len(labels))]
+
+    batches = [min(batch_size, n_boot - start) for start in range(0, n_boot, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    if executor is None:
+        results = [_bootstrap_batch(group_values, size, batch_seed) for size, batch_seed in zip(batches, seeds)]
+    else:
+        futures = [executor.submit(_bootstrap_batch, group_values, size, batch_seed) for size, batch_seed in zip(batches, seeds)]
+        results = [future.result() for future in futures]
+    replicates = np.concatenate(results, axis=1)
+
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid='ignore'):
+        ci_low, ci_high = np.nanquantile(replicates, [alpha, 1 - alpha], axis=1) if replicates.size else (np.nan, np.nan)
+    return pd.DataFrame({
+        'n': [len(group) for group in group_values],
+        'mean': [group.mean() if len(group) else np.nan for group in group_values],
+        'se': replicates.std(axis=1, ddof=1),
+        'ci_low': ci_low,
+        'ci_high': ci_high
+    }, index=labels)
+
+
+class BootstrapRunner:
+    """Run bootstrap jobs in the background and keep their results per cache key.
+
+    `result()` never blocks: it returns None until the job for a key has finished, so
+    callers can render without intervals first and pick them up on a later rerun. A job that
+    failed stays recorded: `error()` returns its exception, and it is not resubmitted until
+    `discard()` drops it.
+
+    Batches go to a process pool only when a job resamples at least `min_parallel_work`
+    values and more than one CPU is available. The whole dataset (about 900 metros at 2000
+    replicates, 1.8M values) resamples serially in under 20 ms, far less than starting spawn
+    workers, so with the default threshold the pool is off for this data and only starts for
+    datasets some 25 times larger.
+    """
+
+    def __init__(self, max_workers=None, cache_size=64, min_parallel_work=50_000_000):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.cache_size = cache_size
+        # Below this many resampled values, worker start-up costs more than it saves
+        self.min_parallel_work = min_parallel_work
+        self._dispatcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bootstrap')
+        self._pool = None
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _process_pool(self):
+        if self._pool is None and self.max_workers > 1:
+            # spawn keeps worker start-up independent of the server's threads
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _run(self, values, groups, options):
+        if len(values) * options.get('n_boot', 2000) < self.min_parallel_work:
+            return bootstrap_means(values, groups, executor=None, **options)
+        try:
+            return bootstrap_means(values, groups, executor=self._process_pool(), **options)
+        except (BrokenProcessPool, OSError):
+            # Fall back to the dispatcher thread when worker processes are unavailable
+            self._pool = None
+            return bootstrap_means(values, groups, executor=None, **options)
+
+    def submit(self, key, values, groups, **options):
+        """Start the job for `key` unless it is already running or cached; return its future."""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self._futures.move_to_end(key)
+                return future
+            # A copy of the groups that keeps their categorical order, which sets the seed each group gets,
+            # so a job draws the same intervals as bootstrap_means() called on the caller's groups
+            future = self._dispatcher.submit(self._run, np.asarray(values, dtype=float), pd.Series(groups).reset_index(drop=True), options)
+            self._futures[key] = future
+            while len(self._futures) > self.cache_size:
+                self._futures.popitem(last=False)
+            return future
+
+    def result(self, key, values, groups, **options):
+        """Return the finished CI frame for `key`, or None while it is being computed or after it failed."""
+        future = self.submit(key, values, groups, **options)
+        if not future.done() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def error(self, key):
+        """The exception the job for `key` failed with, or None while it runs, succeeded or was never submitted."""
+        with self._lock:
+            future = self._futures.get(key)
+        if future is None or not future.done():
+            return None
+        return future.exception()
+
+    def discard(self, key):
+        """Forget the job for `key`, so the next `submit()` runs it again."""
+        with self._lock:
+            self._futures.pop(key, None)
+
+    def shutdown(self):
+        self._dispatcher.shutdown(wait=False)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -0,0 +1,242 @@
+"""Named caches with LRU, TTL and byte limits, optional disk persistence and hit/miss counters.
+
+Every layer keeps its results in a namespace of its own:
+
+- ``data`` holds cleaned datasets.
+- ``analytics`` holds per-version and per-filter indexes and regressions.
+- ``figures`` holds encoded figure specs.
+- ``api`` holds the local API's per-filter results.
+
+`POLICIES` sets the limits of each namespace: at most ``max_entries`` values and
+``max_bytes`` bytes, and each value lives ``ttl`` seconds. Values over the limits are evicted
+least recently used first, and expired values are dropped when they are next read.
+
+Namespaces with ``persist`` also write their values to the result store
+(`results.ResultStore`, ``$METRO_CACHE_DIR/results.sqlite``) when that environment variable is
+set. They read values back from there after a restart or in another worker, subject to the
+same TTL, as long as the code version is unchanged. The store is pruned when a process first
+opens it: results of other code versions, and results older than ``STORE_MAX_AGE``, are
+deleted so the file does not grow without bound.
+
+`cached` wraps a function the way ``st.cache_resource`` does: arguments whose names start
+with an underscore are left out of the key, and callers pass a version or filter key that
+identifies them instead. `cache_stats` returns every namespace's counters for display.
+"""
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from results import ResultStore
+
+CachePolicy = namedtuple('CachePolicy', ['max_entries', 'max_bytes', 'ttl', 'persist'], defaults=[None, None, None, False])
+
+MB = 2 ** 20
+# Stored results of the current code version are kept this long; their keys include the data
+# version and filters, so entries for data that has since changed would otherwise stay forever
+STORE_MAX_AGE = 7 * 24 * 3600
+POLICIES = {
+    'data': CachePolicy(max_entries=4, persist=True),
+    'analytics': CachePolicy(max_entries=256, max_bytes=512 * MB, ttl=6 * 3600, persist=True),
+    'figures': CachePolicy(max_entries=512, max_bytes=64 * MB, persist=True),
+    'api': CachePolicy(max_entries=32, max_bytes=128 * MB),
+}
+DEFAULT_POLICY = CachePolicy(max_entries=128)
+_MISSING = object()
+
+
+def sizeof(value, _depth=0):
+    """Approximate bytes held by `value`: exact for frames, arrays and strings, estimated for objects."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if _depth > 3:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(key, _depth + 1) + sizeof(item, _depth + 1) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sizeof(item, _depth + 1) for item in value)
+    if hasattr(value, '__dict__'):
+        # Indexes and cubes: the frames and arrays they hold
+        return sys.getsizeof(value) + sizeof(vars(value), _depth + 1)
+    return sys.getsizeof(value)
+
+
+class NamespaceCache:
+    """One namespace: a thread-safe LRU of key -> value with its policy and counters.
+
+    `clock` returns the current time in seconds for TTLs; tests pass a fake one.
+    """
+
+    def __init__(self, name, policy=DEFAULT_POLICY, store=None, clock=time.time):
+        self.name = name
+        self.policy = policy
+        self.store = store if policy.persist else None
+        self.clock = clock
+        self.bytes = 0
+        self.hits = self.misses = self.disk_hits = 0
+        self.evictions = {'lru': 0, 'bytes': 0, 'ttl': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._computing = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, stored_at):
+        return self.policy.ttl is not None and self.clock() - stored_at > self.policy.ttl
+
+    def _drop(self, key, reason):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+        self.evictions[reason] += 1
+
+    def _read_disk(self, key):
+        if self.store is None:
+            return _MISSING
+        value = self.store.get(self.name, key, max_age=self.policy.ttl)
+        return _MISSING if value is None else value
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[2]):
+                self._drop(key, 'ttl')
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        value = self._read_disk(key)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.disk_hits += 1
+            self._store(key, value, write=False)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value, write=True)
+        return value
+
+    def _store(self, key, value, write):
+        if key in self._entries:
+            _, size, _ = self._entries.pop(key)
+            self.bytes -= size
+        size = sizeof(value)
+        self._entries[key] = (value, size, self.clock())
+        self.bytes += size
+        policy = self.policy
+        while policy.max_entries is not None and len(self._entries) > policy.max_entries:
+            self._drop(next(iter(self._entries)), 'lru')
+        # The newest value stays even when it alone is over the byte limit
+        while policy.max_bytes is not None and self.bytes > policy.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)), 'bytes')
+        if write and self.store is not None:
+            # Values that cannot be pickled (engine connections, locks) stay in memory only
+            self.store.put(self.name, key, value)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value of `key`, computing and storing it on a miss.
+
+        Concurrent callers asking for the same missing key wait for one computation.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            pending = self._computing.setdefault(key, threading.Lock())
+        with pending:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return entry[0]
+            try:
+                return self.put(key, compute())
+            finally:
+                with self._lock:
+                    self._computing.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'namespace': self.name,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else np.nan,
+            'evicted_lru': self.evictions['lru'],
+            'evicted_bytes': self.evictions['bytes'],
+            'expired': self.evictions['ttl'],
+        }
+
+
+_caches = {}
+_stores = {}
+_registry_lock = threading.Lock()
+
+
+def result_store():
+    """The result store under ``METRO_CACHE_DIR``, or None when persistence is off."""
+    directory = os.environ.get('METRO_CACHE_DIR')
+    if not directory:
+        return None
+    if directory not in _stores:
+        store = ResultStore(os.path.join(directory, 'results.sqlite'))
+        store.prune(max_age=STORE_MAX_AGE)
+        _stores[directory] = store
+    return _stores[directory]
+
+
+def cache(namespace):
+    """The process-wide cache of `namespace`, created with its policy on first use."""
+    with _registry_lock:
+        if namespace not in _caches:
+            policy = POLICIES.get(namespace, DEFAULT_POLICY)
+            _caches[namespace] = NamespaceCache(namespace, policy, result_store() if policy.persist else None)
+        return _caches[namespace]
+
+
+def cache_stats():
+    """Counters of every namespace in use, one row each."""
+    with _registry_lock:
+        caches = list(_caches.values())
+    return pd.DataFrame([namespace.stats() for namespace in caches], columns=[
+        'namespace', 'entries', 'bytes', 'hits', 'disk_hits', 'misses', 'hit_rate', 'evicted_lru', 'evicted_bytes', 'expired'
+    ])
+
+
+def cached(namespace):
+    """Decorator caching a function's results in `namespace`, keyed by its non-underscore arguments."""
+    def decorate(function):
+        signature = inspect.signature(function)
+        name = f'{function.__module__}.{function.__qualname__}'
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (name,) + tuple((argument, value) for argument, value in bound.arguments.items() if not argument.startswith('_'))
+            return cache(namespace).get_or_compute(key, lambda: function(*args, **kwargs))
+
+        return wrapper
+    return decorate
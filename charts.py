@@ -0,0 +1,1226 @@
+"""Figure builders for the dashboard's sections.
+
+Each builder takes the frames a section has already computed (rollup summaries, binned
+statistics, filtered metros) and returns a Plotly figure without touching Streamlit, so the
+dashboard and the headless report generator (`report.py`) draw identical figures.
+
+The `*_view` builders return the Altair charts drawn instead when METRO_AGGREGATE_RENDERER is
+'vega'. They are declared over metro rows and aggregated by `vega.evaluate` before sending.
+"""
+import altair as alt
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+
+def error_bars(ci, means):
+    """Return a Plotly error_y dict from bootstrap CIs aligned to the plotted means."""
+    return dict(
+        type='data',
+        symmetric=False,
+        array=np.asarray(ci['ci_high']) - np.asarray(means),
+        arrayminus=np.asarray(means) - np.asarray(ci['ci_low']),
+        color='#605E5C',
+        thickness=1.5
+    )
+
+
+def world_map(clusters, view=None):
+    """Bubbles for the map clusters of `geo.ClusterIndex.query`, drawn at the geo viewport `view`."""
+    largest_cluster = clusters['gdp'].max() if len(clusters) else np.nan
+    fig = go.Figure(go.Scattergeo(
+        lat=clusters['lat'],
+        lon=clusters['lon'],
+        hovertext=clusters['label'],
+        customdata=np.column_stack((clusters['top_metro'], clusters['gdp'], clusters['population'])),
+        hovertemplate='<b>%{hovertext}</b><br>Largest: %{customdata[0]}<br>GDP: $%{customdata[1]:,.1f} billion<br>Population: %{customdata[2]:,.0f}<br>GDP per Capita: $%{marker.color:,.0f}<extra></extra>',
+        marker=dict(
+            size=clusters['gdp'].fillna(1),
+            sizemode='area',
+            sizeref=2 * (largest_cluster if largest_cluster > 0 else 1) / 50 ** 2,
+            sizemin=3,
+            color=clusters['gdp_per_capita'].fillna(0),
+            colorscale='Viridis',
+            colorbar=dict(title='GDP per Capita'),
+            line=dict(width=0.5, color='white')
+        )
+    ))
+    map_geo = dict(
+        showland=True,
+        landcolor="rgb(217, 217, 217)",
+        coastlinecolor="white",
+        countrycolor="rgb(200, 200, 200)",
+        showocean=True,
+        oceancolor="rgb(237, 250, 255)"
+    )
+    if view:
+        # Redraw where the user left the map
+        map_geo.update(center=dict(lon=view['lon'], lat=view['lat']), projection=dict(scale=view['scale']))
+    fig.update_layout(
+        title="Metropolitan Areas by GDP and GDP per Capita",
+        height=600,
+        margin=dict(l=0, r=0, t=30, b=0),
+        geo=map_geo
+    )
+    return fig
+
+
+def metro_map(map_df):
+    """One bubble per metro, placed at its country, sized by GDP and colored by GDP per capita."""
+    fig = px.scatter_geo(
+        map_df,
+        locations="Country/Region",
+        locationmode="country names",
+        color="GDP_per_capita",
+        size="Official est. GDP(billion US$)",
+        hover_name="Metropolitian Area/City",
+        size_max=50,
+        color_continuous_scale="Viridis",
+        title="Metropolitan Areas by GDP and GDP per Capita",
+        hover_data={
+            "Country/Region": True,
+            "Official est. GDP(billion US$)": ":.1f",
+            "Metropolitian Population": ":,.0f",
+            "GDP_per_capita": ":$,.0f"
+        }
+    )
+    fig.update_layout(
+        height=600,
+        margin=dict(l=0, r=0, t=30, b=0),
+        geo=dict(
+            showland=True,
+            landcolor="rgb(217, 217, 217)",
+            coastlinecolor="white",
+            countrycolor="rgb(200, 200, 200)",
+            showocean=True,
+            oceancolor="rgb(237, 250, 255)"
+        )
+    )
+    return fig
+
+
+def globe_view(map_df):
+    """Orthographic globe of the metros with a rotation animation."""
+    fig = px.scatter_geo(
+        map_df,
+        locations="Country/Region",
+        locationmode="country names",
+        color="GDP_per_capita",
+        size="Official est. GDP(billion US$)",
+        hover_name="Metropolitian Area/City",
+        size_max=50,
+        color_continuous_scale="Plasma",
+        title="3D Globe View of Metropolitan Economies",
+        hover_data={
+            "Country/Region": True,
+            "Official est. GDP(billion US$)": ":.1f",
+            "Metropolitian Population": ":,.0f",
+            "GDP_per_capita": ":$,.0f"
+        },
+        projection="orthographic"
+    )
+    fig.update_layout(
+        height=600,
+        margin=dict(l=0, r=0, t=30, b=0),
+        geo=dict(
+            showland=True,
+            landcolor="rgb(217, 217, 217)",
+            countrycolor="rgb(200, 200, 200)",
+            showcountries=True,
+            showocean=True,
+            oceancolor="rgb(220, 240, 255)"
+        )
+    )
+    # Add animation for rotation
+    frames = []
+    for i in range(0, 361, 10):
+        frames.append(go.Frame(
+            layout=dict(
+                geo=dict(
+                    projection_rotation_lon=i
+                )
+            )
+        ))
+    fig.frames = frames
+
+    # Add animation buttons
+    animation_buttons = [
+        dict(
+            args=[None, {"frame": {"duration": 50, "redraw": True}, "fromcurrent": True}],
+            label="Play",
+            method="animate"
+        ),
+        dict(
+            args=[[None], {"frame": {"duration": 0, "redraw": True}, "mode": "immediate"}],
+            label="Pause",
+            method="animate"
+        )
+    ]
+    fig.update_layout(
+        updatemenus=[dict(
+            type="buttons",
+            showactive=False,
+            buttons=animation_buttons,
+            x=0.1,
+            y=0,
+            xanchor="right",
+            yanchor="top"
+        )]
+    )
+    return fig
+
+
+def bubble_chart(map_df):
+    """Population against GDP on log axes, bubbles sized by GDP per capita."""
+    fig = px.scatter(
+        map_df,
+        x="Metropolitian Population",
+        y="Official est. GDP(billion US$)",
+        size="GDP_per_capita",
+        color="Region",
+        hover_name="Metropolitian Area/City",
+        log_x=True,
+        log_y=True,
+        size_max=60,
+        color_discrete_sequence=px.colors.qualitative.Bold,
+        title="Metropolitan Population vs GDP (bubble size = GDP per capita)",
+        hover_data={
+            "Country/Region": True,
+            "GDP_per_capita": ":$,.0f"
+        }
+    )
+    fig.update_layout(
+        height=600,
+        xaxis_title="Metropolitan Population (log scale)",
+        yaxis_title="GDP in billions USD (log scale)"
+    )
+    return fig
+
+
+def top_bar_chart(top_metros_df, sort_measure, sort_label, top_text_template):
+    """Horizontal bars of the top metros by `sort_measure`."""
+    fig = px.bar(
+        top_metros_df,
+        x=sort_measure,
+        y='Metropolitian Area/City',
+        color='Region',
+        orientation='h',
+        color_discrete_sequence=px.colors.qualitative.Bold,
+        title=f"Top 15 Metropolitan Areas by {sort_label}",
+        hover_data={
+            "Country/Region": True,
+            "Official est. GDP(billion US$)": ":.1f",
+            "Metropolitian Population": ":,.0f",
+            "GDP_per_capita": ":$,.0f"
+        },
+        text=sort_measure
+    )
+    fig.update_layout(
+        height=600, 
+        yaxis={'categoryorder':'total ascending'},
+        xaxis_title=sort_label,
+        yaxis_title="",
+        bargap=0.2
+    )
+    fig.update_traces(
+        texttemplate=top_text_template, 
+        textposition='outside'
+    )
+    return fig
+
+
+def top_radar_chart(top_metros_df):
+    """Radar of the first five top metros, each metric scaled to the largest of them."""
+    top_5 = top_metros_df.head(5)
+
+    # Normalize metrics for radar chart
+    metrics = ['GDP_per_capita', 'Official est. GDP(billion US$)', 'Metropolitian Population']
+
+    # Create a copy to avoid modifying the original
+    radar_df = top_5.copy()
+
+    # Normalize each metric to a 0-100 scale for radar chart
+    for metric in metrics:
+        max_val = radar_df[metric].max()
+        radar_df[f'{metric}_normalized'] = (radar_df[metric] / max_val) * 100
+
+    # Create radar chart using plotly
+    fig = go.Figure()
+
+    for i, row in radar_df.iterrows():
+        fig.add_trace(go.Scatterpolar(
+            r=[
+                row['GDP_per_capita_normalized'],
+                row['Official est. GDP(billion US$)_normalized'],
+                row['Metropolitian Population_normalized']
+            ],
+            theta=['GDP per Capita', 'Total GDP', 'Population'],
+            fill='toself',
+            name=row['Metropolitian Area/City']
+        ))
+
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 100]
+            )
+        ),
+        height=600,
+        title="Top 5 Metropolitan Areas - Key Metrics Comparison"
+    )
+    return fig
+
+
+def top_treemap(tree, sort_label, top_text_template):
+    """Treemap of the top metros grouped by region, from `RollupCube.hierarchy`."""
+    fig = go.Figure(go.Treemap(
+        ids=tree['id'],
+        labels=tree['label'],
+        parents=tree['parent'],
+        values=tree['value'],
+        branchvalues='total',
+        marker=dict(colors=tree['color'], colorscale='Viridis', showscale=True, colorbar=dict(title=sort_label)),
+        customdata=tree[['country']],
+        hovertemplate='<b>%{label}</b><br>Country/Region: %{customdata[0]}<br>' + sort_label + ': ' + top_text_template.replace('text', 'value') + '<extra></extra>'
+    ))
+    fig.update_layout(height=600, title="Top Performers Grouped by Region")
+    fig.update_traces(textinfo="label+value")
+    return fig
+
+
+def size_scatter(scatter_df):
+    """Population against GDP per capita with the overall log-log OLS trend."""
+    fig = px.scatter(
+        scatter_df,
+        x='Metropolitian Population',
+        y='GDP_per_capita',
+        color='Region',
+        size='Official est. GDP(billion US$)',
+        hover_name='Metropolitian Area/City',
+        log_x=True,
+        log_y=True,
+        size_max=60,
+        opacity=0.7,
+        color_discrete_sequence=px.colors.qualitative.Bold,
+        title="Population vs. GDP per Capita (log scales)",
+        hover_data={
+            "Country/Region": True,
+            "Official est. GDP(billion US$)": ":.1f",
+            "Metropolitian Population": ":,.0f",
+            "GDP_per_capita": ":$,.0f"
+        }
+    )
+
+    # Add trendline
+    trendline = px.scatter(
+        scatter_df,
+        x='Metropolitian Population',
+        y='GDP_per_capita',
+        log_x=True,
+        log_y=True,
+        trendline="ols",
+        trendline_scope="overall",
+        trendline_color_override="red"
+    )
+
+    # Add trendline trace to main figure
+    for trace in trendline.data:
+        if trace.mode == 'lines':
+            trace.name = "Regression Trend"
+            trace.line.width = 3
+            fig.add_trace(trace)
+
+    # Add annotation for optimal city size range
+    fig.add_shape(
+        type="rect",
+        x0=1_000_000, 
+        y0=fig.data[0].y.min(), 
+        x1=5_000_000, 
+        y1=fig.data[0].y.max(),
+        line=dict(color="rgba(0,200,0,0.3)", width=2),
+        fillcolor="rgba(0,200,0,0.1)",
+        layer="below"
+    )
+
+    fig.add_annotation(
+        x=2_500_000,
+        y=fig.data[0].y.max() * 0.8,
+        text="Optimal City Size Range",
+        showarrow=True,
+        arrowhead=1,
+        arrowcolor="green",
+        font=dict(color="green")
+    )
+
+    fig.update_layout(
+        height=600,
+        xaxis_title="Metropolitan Population (log scale)",
+        yaxis_title="GDP per Capita USD (log scale)",
+        legend_title="Region"
+    )
+    return fig
+
+
+def size_distribution(scatter_df, category_counts):
+    """Box plot of GDP per capita per size category, with the metro count above each box."""
+    fig = px.box(
+        scatter_df,
+        x='Population Size Category',
+        y='GDP_per_capita',
+        color='Population Size Category',
+        title="GDP per Capita Distribution by Metropolitan Size",
+        points="all",
+        hover_name='Metropolitian Area/City',
+        hover_data={
+            "Country/Region": True,
+            "Official est. GDP(billion US$)": ":.1f",
+            "Metropolitian Population": ":,.0f",
+            "GDP_per_capita": ":$,.0f"
+        }
+    )
+
+    fig.update_layout(
+        height=600,
+        xaxis_title="Metropolitan Size Category",
+        yaxis_title="GDP per Capita (USD)",
+        showlegend=False
+    )
+
+    # Add sample size above each box
+    for label, count in category_counts.items():
+        if count > 0:
+            fig.add_annotation(
+                x=label,
+                y=1.02,
+                yref="paper",
+                text=f"n={count}",
+                showarrow=False,
+                font=dict(size=10)
+            )
+    return fig
+
+
+def size_histogram_view(scatter_df):
+    """Histogram of GDP per capita stacked by size category; only the bin counts are sent."""
+    size_labels = list(scatter_df['Population Size Category'].cat.categories)
+    return alt.Chart(scatter_df[['GDP_per_capita', 'Population Size Category']]).mark_bar().encode(
+        x=alt.X('GDP_per_capita:Q', bin=alt.Bin(maxbins=40), title='GDP per Capita (USD)'),
+        y=alt.Y('count():Q', title='Number of Metros'),
+        color=alt.Color('Population Size Category:N', sort=size_labels, title='Metropolitan Size Category'),
+        tooltip=['Population Size Category:N', alt.Tooltip('count():Q', title='Metros')]
+    ).transform_filter(
+        alt.FieldValidPredicate(field='GDP_per_capita', valid=True)
+    ).properties(title='GDP per Capita Distribution by Metropolitan Size', height=600)
+
+
+def size_efficiency_view(trend_rows, trend_labels, trend_ci=None):
+    """`size_efficiency_chart` over the metro rows of `trend_rows` (Population_Size, GDP_per_capita, Population)."""
+    size_axis = alt.X('Population_Size:N', sort=trend_labels, title='Metropolitan Population Size')
+    trend_base = alt.Chart(trend_rows).transform_filter(alt.FieldValidPredicate(field='Population_Size', valid=True))
+    statistics = ['Mean', 'Median', 'Population-weighted Mean']
+    layers = [
+        trend_base.transform_aggregate(
+            mean='mean(GDP_per_capita)', std='stdev(GDP_per_capita)', groupby=['Population_Size']
+        ).transform_calculate(
+            low='datum.mean - datum.std', high='datum.mean + datum.std'
+        ).mark_area(color='#0078D4', opacity=0.2).encode(
+            x=size_axis, y=alt.Y('low:Q', title='GDP per Capita (USD)'), y2='high:Q'
+        ),
+        trend_base.transform_calculate(
+            weighted='datum.GDP_per_capita * datum.Population'
+        ).transform_aggregate(
+            Mean='mean(GDP_per_capita)', Median='median(GDP_per_capita)', weighted='sum(weighted)',
+            population='sum(Population)', count='count()', groupby=['Population_Size']
+        ).transform_calculate(
+            **{'Population-weighted Mean': 'datum.weighted / datum.population'}
+        ).transform_fold(
+            statistics, as_=['Statistic', 'GDP per Capita']
+        ).mark_line(point=True, strokeWidth=3).encode(
+            x=size_axis,
+            y='GDP per Capita:Q',
+            color=alt.Color('Statistic:N', scale=alt.Scale(domain=statistics, range=['#0078D4', '#107C10', '#D83B01'])),
+            strokeDash=alt.StrokeDash('Statistic:N', scale=alt.Scale(domain=statistics, range=[[1, 0], [8, 4], [2, 2]])),
+            tooltip=['Population_Size:N', 'Statistic:N', alt.Tooltip('GDP per Capita:Q', format='$,.0f'), alt.Tooltip('count:Q', title='Metros')]
+        )
+    ]
+    if trend_ci is not None:
+        layers.append(alt.Chart(trend_ci.rename_axis('Population_Size').reset_index()).mark_rule(color='#605E5C', strokeWidth=1.5).encode(
+            x=size_axis, y='ci_low:Q', y2='ci_high:Q'
+        ))
+    return alt.layer(*layers).properties(title='City Size vs. Economic Efficiency Analysis', height=600)
+
+
+def size_efficiency_chart(size_efficiency, trend_ci=None):
+    """Mean, median and population-weighted mean GDP per capita across size bins."""
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatter(
+        x=size_efficiency['Population_Size'],
+        y=size_efficiency['Mean_GDP_Per_Capita'],
+        mode='lines+markers',
+        name='Mean GDP per Capita',
+        line=dict(color='#0078D4', width=3),
+        marker=dict(size=10),
+        error_y=error_bars(trend_ci.reindex(size_efficiency['Population_Size']), size_efficiency['Mean_GDP_Per_Capita']) if trend_ci is not None else None
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=size_efficiency['Population_Size'],
+        y=size_efficiency['Median_GDP_Per_Capita'],
+        mode='lines+markers',
+        name='Median GDP per Capita',
+        line=dict(color='#107C10', width=3, dash='dash'),
+        marker=dict(size=10)
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=size_efficiency['Population_Size'],
+        y=size_efficiency['Weighted_Mean_GDP_Per_Capita'],
+        mode='lines+markers',
+        name='Population-weighted Mean',
+        line=dict(color='#D83B01', width=2, dash='dot'),
+        marker=dict(size=8, symbol='diamond')
+    ))
+
+    # Add error bars using standard deviation
+    fig.add_trace(go.Scatter(
+        x=size_efficiency['Population_Size'],
+        y=size_efficiency['Mean_GDP_Per_Capita'] + size_efficiency['Std_GDP_Per_Capita'],
+        mode='lines',
+        line=dict(width=0),
+        showlegend=False
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=size_efficiency['Population_Size'],
+        y=size_efficiency['Mean_GDP_Per_Capita'] - size_efficiency['Std_GDP_Per_Capita'],
+        mode='lines',
+        line=dict(width=0),
+        fill='tonexty',
+        fillcolor='rgba(0, 120, 212, 0.2)',
+        name='Std Deviation'
+    ))
+
+    # Add sample size as text
+    for i, row in size_efficiency.iterrows():
+        fig.add_annotation(
+            x=row['Population_Size'],
+            y=row['Mean_GDP_Per_Capita'] + row['Std_GDP_Per_Capita'] + 5000,
+            text=f"n={row['Count']}",
+            showarrow=False,
+            font=dict(size=10)
+        )
+
+    fig.update_layout(
+        title="City Size vs. Economic Efficiency Analysis",
+        xaxis_title="Metropolitan Population Size",
+        yaxis_title="GDP per Capita (USD)",
+        height=600,
+        hovermode="x unified",
+        plot_bgcolor='rgba(246,248,250,0.8)',
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def scaling_chart(scaling_fits):
+    """Forest plot of per-group scaling exponents with their confidence intervals."""
+    fig = go.Figure(go.Scatter(
+        x=scaling_fits['slope'],
+        y=scaling_fits.index,
+        mode='markers',
+        marker=dict(
+            size=10,
+            color=scaling_fits['r_squared'],
+            colorscale='Blues',
+            line=dict(width=1, color='#0078D4'),
+            showscale=True,
+            colorbar=dict(title='R²')
+        ),
+        error_x=dict(
+            type='data',
+            symmetric=False,
+            array=scaling_fits['ci_high'] - scaling_fits['slope'],
+            arrayminus=scaling_fits['slope'] - scaling_fits['ci_low'],
+            color='#605E5C'
+        ),
+        customdata=np.column_stack((scaling_fits['n'], scaling_fits['r_squared'], scaling_fits['p_value'], scaling_fits['se_slope'])),
+        hovertemplate='<b>%{y}</b><br>Exponent: %{x:.3f} ± %{customdata[3]:.3f}<br>R²: %{customdata[1]:.3f}<br>p-value: %{customdata[2]:.4f}<br>Metros: %{customdata[0]}<extra></extra>'
+    ))
+
+    fig.add_shape(
+        type='line',
+        x0=0, x1=0,
+        y0=-0.5, y1=len(scaling_fits) - 0.5,
+        line=dict(color='#D83B01', width=1.5, dash='dash')
+    )
+
+    fig.update_layout(
+        title='Scaling Exponents: log(GDP per Capita) ~ log(Population), 95% CI',
+        xaxis_title='Exponent (elasticity of GDP per capita to population)',
+        yaxis_title='',
+        height=max(450, 28 * len(scaling_fits)),
+        plot_bgcolor='rgba(246,248,250,0.8)',
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def regional_comparison(regional_summary, region_ci=None):
+    """Mean GDP per capita per region against the population-weighted figure."""
+    fig = go.Figure()
+
+    # Add bar chart for Mean GDP per capita
+    fig.add_trace(go.Bar(
+        x=regional_summary['Region'],
+        y=regional_summary['Mean_GDP_per_capita'],
+        name='Mean GDP per Capita',
+        marker_color='#0078D4',
+        error_y=error_bars(region_ci.reindex(regional_summary['Region']), regional_summary['Mean_GDP_per_capita']) if region_ci is not None else None,
+        hovertemplate='<b>%{x}</b><br>Mean GDP per Capita: $%{y:,.0f}<br>Median GDP per Capita: $%{customdata[1]:,.0f}<br>IQR: $%{customdata[2]:,.0f}<br>Metro Count: %{customdata[0]}<extra></extra>',
+        customdata=np.column_stack((regional_summary['Metro_Count'], regional_summary['Median_GDP_per_capita'], regional_summary['IQR_GDP_per_capita']))
+    ))
+
+    # Add line for population-weighted GDP per capita (economic efficiency)
+    fig.add_trace(go.Scatter(
+        x=regional_summary['Region'],
+        y=regional_summary['Weighted_Mean_GDP_per_capita'],
+        mode='lines+markers',
+        name='Population-weighted GDP per Capita',
+        yaxis='y2',
+        line=dict(color='#107C10', width=3),
+        marker=dict(size=10, symbol='diamond'),
+        hovertemplate='<b>%{x}</b><br>Population-weighted GDP per Capita: $%{y:,.0f}<br>Weighted Median: $%{customdata[2]:,.0f}<br>Total GDP: $%{customdata[0]:,.0f} billion<extra></extra>',
+        customdata=np.column_stack((regional_summary['Total_GDP'], regional_summary['Total_Population'], regional_summary['Weighted_Median_GDP_per_capita']))
+    ))
+
+    # Update layout with dual y-axes
+    fig.update_layout(
+        title='Regional Economic Performance',
+        xaxis=dict(title='Region', tickangle=45),
+        yaxis=dict(
+            title='Mean GDP per Capita (USD)',
+            side='left',
+            showgrid=True
+        ),
+        yaxis2=dict(
+            title='Population-weighted GDP per Capita (USD)',
+            side='right',
+            overlaying='y',
+            showgrid=False
+        ),
+        height=600,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="center",
+            x=0.5
+        ),
+        hovermode='closest',
+        plot_bgcolor='rgba(246,248,250,0.8)',
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def regional_performance_view(region_rows, region_order, region_ci=None):
+    """`regional_comparison` over the metro rows of `region_rows`, with regions in `region_order`."""
+    region_axis = alt.X('Region:N', sort=region_order, title='Region', axis=alt.Axis(labelAngle=-45))
+    region_base = alt.Chart(region_rows[['Region', 'GDP_per_capita', 'Metropolitian Population']])
+    layers = [
+        region_base.mark_bar(color='#0078D4').encode(
+            x=region_axis,
+            y=alt.Y('mean(GDP_per_capita):Q', title='GDP per Capita (USD)'),
+            tooltip=[
+                'Region:N',
+                alt.Tooltip('mean(GDP_per_capita):Q', title='Mean GDP per Capita', format='$,.0f'),
+                alt.Tooltip('median(GDP_per_capita):Q', title='Median GDP per Capita', format='$,.0f'),
+                alt.Tooltip('count():Q', title='Metro Count')
+            ]
+        ),
+        region_base.transform_calculate(
+            weighted='datum.GDP_per_capita * datum["Metropolitian Population"]'
+        ).transform_aggregate(
+            weighted='sum(weighted)', population='sum(Metropolitian Population)', groupby=['Region']
+        ).transform_calculate(
+            weighted_mean='datum.weighted / datum.population'
+        ).mark_line(color='#107C10', strokeWidth=3, point=alt.OverlayMarkDef(color='#107C10', shape='diamond', size=100)).encode(
+            x=region_axis,
+            y='weighted_mean:Q',
+            tooltip=['Region:N', alt.Tooltip('weighted_mean:Q', title='Population-weighted GDP per Capita', format='$,.0f')]
+        )
+    ]
+    if region_ci is not None:
+        layers.append(alt.Chart(region_ci.rename_axis('Region').reset_index()).mark_rule(color='#605E5C', strokeWidth=1.5).encode(
+            x=region_axis, y='ci_low:Q', y2='ci_high:Q'
+        ))
+    return alt.layer(*layers).properties(
+        title=alt.TitleParams('Regional Economic Performance', subtitle='Bars: mean GDP per capita. Line: population-weighted GDP per capita.'),
+        height=600
+    )
+
+
+def regional_composition(sunburst_df):
+    """Sunburst of regional GDP by its largest metros, from `RollupCube.sunburst`."""
+    fig = px.sunburst(
+        sunburst_df,
+        path=['Region', 'Metro'],
+        values='GDP',
+        color='GDP_per_capita',
+        color_continuous_scale='Blues',
+        title='Regional GDP Composition by Metropolitan Areas',
+        hover_data=['Population', 'GDP_per_capita'],
+        custom_data=['Population', 'GDP_per_capita']
+    )
+
+    fig.update_traces(
+        hovertemplate='<b>%{label}</b><br>GDP: $%{value:.1f} billion<br>Population: %{customdata[0]:,.0f}<br>GDP per Capita: $%{customdata[1]:,.0f}<extra></extra>'
+    )
+
+    fig.update_layout(
+        height=600,
+        margin=dict(t=50, l=0, r=0, b=0),
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def regional_matrix(regional_summary):
+    """Regions placed by normalized total GDP and normalized GDP per capita."""
+    regional_summary = regional_summary.copy()
+    # Calculate normalized metrics
+    regional_summary['Normalized_GDP_per_capita'] = (regional_summary['Mean_GDP_per_capita'] - regional_summary['Mean_GDP_per_capita'].min()) / (regional_summary['Mean_GDP_per_capita'].max() - regional_summary['Mean_GDP_per_capita'].min())
+    regional_summary['Normalized_Total_GDP'] = (regional_summary['Total_GDP'] - regional_summary['Total_GDP'].min()) / (regional_summary['Total_GDP'].max() - regional_summary['Total_GDP'].min())
+    regional_summary['Size'] = regional_summary['Metro_Count'] * 20 + 20  # Scale the size for visualization
+
+    # Create the quadrant chart
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatter(
+        x=regional_summary['Normalized_Total_GDP'],
+        y=regional_summary['Normalized_GDP_per_capita'],
+        mode='markers+text',
+        marker=dict(
+            size=regional_summary['Size'],
+            color=regional_summary['Normalized_GDP_per_capita'],
+            colorscale='Blues',
+            line=dict(width=2, color='#0078D4'),
+            showscale=True,
+            colorbar=dict(title='Normalized GDP per Capita')
+        ),
+        text=regional_summary['Region'],
+        textposition='top center',
+        hovertemplate='<b>%{text}</b><br>GDP per Capita: $%{customdata[0]:,.0f}<br>Total GDP: $%{customdata[1]:,.0f} billion<br>Metros: %{customdata[2]}<extra></extra>',
+        customdata=np.column_stack((
+            regional_summary['Mean_GDP_per_capita'],
+            regional_summary['Total_GDP'],
+            regional_summary['Metro_Count']
+        ))
+    ))
+
+    # Add quadrant lines
+    fig.add_shape(
+        type='line',
+        x0=0.5, y0=0, x1=0.5, y1=1,
+        line=dict(color='#605E5C', width=1, dash='dash')
+    )
+
+    fig.add_shape(
+        type='line',
+        x0=0, y0=0.5, x1=1, y1=0.5,
+        line=dict(color='#605E5C', width=1, dash='dash')
+    )
+
+    # Add quadrant labels
+    fig.add_annotation(x=0.25, y=0.75, text="High Efficiency<br>Low Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
+    fig.add_annotation(x=0.75, y=0.75, text="High Efficiency<br>High Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
+    fig.add_annotation(x=0.25, y=0.25, text="Low Efficiency<br>Low Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
+    fig.add_annotation(x=0.75, y=0.25, text="Low Efficiency<br>High Total GDP", showarrow=False, font=dict(size=10, color='#252525'))
+
+    fig.update_layout(
+        title='Regional Economic Performance Matrix',
+        xaxis=dict(
+            title='Normalized Total GDP (Economic Scale)',
+            showgrid=True,
+            zeroline=True,
+            range=[-0.05, 1.05]
+        ),
+        yaxis=dict(
+            title='Normalized GDP per Capita (Economic Efficiency)',
+            showgrid=True,
+            zeroline=True,
+            range=[-0.05, 1.05]
+        ),
+        height=600,
+        plot_bgcolor='rgba(246,248,250,0.8)',
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def region_countries_chart(country_summary, drill_region):
+    """Countries of one region by mean GDP per capita."""
+    fig = px.bar(
+        country_summary.sort_values('Mean_GDP_per_capita'),
+        x='Mean_GDP_per_capita',
+        y='Country/Region',
+        orientation='h',
+        color='Total_GDP',
+        color_continuous_scale='Blues',
+        title=f'Countries in {drill_region} by Mean GDP per Capita',
+        custom_data=['Metro_Count', 'Median_GDP_per_capita', 'Total_GDP']
+    )
+    fig.update_traces(
+        hovertemplate='<b>%{y}</b><br>Mean GDP per Capita: $%{x:,.0f}<br>Median GDP per Capita: $%{customdata[1]:,.0f}<br>Metros: %{customdata[0]}<br>Total GDP: $%{customdata[2]:,.1f} billion<extra></extra>'
+    )
+    fig.update_layout(
+        height=max(400, 30 * len(country_summary)),
+        xaxis_title='Mean GDP per Capita (USD)',
+        yaxis_title='',
+        coloraxis_colorbar=dict(title='Total GDP (billions)'),
+        plot_bgcolor='rgba(246,248,250,0.8)',
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def country_metros_chart(country_metros, drill_country):
+    """Metros of one country by GDP per capita."""
+    fig = px.bar(
+        country_metros.sort_values('GDP_per_capita'),
+        x='GDP_per_capita',
+        y='Metropolitian Area/City',
+        orientation='h',
+        color='Official est. GDP(billion US$)',
+        color_continuous_scale='Viridis',
+        title=f'Metropolitan Areas in {drill_country}',
+        hover_data={
+            "Official est. GDP(billion US$)": ":.1f",
+            "Metropolitian Population": ":,.0f",
+            "GDP_per_capita": ":$,.0f"
+        }
+    )
+    fig.update_layout(
+        height=max(400, 30 * len(country_metros)),
+        xaxis_title='GDP per Capita (USD)',
+        yaxis_title='',
+        plot_bgcolor='rgba(246,248,250,0.8)',
+        paper_bgcolor='rgba(246,248,250,0)'
+    )
+    return fig
+
+
+def outlier_scatter(clean_df, gdp_per_capita_q25, gdp_per_capita_q75):
+    """Metros colored by GDP-per-capita z-score, with the high and low performer zones."""
+    fig = px.scatter(
+        clean_df, 
+        x='Metropolitian Population', 
+        y='GDP_per_capita',
+        size='Official est. GDP(billion US$)',
+        color='z_score',
+        color_continuous_scale='RdBu_r',
+        range_color=[-3, 3],
+        hover_name='Metropolitian Area/City',
+        hover_data={
+            'Metropolitian Population': ':,',
+            'GDP_per_capita': ':$,.0f',
+            'Official est. GDP(billion US$)': ':.1f',
+            'z_score': ':.2f',
+            'Region': True
+        },
+        labels={
+            'Metropolitian Population': 'Metropolitan Population',
+            'GDP_per_capita': 'GDP per Capita (US$)',
+            'Official est. GDP(billion US$)': 'GDP (billion US$)',
+            'z_score': 'Z-Score'
+        }
+    )
+
+    # Update layout
+    fig.update_layout(
+        title='Economic Outliers by Z-Score',
+        height=500,
+        plot_bgcolor='rgba(240, 242, 246, 0.8)',
+        paper_bgcolor='rgba(240, 242, 246, 0.0)',
+        font=dict(family="Segoe UI, sans-serif", color="#252525"),
+        margin=dict(l=20, r=20, t=50, b=20),
+        coloraxis_colorbar=dict(
+            title="Z-Score",
+            tickvals=[-3, -2, 0, 2, 3],
+            ticktext=["Strong Underperformer", "Underperformer", "Average", "Overperformer", "Strong Overperformer"]
+        ),
+        xaxis=dict(
+            type='log',
+            title_font=dict(size=14, color="#252525"),
+            tickfont=dict(size=12, color="#252525"),
+            gridcolor='rgba(220, 220, 220, 0.8)',
+            zerolinecolor='rgba(220, 220, 220, 0.8)'
+        ),
+        yaxis=dict(
+            type='log',
+            title_font=dict(size=14, color="#252525"),
+            tickfont=dict(size=12, color="#252525"),
+            gridcolor='rgba(220, 220, 220, 0.8)',
+            zerolinecolor='rgba(220, 220, 220, 0.8)'
+        )
+    )
+
+    # Add outlier zones
+    fig.add_shape(
+        type="rect",
+        x0=clean_df['Metropolitian Population'].min() * 0.8,
+        y0=gdp_per_capita_q75 * 1.5,
+        x1=clean_df['Metropolitian Population'].max() * 1.2,
+        y1=clean_df['GDP_per_capita'].max() * 1.2,
+        line=dict(color="#0078D4", width=1, dash="dot"),
+        fillcolor="rgba(0, 120, 212, 0.1)",
+    )
+
+    fig.add_shape(
+        type="rect",
+        x0=clean_df['Metropolitian Population'].min() * 0.8,
+        y0=clean_df['GDP_per_capita'].min() * 0.8,
+        x1=clean_df['Metropolitian Population'].max() * 1.2,
+        y1=gdp_per_capita_q25 * 0.5,
+        line=dict(color="#D83B01", width=1, dash="dot"),
+        fillcolor="rgba(216, 59, 1, 0.1)",
+    )
+
+    # Add annotations for outlier zones
+    fig.add_annotation(
+        x=clean_df['Metropolitian Population'].median(),
+        y=clean_df['GDP_per_capita'].max() * 0.95,
+        text="High Performers",
+        showarrow=False,
+        font=dict(size=14, color="#0078D4", family="Segoe UI, sans-serif"),
+        bgcolor="rgba(255, 255, 255, 0.7)",
+        bordercolor="#0078D4",
+        borderwidth=1,
+        borderpad=4
+    )
+
+    fig.add_annotation(
+        x=clean_df['Metropolitian Population'].median(),
+        y=clean_df['GDP_per_capita'].min() * 1.05,
+        text="Low Performers",
+        showarrow=False,
+        font=dict(size=14, color="#D83B01", family="Segoe UI, sans-serif"),
+        bgcolor="rgba(255, 255, 255, 0.7)",
+        bordercolor="#D83B01",
+        borderwidth=1,
+        borderpad=4
+    )
+    return fig
+
+
+def outlier_zscores(outliers_high, outliers_low):
+    """Z-scores of the outliers on both sides."""
+    combined_outliers = pd.concat([outliers_high, outliers_low])
+
+    fig = px.bar(
+        combined_outliers.sort_values('z_score'), 
+        y='Metropolitian Area/City',
+        x='z_score',
+        color='z_score',
+        color_continuous_scale='RdBu_r',
+        range_color=[-3, 3],
+        text='GDP_per_capita',
+        hover_data={
+            'GDP_per_capita': ':$,.0f',
+            'Metropolitian Population': ':,',
+            'Official est. GDP(billion US$)': ':.1f'
+        },
+        labels={
+            'Metropolitian Area/City': 'Metropolitan Area',
+            'z_score': 'Z-Score (GDP per Capita)',
+            'GDP_per_capita': 'GDP per Capita (US$)'
+        }
+    )
+
+    # Update layout
+    fig.update_layout(
+        title='Z-Score Analysis of Outliers',
+        plot_bgcolor='rgba(240, 242, 246, 0.8)',
+        paper_bgcolor='rgba(240, 242, 246, 0.0)',
+        height=600,
+        margin=dict(l=20, r=20, t=50, b=20),
+        font=dict(family="Segoe UI, sans-serif", color="#252525"),
+        xaxis=dict(
+            title_font=dict(size=14, color="#252525"),
+            tickfont=dict(size=12, color="#252525"),
+            gridcolor='rgba(220, 220, 220, 0.8)',
+            zerolinecolor='#605E5C'
+        ),
+        yaxis=dict(
+            title=None,
+            tickfont=dict(size=12, color="#252525")
+        )
+    )
+
+    # Format text
+    fig.update_traces(
+        texttemplate='$%{text:,.0f}',
+        textposition='outside'
+    )
+
+    # Add a vertical line at z=0
+    fig.add_shape(
+        type="line",
+        x0=0, y0=-0.5,
+        x1=0, y1=len(combined_outliers) - 0.5,
+        line=dict(color="#605E5C", width=1.5, dash="solid")
+    )
+
+    # Add z-score interpretation bands
+    fig.add_shape(
+        type="rect",
+        x0=2, y0=-0.5,
+        x1=5, y1=len(combined_outliers) - 0.5,
+        line=dict(color="rgba(0,0,0,0)"),
+        fillcolor="rgba(0, 120, 212, 0.1)",
+        layer="below"
+    )
+
+    fig.add_shape(
+        type="rect",
+        x0=-5, y0=-0.5,
+        x1=-2, y1=len(combined_outliers) - 0.5,
+        line=dict(color="rgba(0,0,0,0)"),
+        fillcolor="rgba(216, 59, 1, 0.1)",
+        layer="below"
+    )
+    return fig
+
+
+def outlier_quadrants(clean_df, outliers_high, outliers_low, random_state=None):
+    """Outliers and a sample of typical metros placed by normalized size and GDP per capita.
+
+    `random_state` fixes which typical metros are sampled, for output that is the same on every run.
+    """
+    clean_df = clean_df.copy()
+    # Normalize GDP per capita and population for plotting
+    clean_df['gdp_per_capita_norm'] = (clean_df['GDP_per_capita'] - clean_df['GDP_per_capita'].min()) / (clean_df['GDP_per_capita'].max() - clean_df['GDP_per_capita'].min())
+    clean_df['pop_norm'] = (clean_df['Metropolitian Population'] - clean_df['Metropolitian Population'].min()) / (clean_df['Metropolitian Population'].max() - clean_df['Metropolitian Population'].min())
+
+    # Identify quadrant for each city
+    clean_df['quadrant'] = 'Average'
+    clean_df.loc[(clean_df['gdp_per_capita_norm'] > 0.5) & (clean_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Efficient'
+    clean_df.loc[(clean_df['gdp_per_capita_norm'] > 0.5) & (clean_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Efficient'
+    clean_df.loc[(clean_df['gdp_per_capita_norm'] < 0.5) & (clean_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Less Efficient'
+    clean_df.loc[(clean_df['gdp_per_capita_norm'] < 0.5) & (clean_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Less Efficient'
+
+    # Filter outliers for chart
+    typical_df = clean_df[(clean_df['z_score'] <= 2) & (clean_df['z_score'] >= -2)]
+    quadrant_df = pd.concat([
+        outliers_high,
+        outliers_low,
+        typical_df.sample(min(20, len(typical_df)), random_state=random_state)
+    ])
+
+    # Apply the same normalization to the filtered dataframe
+    quadrant_df['gdp_per_capita_norm'] = (quadrant_df['GDP_per_capita'] - clean_df['GDP_per_capita'].min()) / (clean_df['GDP_per_capita'].max() - clean_df['GDP_per_capita'].min())
+    quadrant_df['pop_norm'] = (quadrant_df['Metropolitian Population'] - clean_df['Metropolitian Population'].min()) / (clean_df['Metropolitian Population'].max() - clean_df['Metropolitian Population'].min())
+
+    # Set quadrant
+    quadrant_df['quadrant'] = 'Average'
+    quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] > 0.5) & (quadrant_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Efficient'
+    quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] > 0.5) & (quadrant_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Efficient'
+    quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] < 0.5) & (quadrant_df['pop_norm'] > 0.5), 'quadrant'] = 'Large & Less Efficient'
+    quadrant_df.loc[(quadrant_df['gdp_per_capita_norm'] < 0.5) & (quadrant_df['pop_norm'] < 0.5), 'quadrant'] = 'Small & Less Efficient'
+
+    # Create scatter plot
+    fig = px.scatter(
+        quadrant_df,
+        x='pop_norm',
+        y='gdp_per_capita_norm',
+        color='z_score',
+        size='Official est. GDP(billion US$)',
+        hover_name='Metropolitian Area/City',
+        color_continuous_scale='RdBu_r',
+        range_color=[-3, 3],
+        hover_data={
+            'gdp_per_capita_norm': False,
+            'pop_norm': False,
+            'GDP_per_capita': ':$,.0f',
+            'Metropolitian Population': ':,',
+            'quadrant': True,
+            'z_score': ':.2f'
+        },
+        labels={
+            'pop_norm': 'Population Size (normalized)',
+            'gdp_per_capita_norm': 'GDP per Capita (normalized)',
+            'z_score': 'Z-Score'
+        }
+    )
+
+    # Update layout
+    fig.update_layout(
+        title='Performance Quadrants Analysis',
+        height=600,
+        plot_bgcolor='rgba(240, 242, 246, 0.8)',
+        paper_bgcolor='rgba(240, 242, 246, 0.0)',
+        font=dict(family="Segoe UI, sans-serif", color="#252525"),
+        margin=dict(l=20, r=20, t=50, b=20),
+        coloraxis_colorbar=dict(
+            title="Z-Score",
+            tickvals=[-3, -2, 0, 2, 3],
+            ticktext=["Strong Underperformer", "Underperformer", "Average", "Overperformer", "Strong Overperformer"]
+        )
+    )
+
+    # Add quadrant lines
+    fig.add_shape(
+        type="line",
+        x0=0.5, y0=0,
+        x1=0.5, y1=1,
+        line=dict(color="#605E5C", width=1, dash="dash")
+    )
+
+    fig.add_shape(
+        type="line",
+        x0=0, y0=0.5,
+        x1=1, y1=0.5,
+        line=dict(color="#605E5C", width=1, dash="dash")
+    )
+
+    # Add quadrant annotations
+    fig.add_annotation(
+        x=0.25, y=0.75,
+        text="Small & Efficient",
+        showarrow=False,
+        font=dict(size=12, color="#0078D4", family="Segoe UI, sans-serif"),
+        bgcolor="rgba(255, 255, 255, 0.7)",
+        bordercolor="#0078D4",
+        borderwidth=1,
+        borderpad=2
+    )
+
+    fig.add_annotation(
+        x=0.75, y=0.75,
+        text="Large & Efficient",
+        showarrow=False,
+        font=dict(size=12, color="#0078D4", family="Segoe UI, sans-serif"),
+        bgcolor="rgba(255, 255, 255, 0.7)",
+        bordercolor="#0078D4",
+        borderwidth=1,
+        borderpad=2
+    )
+
+    fig.add_annotation(
+        x=0.25, y=0.25,
+        text="Small & Less Efficient",
+        showarrow=False,
+        font=dict(size=12, color="#D83B01", family="Segoe UI, sans-serif"),
+        bgcolor="rgba(255, 255, 255, 0.7)",
+        bordercolor="#D83B01",
+        borderwidth=1,
+        borderpad=2
+    )
+
+    fig.add_annotation(
+        x=0.75, y=0.25,
+        text="Large & Less Efficient",
+        showarrow=False,
+        font=dict(size=12, color="#D83B01", family="Segoe UI, sans-serif"),
+        bgcolor="rgba(255, 255, 255, 0.7)",
+        bordercolor="#D83B01",
+        borderwidth=1,
+        borderpad=2
+    )
+    return fig
+
+
+def peer_comparison(comparison_df, peer_city):
+    """A metro next to its nearest peers by GDP per capita."""
+    fig = px.bar(
+        comparison_df.sort_values('GDP_per_capita'),
+        x='GDP_per_capita',
+        y='Metropolitian Area/City',
+        color='Role',
+        orientation='h',
+        color_discrete_map={'Selected': '#D83B01', 'Peer': '#0078D4'},
+        hover_data={
+            'Country/Region': True,
+            'GDP_per_capita': ':$,.0f',
+            'Metropolitian Population': ':,.0f',
+            'Official est. GDP(billion US$)': ':.1f',
+            'Distance': ':.3f',
+            'Role': False
+        },
+        labels={'GDP_per_capita': 'GDP per Capita (US$)'}
+    )
+    fig.update_layout(
+        title=f'{peer_city} vs. Nearest Peers by Size and Output',
+        height=max(400, 28 * len(comparison_df)),
+        yaxis_title='',
+        plot_bgcolor='rgba(240, 242, 246, 0.8)',
+        paper_bgcolor='rgba(240, 242, 246, 0.0)',
+        font=dict(family="Segoe UI, sans-serif", color="#252525")
+    )
+    return fig
+
+
+def region_growth_chart(region_growth, start_year, end_year):
+    """Growth of GDP, GDP per capita and population per region between two vintages."""
+    fig = go.Figure()
+    for column, label, color in [
+        ('GDP_growth', 'Total GDP', '#0078D4'),
+        ('GDP_per_capita_growth', 'GDP per Capita', '#107C10'),
+        ('Population_growth', 'Population', '#D83B01')
+    ]:
+        fig.add_trace(go.Bar(
+            x=region_growth['Region'],
+            y=region_growth[column],
+            name=label,
+            marker_color=color,
+            hovertemplate='%{x}<br>' + label + ': %{y:.1f}%<extra></extra>'
+        ))
+    fig.update_layout(
+        barmode='group',
+        title=f"Regional Growth, {start_year} to {end_year}",
+        yaxis_title="Growth (%)",
+        height=450,
+        plot_bgcolor='rgba(240, 242, 246, 0.8)',
+        paper_bgcolor='rgba(240, 242, 246, 0.0)',
+        font=dict(family="Segoe UI, sans-serif", color="#252525")
+    )
+    return fig
+
+
+def metro_growth_chart(growth_extremes):
+    """The fastest and slowest growing metros by annualized GDP per capita."""
+    fig = px.bar(
+        growth_extremes.sort_values('GDP_per_capita_cagr'),
+        x='GDP_per_capita_cagr',
+        y='Metropolitian Area/City',
+        color='GDP_per_capita_cagr',
+        orientation='h',
+        color_continuous_scale='RdBu',
+        color_continuous_midpoint=0,
+        hover_data={'Country/Region': True, 'GDP_growth': ':.1f', 'Population_growth': ':.1f'},
+        labels={'GDP_per_capita_cagr': 'GDP per Capita CAGR (%)', 'GDP_growth': 'GDP Growth (%)', 'Population_growth': 'Population Growth (%)'},
+        title="Fastest and Slowest Growing Metros (annualized GDP per capita)"
+    )
+    fig.update_layout(height=600, yaxis_title="")
+    return fig
+
+
+def rank_movers_chart(movers, sort_label, start_year, end_year):
+    """The metros that gained or lost the most places in a ranking."""
+    fig = px.bar(
+        movers.sort_values('Rank_change'),
+        x='Rank_change',
+        y='Metropolitian Area/City',
+        color='Rank_change',
+        orientation='h',
+        color_continuous_scale='RdYlGn',
+        color_continuous_midpoint=0,
+        hover_data={'Country/Region': True, 'Rank_start': True, 'Rank_end': True},
+        labels={'Rank_change': 'Places Gained', 'Rank_start': f'Rank {start_year}', 'Rank_end': f'Rank {end_year}'},
+        title=f"Biggest Movers in the {sort_label} Ranking, {start_year} to {end_year}"
+    )
+    fig.update_layout(height=600, yaxis_title="")
+    return fig
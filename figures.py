@@ -0,0 +1,330 @@
+"""Compact transport for Plotly figures.
+
+`render_figure` draws figures with `st.plotly_chart` by default, which keeps Streamlit's theme
+and loads plotly.js once per page. Before a figure is sent, `compact_figure` keeps only the
+customdata columns its templates reference and sends a per-point style that is the same for
+every point (text position, marker size, color, opacity or line) as a single value.
+
+With transport 'binary', `encode_figure` turns a figure into a spec whose numeric arrays are base64 typed arrays
+(float32, or int32 for whole numbers) in the ``{dtype, bdata, shape}`` layout plotly.js uses
+for typed-array specs, and label arrays with many repeats (countries, regions) become a
+category list plus typed codes. Only the customdata columns a trace's templates reference are kept, an
+array used by several traces is sent once and referenced by position, and a stock template
+is replaced by its name and fetched by the browser from plotly's package data, where it is
+cached across figures and reruns.
+
+Streamlit's own template carries placeholder colors that only its frontend fills in. Figures
+built with it are sent with plotly's stock template and the placeholders resolved to plotly's
+defaults, which is how `st.plotly_chart(..., theme=None)` draws them.
+
+Such a spec is drawn in a small component that decodes it with the plotly.js shipped in the
+plotly package. The component's directory, with its own copy of plotly.min.js and the stock
+templates, is assembled under the temp directory on first use, so the page loads them by
+relative URL. Each component chart is its own iframe and loads plotly.js again, so this
+transport is opt-in. A map drawn with ``viewport=True`` always uses the component, which
+reports the map's geo center and projection scale back as its value whenever the user pans
+or zooms it.
+
+What is sent is cached in the ``figures`` namespace under a key the caller builds from what
+the figure is drawn from (data version, filter panel, the figure's own inputs), so a rerun
+that changes none of them neither builds nor serializes the figure. Asked to measure,
+`render_figure` also reports the payload size next to the Plotly JSON of the untouched figure.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import plotly
+import plotly.io as pio
+import plotly.utils
+import streamlit as st
+import streamlit.components.v1 as components
+
+from cache import cache
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'figure')
+PLOTLY_DIR = os.path.join(os.path.dirname(plotly.__file__), 'package_data')
+# Shorter arrays are left as JSON lists; a typed-array spec would not be smaller
+MIN_TYPED_LENGTH = 16
+
+FigurePayload = namedtuple('FigurePayload', ['name', 'json_bytes', 'compact_bytes'])
+
+# Per-point styles that may be given as one value for the whole trace
+POINT_STYLES = {
+    (): ['textposition', 'hovertemplate', 'texttemplate'],
+    ('marker',): ['size', 'opacity', 'symbol', 'color'],
+    ('marker', 'line'): ['width', 'color']
+}
+
+_renderer = None
+
+_CUSTOMDATA = re.compile(r'customdata\[(\d+)\]')
+_stock_templates = {}
+
+# Streamlit template placeholders -> plotly defaults: categorical, sequential (plasma) and
+# diverging (PiYG) colors, waterfall colors, then grays and backgrounds
+STREAMLIT_PLACEHOLDERS = dict(zip(
+    [f'#{i:06d}' for i in range(1, 41)],
+    ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52',
+     '#0d0887', '#46039f', '#7201a8', '#9c179e', '#bd3786', '#d8576b', '#ed7953', '#fb9f3a', '#fdca26', '#f0f921',
+     '#8e0152', '#c51b7d', '#de77ae', '#f1b6da', '#fde0ef', '#f7f7f7', '#e6f5d0', '#b8e186', '#7fbc41', '#4d9221', '#276419',
+     '#3D9970', '#FF4136', '#4499FF',
+     '#cccccc', '#444444', '#2a3f5f', '#ffffff', '#ebebeb', '#f7f7f7']
+))
+_PLACEHOLDER = re.compile('|'.join(STREAMLIT_PLACEHOLDERS))
+
+
+def _stock_template(template):
+    """Name of the stock template equal to `template`, or None; Streamlit's maps to 'plotly'."""
+    if not _stock_templates:
+        for name in os.listdir(os.path.join(PLOTLY_DIR, 'templates')):
+            name = os.path.splitext(name)[0]
+            _stock_templates[name] = pio.templates[name].to_plotly_json()
+        if 'streamlit' in pio.templates:
+            _stock_templates['streamlit'] = pio.templates['streamlit'].to_plotly_json()
+    for name, stock in _stock_templates.items():
+        if template == stock:
+            return name
+    return None
+
+
+def _templates(trace):
+    return [key for key, value in trace.items() if key.endswith('template') and isinstance(value, str)]
+
+
+def project_customdata(trace):
+    """Keep only the customdata columns the trace's templates use, renumbering the references."""
+    if 'customdata' not in trace:
+        return trace
+    keys = _templates(trace)
+    used = sorted({int(i) for key in keys for i in _CUSTOMDATA.findall(trace[key])})
+    trace = dict(trace)
+    if not used:
+        # customdata only ever surfaces through templates
+        del trace['customdata']
+        return trace
+    customdata = np.asarray(trace['customdata'], dtype=object)
+    if customdata.ndim == 1:
+        customdata = customdata[:, None]
+    if used == list(range(customdata.shape[1])):
+        return trace
+    renumber = {old: new for new, old in enumerate(used)}
+    trace['customdata'] = customdata[:, used]
+    for key in keys:
+        trace[key] = _CUSTOMDATA.sub(lambda match: f'customdata[{renumber[int(match.group(1))]}]', trace[key])
+    return trace
+
+
+def _constant(values):
+    """The single value of a per-point array whose entries are all equal, or None."""
+    if not isinstance(values, (list, tuple, np.ndarray)) or len(values) < 2:
+        return None
+    first = values[0]
+    if isinstance(first, (list, tuple, dict, np.ndarray)) or first is None:
+        return None
+    if isinstance(first, float) and np.isnan(first):
+        return None
+    if all(isinstance(value, type(first)) and value == first for value in values[1:]):
+        return first.item() if isinstance(first, np.generic) else first
+    return None
+
+
+def collapse_point_styles(trace):
+    """Replace per-point styles that repeat one value for every point by that value."""
+    trace = dict(trace)
+    for path, keys in POINT_STYLES.items():
+        parents = [trace]
+        for name in path:
+            child = parents[-1].get(name)
+            if not isinstance(child, dict):
+                break
+            parents.append(dict(child))
+        else:
+            node = parents[-1]
+            for key in keys:
+                value = _constant(node.get(key))
+                # A numeric color is a colorscale position, which only means something as an array
+                if value is None or (key == 'color' and not isinstance(value, str)):
+                    continue
+                node[key] = value
+            for name, parent, child in zip(reversed(path), reversed(parents[:-1]), reversed(parents[1:])):
+                parent[name] = child
+    return trace
+
+
+def _typed(values):
+    """Typed-array spec for a numeric array, or None when it should stay a JSON list."""
+    if values.size < MIN_TYPED_LENGTH:
+        return None
+    if values.dtype == object:
+        # Lists and customdata may mix numbers with labels or flags; only all-number ones are typed
+        if any(isinstance(item, (str, bool, np.bool_)) or item is None for item in values.ravel()):
+            return None
+        try:
+            values = values.astype(float)
+        except (TypeError, ValueError):
+            return None
+    if values.dtype.kind not in 'iuf':
+        return None
+    finite = values[np.isfinite(values)] if values.dtype.kind == 'f' else values
+    limits = np.iinfo(np.int32)
+    if np.array_equal(finite, np.round(finite)) and len(finite) == values.size and (
+            len(finite) == 0 or (finite.min() >= limits.min and finite.max() <= limits.max)):
+        dtype, encoded = 'i4', values.astype('<i4')
+    else:
+        dtype, encoded = 'f4', values.astype('<f4')
+    spec = {'dtype': dtype, 'bdata': base64.b64encode(encoded.tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        spec['shape'] = ', '.join(map(str, values.shape))
+    return spec
+
+
+def _categorical(values):
+    """Category list plus typed codes for a 1-d label array that repeats its values, or None."""
+    if values.ndim != 1 or values.size < MIN_TYPED_LENGTH or not all(isinstance(item, str) for item in values):
+        return None
+    categories, codes = np.unique(values.astype(str), return_inverse=True)
+    if len(categories) > values.size // 2:
+        return None
+    return {'categories': categories.tolist(), 'codes': _typed(codes.astype(np.int32))}
+
+
+class _ArrayTable:
+    """Arrays sent once per figure and referenced from traces as {"$array": position}."""
+
+    def __init__(self):
+        self.arrays = []
+        self._positions = {}
+
+    def add(self, value):
+        digest = hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+        if digest not in self._positions:
+            self._positions[digest] = len(self.arrays)
+            self.arrays.append(value)
+        return {'$array': self._positions[digest]}
+
+    def encode(self, node):
+        if isinstance(node, dict):
+            return {key: self.encode(value) for key, value in node.items()}
+        if isinstance(node, (list, tuple)):
+            if any(isinstance(item, (dict, list, tuple, np.ndarray)) for item in node):
+                # Nested structures such as colorscales, annotations or menu arguments
+                return [self.encode(item) for item in node]
+            node = np.asarray(node, dtype=object)
+        if isinstance(node, np.ndarray):
+            spec = _typed(node)
+            if spec is None and node.dtype.kind in 'OU':
+                spec = _categorical(node)
+            if spec is not None:
+                return self.add(spec)
+            listed = json.loads(json.dumps(node, cls=plotly.utils.PlotlyJSONEncoder))
+            return self.add(listed) if node.size >= MIN_TYPED_LENGTH else listed
+        return json.loads(json.dumps(node, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def json_size(fig):
+    """Bytes of the JSON text `st.plotly_chart` sends for `fig`."""
+    return len(json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8'))
+
+
+def encode_figure(fig):
+    """Return the compact spec of a Plotly figure: projected, typed and deduplicated."""
+    figure = fig.to_dict() if hasattr(fig, 'to_dict') else dict(fig)
+    layout = dict(figure.get('layout', {}))
+    template = layout.pop('template', None)
+    table = _ArrayTable()
+    spec = {
+        'data': [table.encode(project_customdata(trace)) for trace in figure.get('data', [])],
+        'layout': table.encode(layout)
+    }
+    spec['arrays'] = table.arrays
+    if template is None:
+        return spec
+    name = _stock_template(template)
+    if name is None:
+        spec['layout']['template'] = table.encode(template)
+    elif name != 'streamlit':
+        spec['template'] = name
+    else:
+        spec['template'] = 'plotly'
+        # Typed arrays are base64, which has no '#', so only color strings can match
+        spec = json.loads(_PLACEHOLDER.sub(lambda match: STREAMLIT_PLACEHOLDERS[match.group(0)], json.dumps(spec)))
+    return spec
+
+
+def figure_name(fig):
+    title = fig.layout.title.text if hasattr(fig, 'layout') else None
+    if title:
+        return title
+    return ', '.join(sorted({trace.type for trace in fig.data})) if hasattr(fig, 'data') else 'figure'
+
+
+def _compact_spec(fig, viewport):
+    spec = encode_figure(fig)
+    if viewport:
+        spec['viewport'] = True
+    return json.dumps(spec, separators=(',', ':'))
+
+
+def _plotly_figure(fig):
+    figure = fig.to_dict() if hasattr(fig, 'to_dict') else dict(fig)
+    figure['data'] = [collapse_point_styles(project_customdata(trace)) for trace in figure.get('data', [])]
+    return figure
+
+
+def compact_figure(build, key, transport='json', viewport=False):
+    """What `render_figure` sends for the figure `build()` returns, cached under `key`.
+
+    That is the trimmed figure dict for `st.plotly_chart`, or the encoded spec text for the
+    figure component with transport 'binary' or `viewport`. `key` names the figure and
+    everything it is drawn from, so `build` only runs when that combination is new.
+    """
+    if transport == 'binary' or viewport:
+        return cache('figures').get_or_compute(('compact', key, viewport), lambda: _compact_spec(build(), viewport))
+    return cache('figures').get_or_compute(('plotly', key), lambda: _plotly_figure(build()))
+
+
+def _component():
+    """The figure component, declared on first use from a directory holding its own plotly.js."""
+    global _renderer
+    if _renderer is None:
+        path = os.path.join(tempfile.gettempdir(), f'metro-figure-{plotly.__version__}')
+        os.makedirs(path, exist_ok=True)
+        shutil.copyfile(os.path.join(STATIC_DIR, 'index.html'), os.path.join(path, 'index.html'))
+        bundle = os.path.join(PLOTLY_DIR, 'plotly.min.js')
+        copy = os.path.join(path, 'plotly.min.js')
+        if not os.path.exists(copy) or os.path.getsize(copy) != os.path.getsize(bundle):
+            # Copied rather than linked: Streamlit only serves files that resolve inside the directory
+            shutil.copyfile(bundle, copy)
+        shutil.copytree(os.path.join(PLOTLY_DIR, 'templates'), os.path.join(path, 'templates'), dirs_exist_ok=True)
+        _renderer = components.declare_component('figure', path=path)
+    return _renderer
+
+
+def render_figure(build, cache_key, key=None, transport='json', viewport=False, measure=False):
+    """Draw the figure `build()` returns across the page width.
+
+    The figure is cached under `cache_key` (see `compact_figure`). With transport 'json' the
+    trimmed figure goes through `st.plotly_chart`; 'binary' sends the typed, deduplicated
+    spec to the figure component. With `viewport` the component is always used, and its
+    value, read from ``st.session_state[key]``, is the ``{lon, lat, scale}`` of the geo map
+    after the user last moved it. With `measure` the figure is built and serialized to
+    return its FigurePayload; otherwise None is returned.
+    """
+    sent = compact_figure(build, cache_key, transport, viewport)
+    component = transport == 'binary' or viewport
+    if component:
+        _component()(spec=sent, key=key, default=None)
+    else:
+        # The dict keeps NaN gaps as floats, which plotly validates; its JSON text would have nulls
+        st.plotly_chart(sent, use_container_width=True)
+    if not measure:
+        return None
+    fig = build()
+    return FigurePayload(figure_name(fig), json_size(fig), len(sent.encode('utf-8')) if component else json_size(sent))
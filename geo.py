@@ -0,0 +1,213 @@
+"""Zoom-level clusters of metro positions for the world map.
+
+Positions come from latitude/longitude columns when the dataset has them, and otherwise from
+the bundled country centroid table (``country_centroids.csv``). Positions are projected to Web
+Mercator and bucketed into a quadtree of square cells: at zoom ``z`` the world is
+``2**z * CELLS_PER_TILE`` cells across, so each cell at one zoom is the union of four cells at
+the next. Clusters are built once per dataset version, bottom-up from the finest level by
+merging children into parents, and every level is kept sorted by cell so a viewport query
+reads only the cell columns it covers. The map therefore draws at most one marker per visible
+cell, however many metros there are.
+
+Clusters only help when metros have positions of their own. Metros placed at their country's
+centroid share one point, so their clusters never split below country level at any zoom;
+`per_metro_positions` tells the two cases apart, and without per-metro positions the map
+draws one marker per metro instead.
+"""
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from metro_data import CITY, COUNTRY, GDP, POPULATION
+from weighted import per_capita
+
+CENTROIDS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'country_centroids.csv')
+# Column pairs accepted as per-metro coordinates, in order of preference
+COORDINATE_COLUMNS = [('Latitude', 'Longitude'), ('latitude', 'longitude'), ('Lat', 'Lon'), ('lat', 'lon'), ('lat', 'lng')]
+MAX_ZOOM = 12
+# Cluster cells per tile side; with 256-pixel tiles a cell is about 64 pixels wide
+CELLS_PER_TILE = 4
+# Zoom of a Plotly geo map at projection scale 1 (the whole world across a ~800 pixel figure)
+BASE_ZOOM = 2
+LAT_LIMIT = 85.05112878
+
+CLUSTER_COLUMNS = ['cx', 'cy', 'count', 'gdp', 'population', 'x_sum', 'y_sum', 'top', 'top_gdp']
+
+
+def mercator(lat, lon):
+    """Web Mercator position of each coordinate in the unit square (y grows southwards)."""
+    lat = np.clip(np.asarray(lat, dtype=float), -LAT_LIMIT, LAT_LIMIT)
+    x = (np.asarray(lon, dtype=float) + 180) / 360
+    y = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) / (2 * np.pi)
+    return x, y
+
+
+def inverse_mercator(x, y):
+    """Latitude and longitude of unit-square Mercator positions."""
+    lon = np.asarray(x, dtype=float) * 360 - 180
+    lat = np.degrees(2 * np.arctan(np.exp((0.5 - np.asarray(y, dtype=float)) * 2 * np.pi)) - np.pi / 2)
+    return lat, lon
+
+
+def load_centroids(path=CENTROIDS_CSV):
+    centroids = pd.read_csv(path)
+    return centroids.set_index(COUNTRY)[['Latitude', 'Longitude']]
+
+
+def metro_coordinates(df, centroids=None):
+    """Latitude, longitude and source ('metro' or 'centroid') of every row of `df`.
+
+    Rows without coordinates of their own are placed at their country's centroid; countries
+    missing from the centroid table get NaN and are left off the map.
+    """
+    if centroids is None:
+        centroids = load_centroids()
+    fallback = centroids.reindex(df[COUNTRY])
+    lat, lon = fallback['Latitude'].to_numpy(), fallback['Longitude'].to_numpy()
+    source = np.full(len(df), 'centroid', dtype=object)
+    for lat_column, lon_column in COORDINATE_COLUMNS:
+        if lat_column in df.columns and lon_column in df.columns:
+            own_lat = pd.to_numeric(df[lat_column], errors='coerce').to_numpy()
+            own_lon = pd.to_numeric(df[lon_column], errors='coerce').to_numpy()
+            known = ~(np.isnan(own_lat) | np.isnan(own_lon))
+            lat, lon = np.where(known, own_lat, lat), np.where(known, own_lon, lon)
+            source[known] = 'metro'
+            break
+    return lat, lon, source
+
+
+def per_metro_positions(df, centroids=None):
+    """Whether every metro of `df` that can be placed has coordinates of its own."""
+    lat, lon, source = metro_coordinates(df, centroids)
+    placed = ~(np.isnan(lat) | np.isnan(lon))
+    return bool(placed.any()) and bool((source[placed] == 'metro').all())
+
+
+def view_query(view):
+    """(zoom, bounds) of a Plotly geo viewport {lon, lat, scale}; no view means the whole world.
+
+    Bounds are (west, south, east, north) in degrees with a margin, so clusters just outside
+    the visible area are already there when the map is panned a little.
+    """
+    if not view:
+        return BASE_ZOOM, None
+    scale = max(float(view.get('scale') or 1), 1.0)
+    zoom = BASE_ZOOM + int(round(math.log2(scale)))
+    if scale <= 1:
+        return zoom, None
+    half_lon, half_lat = 1.25 * 180 / scale, 1.25 * 90 / scale
+    lon, lat = float(view.get('lon') or 0), float(view.get('lat') or 0)
+    if 2 * half_lon >= 360:
+        # The margin already spans every longitude; wrapping it would leave a narrow strip
+        west, east = -180.0, 180.0
+    else:
+        west = (lon - half_lon + 180) % 360 - 180
+        east = (lon + half_lon + 180) % 360 - 180
+    return zoom, (west, max(lat - half_lat, -90), east, min(lat + half_lat, 90))
+
+
+def _clusters(cx, cy, gdp, population, x, y, positions):
+    """One cluster per distinct (cx, cy) cell, sorted by cell."""
+    frame = pd.DataFrame({
+        'cx': cx, 'cy': cy, 'count': 1, 'gdp': gdp, 'population': population,
+        'x_sum': x, 'y_sum': y, 'top': positions, 'top_gdp': np.nan_to_num(gdp, nan=-np.inf)
+    })
+    return _merge(frame, ['cx', 'cy'])
+
+
+def _merge(frame, keys):
+    # The largest metro of a cluster names it; order by GDP first so 'first' picks it
+    frame = frame.sort_values('top_gdp', ascending=False, kind='mergesort')
+    grouped = frame.groupby(keys, sort=True)
+    merged = grouped[['count', 'gdp', 'population', 'x_sum', 'y_sum']].sum(min_count=1)
+    merged['count'] = merged['count'].astype(np.int64)
+    merged[['top', 'top_gdp']] = grouped[['top', 'top_gdp']].first()
+    return merged.reset_index()[CLUSTER_COLUMNS]
+
+
+class ClusterIndex:
+    """Quadtree clusters of metro positions for every zoom level from 0 to `max_zoom`."""
+
+    def __init__(self, df, centroids=None, max_zoom=MAX_ZOOM):
+        lat, lon, source = metro_coordinates(df, centroids)
+        placed = ~(np.isnan(lat) | np.isnan(lon))
+        self.max_zoom = max_zoom
+        self.names = df[CITY].to_numpy()
+        self.placed = placed
+        self.unplaced = int((~placed).sum())
+        self.own_coordinates = int((source[placed] == 'metro').sum())
+        # Centroid positions stack every metro of a country on one point
+        self.per_metro = bool(placed.any()) and self.own_coordinates == int(placed.sum())
+
+        x, y = mercator(lat[placed], lon[placed])
+        cells = 2 ** max_zoom * CELLS_PER_TILE
+        self._positions = np.flatnonzero(placed)
+        self._x, self._y = x, y
+        self._cx = np.clip((x * cells).astype(np.int64), 0, cells - 1)
+        self._cy = np.clip((y * cells).astype(np.int64), 0, cells - 1)
+        self._gdp = pd.to_numeric(df[GDP], errors='coerce').to_numpy(dtype=float)[placed]
+        self._population = pd.to_numeric(df[POPULATION], errors='coerce').to_numpy(dtype=float)[placed]
+
+        # Finest level from the rows, then each coarser level merges four children into a parent
+        clusters = _clusters(self._cx, self._cy, self._gdp, self._population, x, y, self._positions)
+        self.levels = {}
+        for zoom in range(max_zoom, -1, -1):
+            self.levels[zoom] = clusters
+            parents = clusters.assign(cx=clusters['cx'] // 2, cy=clusters['cy'] // 2)
+            clusters = _merge(parents, ['cx', 'cy'])
+
+    def _cell_range(self, zoom, bounds):
+        """Cell column ranges and the row range covering `bounds` at `zoom`."""
+        west, south, east, north = bounds
+        cells = 2 ** zoom * CELLS_PER_TILE
+        (x_west, x_east), (y_north, y_south) = [
+            np.clip((np.asarray(values) * cells).astype(np.int64), 0, cells - 1)
+            for values in mercator([north, south], [west, east])
+        ]
+        # A viewport across the antimeridian covers two column ranges
+        columns = [(x_west, x_east)] if x_west <= x_east else [(x_west, cells - 1), (0, x_east)]
+        return columns, (y_north, y_south)
+
+    def query(self, zoom, bounds=None, mask=None):
+        """Clusters at `zoom` inside `bounds` (west, south, east, north), of the rows where `mask` is set.
+
+        Without a mask the precomputed level is read; with one, the masked rows are
+        clustered at that zoom alone.
+        """
+        zoom = int(min(max(zoom, 0), self.max_zoom))
+        if mask is None:
+            clusters = self.levels[zoom]
+        else:
+            keep = np.asarray(mask, dtype=bool)[self._positions]
+            shift = self.max_zoom - zoom
+            clusters = _clusters(
+                self._cx[keep] >> shift, self._cy[keep] >> shift, self._gdp[keep], self._population[keep],
+                self._x[keep], self._y[keep], self._positions[keep]
+            )
+        if bounds is not None:
+            columns, (y_north, y_south) = self._cell_range(zoom, bounds)
+            cx = clusters['cx'].to_numpy()
+            # Levels are sorted by column, so each column range is one contiguous slice
+            parts = [clusters.iloc[np.searchsorted(cx, first, 'left'):np.searchsorted(cx, last, 'right')] for first, last in columns]
+            clusters = pd.concat(parts) if len(parts) > 1 else parts[0]
+            clusters = clusters[clusters['cy'].between(y_north, y_south)]
+        return self._describe(clusters)
+
+    def _describe(self, clusters):
+        count = clusters['count'].to_numpy()
+        lat, lon = inverse_mercator(clusters['x_sum'].to_numpy() / count, clusters['y_sum'].to_numpy() / count)
+        top = self.names[clusters['top'].to_numpy(dtype=np.int64)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gdp_per_capita = per_capita(clusters['gdp'].to_numpy(), clusters['population'].to_numpy())
+        return pd.DataFrame({
+            'lat': lat,
+            'lon': lon,
+            'count': count,
+            'gdp': clusters['gdp'].to_numpy(),
+            'population': clusters['population'].to_numpy(),
+            'gdp_per_capita': gdp_per_capita,
+            'top_metro': top,
+            'label': np.where(count == 1, top, [f'{n:,} metros' for n in count])
+        })
@@ -0,0 +1,81 @@
+"""Helpers describing the cleaned metro dataset."""
+import hashlib
+
+import pandas as pd
+
+from weighted import per_capita
+
+# Column names of the cleaned dataset (spelling follows the source CSV)
+CITY = 'Metropolitian Area/City'
+COUNTRY = 'Country/Region'
+REGION = 'Region'
+GDP = 'Official est. GDP(billion US$)'
+POPULATION = 'Metropolitian Population'
+GDP_PER_CAPITA = 'GDP_per_capita'
+
+# Country -> region; countries not listed fall into 'Other'
+REGIONS = {
+    'United States': 'North America',
+    'Canada': 'North America',
+    'Mexico': 'North America',
+    'China': 'East Asia',
+    'Japan': 'East Asia',
+    'South Korea': 'East Asia',
+    'Taiwan': 'East Asia',
+    'India': 'South Asia',
+    'Pakistan': 'South Asia',
+    'Bangladesh': 'South Asia',
+    'United Kingdom': 'Europe',
+    'Germany': 'Europe',
+    'France': 'Europe',
+    'Italy': 'Europe',
+    'Spain': 'Europe',
+    'Russia': 'Europe',
+    'Brazil': 'South America',
+    'Argentina': 'South America',
+    'Colombia': 'South America',
+    'Australia': 'Oceania',
+    'New Zealand': 'Oceania',
+    'South Africa': 'Africa',
+    'Nigeria': 'Africa',
+    'Egypt': 'Africa',
+    'Saudi Arabia': 'Middle East',
+    'United Arab Emirates': 'Middle East',
+    'Israel': 'Middle East',
+    'Singapore': 'Southeast Asia',
+    'Malaysia': 'Southeast Asia',
+    'Indonesia': 'Southeast Asia',
+    'Thailand': 'Southeast Asia',
+    'Vietnam': 'Southeast Asia',
+    'Philippines': 'Southeast Asia'
+}
+
+
+def get_region(country_name):
+    return REGIONS.get(country_name, 'Other')
+
+
+def _to_number(column):
+    # Values such as "2,080.758" or "1,101,039 " carry thousands separators and padding
+    if pd.api.types.is_numeric_dtype(column):
+        return column
+    return pd.to_numeric(column.astype(str).str.replace(',', '').str.strip(), errors='coerce')
+
+
+def clean_metros(raw):
+    """Turn rows of dataset.csv into the cleaned frame every view and backend works on."""
+    df = raw.copy()
+    df[POPULATION] = _to_number(df[POPULATION])
+    df[GDP] = _to_number(df[GDP])
+    # US$ per person at full precision; views round it when they display it
+    df[GDP_PER_CAPITA] = per_capita(df[GDP], df[POPULATION])
+    df[REGION] = df[COUNTRY].map(get_region)
+    return df
+
+
+def dataset_version(df):
+    """Return a short content fingerprint used to key everything derived from `df`."""
+    row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(','.join(map(str, df.columns)).encode('utf-8'))
+    return digest.hexdigest()[:16]
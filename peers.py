@@ -0,0 +1,101 @@
+"""Nearest-peer index over standardized log population and log GDP."""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from metro_data import CITY, COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, REGION
+
+
+class PeerIndex:
+    """KD-trees over (log population, log GDP) for finding comparable metros.
+
+    Both axes are standardized so one standard deviation of size weighs the same as one of
+    output. With `by_region` each region gets its own tree and peers never cross regions.
+    """
+
+    def __init__(self, df, by_region=False):
+        rows = df.dropna(subset=[POPULATION, GDP, GDP_PER_CAPITA])
+        rows = rows[(rows[POPULATION] > 0) & (rows[GDP] > 0)]
+        self.frame = rows[[CITY, COUNTRY, REGION, GDP, POPULATION, GDP_PER_CAPITA]].reset_index(drop=True)
+        self.by_region = by_region
+
+        points = np.column_stack((np.log(self.frame[POPULATION]), np.log(self.frame[GDP])))
+        spread = points.std(axis=0)
+        self.points = (points - points.mean(axis=0)) / np.where(spread > 0, spread, 1)
+        self._values = self.frame[GDP_PER_CAPITA].to_numpy(dtype=float)
+        self._position = {city: i for i, city in enumerate(self.frame[CITY])}
+
+        if by_region:
+            self._partitions = {
+                region: np.asarray(positions)
+                for region, positions in self.frame.groupby(REGION, sort=True).indices.items()
+            }
+        else:
+            self._partitions = {None: np.arange(len(self.frame))}
+        self._trees = {key: cKDTree(self.points[positions]) for key, positions in self._partitions.items()}
+
+    def __contains__(self, city):
+        return city in self._position
+
+    def _partition_of(self, position):
+        return self.frame.at[position, REGION] if self.by_region else None
+
+    def peers(self, city, k=10):
+        """Return the k nearest peers of `city` and its GDP-per-capita percentile among them."""
+        position = self._position[city]
+        key = self._partition_of(position)
+        members = self._partitions[key]
+        count = min(k + 1, len(members))
+        distances, neighbours = self._trees[key].query(self.points[position], k=count)
+        distances, neighbours = np.atleast_1d(distances), members[np.atleast_1d(neighbours)]
+
+        keep = neighbours != position
+        distances, neighbours = distances[keep][:k], neighbours[keep][:k]
+        peers = self.frame.iloc[neighbours].assign(Distance=distances)
+        return peers, _percentile(self._values[position], self._values[neighbours])
+
+    def peer_scores(self, k=10):
+        """Peer-relative scores for every metro at once.
+
+        Returns, aligned to `frame`, the percentile of each metro within its own k peers, the
+        peers' median GDP per capita, the ratio to that median and a peer z-score.
+        """
+        n = len(self.frame)
+        percentile = np.full(n, np.nan)
+        peer_median = np.full(n, np.nan)
+        peer_z = np.full(n, np.nan)
+
+        for key, members in self._partitions.items():
+            if len(members) < 2:
+                continue
+            count = min(k + 1, len(members))
+            _, neighbours = self._trees[key].query(self.points[members], k=count)
+            neighbours = members[neighbours.reshape(len(members), count)]
+            # Drop each metro from its own neighbour list (or the farthest one if it was not returned)
+            is_self = neighbours == members[:, None]
+            is_self[~is_self.any(axis=1), -1] = True
+            neighbours = neighbours[~is_self].reshape(len(members), count - 1)
+
+            own = self._values[members]
+            peer_values = self._values[neighbours]
+            below = (peer_values < own[:, None]).sum(axis=1)
+            ties = (peer_values == own[:, None]).sum(axis=1)
+            percentile[members] = 100 * (below + 0.5 * ties) / peer_values.shape[1]
+            peer_median[members] = np.median(peer_values, axis=1)
+            spread = peer_values.std(axis=1, ddof=1) if peer_values.shape[1] > 1 else np.full(len(members), np.nan)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                peer_z[members] = (own - peer_values.mean(axis=1)) / spread
+
+        return self.frame.assign(
+            Peer_Percentile=percentile,
+            Peer_Median_GDP_per_capita=peer_median,
+            Peer_Ratio=self._values / peer_median,
+            Peer_Z=peer_z
+        )
+
+
+def _percentile(value, peer_values):
+    if len(peer_values) == 0:
+        return np.nan
+    below = np.count_nonzero(peer_values < value)
+    ties = np.count_nonzero(peer_values == value)
+    return 100 * (below + 0.5 * ties) / len(peer_values)
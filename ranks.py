@@ -0,0 +1,184 @@
+"""Precomputed rank permutations for Top-N lists and "rank of metro X" lookups."""
+import numpy as np
+import pandas as pd
+
+from metro_data import CITY, GDP, GDP_PER_CAPITA, POPULATION
+
+# Sort By options of the filter panel -> ranked column
+SORT_MEASURES = {
+    "GDP per Capita (High to Low)": GDP_PER_CAPITA,
+    "Total GDP (High to Low)": GDP,
+    "Population (High to Low)": POPULATION
+}
+
+
+class RankIndex:
+    """Descending argsort permutations per measure, globally and within each partition.
+
+    Each partitioning (region, size bucket, ...) stores one permutation grouped by partition
+    code and, inside a partition, in global rank order, plus the offset of every partition.
+    A Top-N inside a partition is then a slice, and ranks are inverse permutations. Rows with
+    a missing measure sort last and have no rank.
+    """
+
+    def __init__(self, df, partitions=None, measures=(GDP_PER_CAPITA, GDP, POPULATION)):
+        self.index = df.index
+        self._cities = df[CITY].to_numpy()
+        self._position = {city: i for i, city in enumerate(self._cities)}
+        self._orders = {}
+        self._missing = {}
+        self._ranks = {}
+        self._valid = {}
+        for measure in measures:
+            values = df[measure].to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            # Stable sort on the negated values keeps ties in row order; NaN goes last
+            order = np.argsort(np.where(valid, -values, np.inf), kind='mergesort')
+            self._set_order(measure, order[:np.count_nonzero(valid)], order[np.count_nonzero(valid):])
+        self._group(partitions)
+
+    def _set_order(self, measure, order, missing):
+        ranks = np.full(len(order) + len(missing), -1, dtype=np.int64)
+        ranks[order] = np.arange(len(order))
+        self._orders[measure] = order
+        self._missing[measure] = missing
+        self._ranks[measure] = ranks
+        self._valid[measure] = len(order)
+
+    def _group(self, partitions):
+        # name -> (codes per row, labels, {measure: (permutation, offsets)})
+        self._partitions = {}
+        for name, (codes, labels) in (partitions or {}).items():
+            codes = np.asarray(codes)
+            grouped = {}
+            for measure, order in self._orders.items():
+                order = order[codes[order] >= 0]
+                order_codes = codes[order]
+                if len(labels) < np.iinfo(np.int16).max:
+                    # numpy radix-sorts small integers when asked for a stable sort
+                    order_codes = order_codes.astype(np.int16)
+                permutation = order[np.argsort(order_codes, kind='stable')]
+                counts = np.bincount(codes[permutation], minlength=len(labels))
+                grouped[measure] = (permutation, np.concatenate([[0], np.cumsum(counts)]))
+            self._partitions[name] = (codes, list(labels), grouped)
+
+    def apply_delta(self, df, positions, partitions=None):
+        """Return the index of `df`, the indexed frame with the rows at `positions` changed or appended.
+
+        Changed rows are taken out of every permutation and merged back in at their new place
+        by binary search, so a small delta costs a few linear passes instead of a full sort.
+        Partition codes are passed again for the whole frame and regrouped with a counting sort.
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        changed = np.zeros(len(df), dtype=bool)
+        changed[positions] = True
+
+        updated = RankIndex.__new__(RankIndex)
+        updated.index = df.index
+        updated._cities = df[CITY].to_numpy()
+        updated._position = dict(self._position)
+        for position in positions[positions < len(self._cities)]:
+            if updated._position.get(self._cities[position]) == position:
+                del updated._position[self._cities[position]]
+        for position in positions:
+            updated._position[updated._cities[position]] = position
+        updated._orders, updated._missing, updated._ranks, updated._valid = {}, {}, {}, {}
+
+        for measure, order in self._orders.items():
+            values = df[measure].to_numpy(dtype=float)
+            order = order[~changed[order]]
+            missing = self._missing[measure]
+            missing = np.sort(np.concatenate([missing[~changed[missing]], positions[np.isnan(values[positions])]]))
+            fresh = positions[~np.isnan(values[positions])]
+            fresh = fresh[np.lexsort((fresh, -values[fresh]))]
+
+            keys = -values[order]
+            at = np.searchsorted(keys, -values[fresh], side='left')
+            ties = np.searchsorted(keys, -values[fresh], side='right') - at
+            # Equal values stay in row order, as the stable sort of the constructor leaves them
+            for i in np.flatnonzero(ties):
+                at[i] += np.searchsorted(order[at[i]:at[i] + ties[i]], fresh[i])
+            updated._set_order(measure, np.insert(order, at, fresh), missing)
+
+        updated._group(partitions)
+        return updated
+
+    def _partition_slice(self, name, label, measure):
+        codes, labels, grouped = self._partitions[name]
+        permutation, offsets = grouped[measure]
+        code = labels.index(label)
+        return permutation[offsets[code]:offsets[code + 1]]
+
+    def top(self, measure, n, mask=None, partition=None, label=None):
+        """Row positions of the `n` largest values of `measure`, best first.
+
+        With `partition` and `label` the answer is a slice of that partition's permutation.
+        With a boolean `mask` the permutation is scanned in growing chunks until `n` rows
+        pass, so a selective filter costs about n / selectivity rows rather than a sort.
+        """
+        order = self._orders[measure] if partition is None else self._partition_slice(partition, label, measure)
+        if mask is None:
+            return order[:n]
+        mask = np.asarray(mask, dtype=bool)
+        found = []
+        count = 0
+        start = 0
+        chunk = max(4 * n, 256)
+        while count < n and start < len(order):
+            block = order[start:start + chunk]
+            block = block[mask[block]]
+            found.append(block)
+            count += len(block)
+            start += chunk
+            chunk *= 2
+        return np.concatenate(found)[:n] if found else order[:0]
+
+    def page(self, measure, page, page_size, mask=None, ascending=False):
+        """Return (row positions of one page, total rows) of the table sorted by `measure`.
+
+        Only the requested page is materialised; rows missing `measure` follow the ranked ones
+        in either direction. `page` counts from 0 and is clamped to the last page.
+        """
+        order = self._orders[measure]
+        if ascending:
+            order = order[::-1]
+        order = np.concatenate([order, self._missing[measure]])
+        if mask is not None:
+            order = order[np.asarray(mask, dtype=bool)[order]]
+        last_page = max(0, (len(order) - 1) // page_size)
+        start = min(max(page, 0), last_page) * page_size
+        return order[start:start + page_size], len(order)
+
+    def rank(self, city, measure, partition=None):
+        """Return (1-based rank, population size) of `city`, overall or within its partition.
+
+        The rank is None when the metro is unknown or has no value for `measure`.
+        """
+        position = self._position.get(city)
+        if position is None or self._ranks[measure][position] < 0:
+            return None, self._valid[measure]
+        if partition is None:
+            return int(self._ranks[measure][position]) + 1, self._valid[measure]
+        codes, labels, grouped = self._partitions[partition]
+        code = codes[position]
+        if code < 0:
+            return None, 0
+        permutation, offsets = grouped[measure]
+        members = permutation[offsets[code]:offsets[code + 1]]
+        # Members are in global rank order, so a binary search on their global ranks finds it
+        within = np.searchsorted(self._ranks[measure][members], self._ranks[measure][position])
+        return int(within) + 1, len(members)
+
+    def label_of(self, city, partition):
+        """Return the partition label `city` belongs to, or None."""
+        position = self._position.get(city)
+        if position is None:
+            return None
+        codes, labels, _ = self._partitions[partition]
+        return labels[codes[position]] if codes[position] >= 0 else None
+
+
+def region_partition(regions):
+    """Codes and labels for partitioning a RankIndex by region."""
+    codes, labels = pd.factorize(pd.Series(regions), sort=True)
+    return codes, list(labels)
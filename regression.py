@@ -0,0 +1,69 @@
+"""Batched per-group OLS fits from grouped sufficient statistics."""
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+
+def grouped_sums(x, y, groups):
+    """Return n, sum x, sum y, sum x^2, sum xy and sum y^2 per group.
+
+    The sums are additive, so they can be cached, merged across partitions or updated with
+    new rows, and every fit is then recovered from them without touching the raw data.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    codes, labels = pd.factorize(pd.Series(groups), sort=True)
+    keep = (codes >= 0) & np.isfinite(x) & np.isfinite(y)
+    x, y, codes = x[keep], y[keep], codes[keep]
+    size = len(labels)
+    return pd.DataFrame({
+        'n': np.bincount(codes, minlength=size),
+        'sum_x': np.bincount(codes, x, minlength=size),
+        'sum_y': np.bincount(codes, y, minlength=size),
+        'sum_xx': np.bincount(codes, x * x, minlength=size),
+        'sum_xy': np.bincount(codes, x * y, minlength=size),
+        'sum_yy': np.bincount(codes, y * y, minlength=size)
+    }, index=labels)
+
+
+def ols_from_sums(sums, confidence=0.95, min_count=3):
+    """Fit y = intercept + slope * x for every row of a `grouped_sums` frame at once."""
+    n = sums['n'].to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = sums['sum_x'].to_numpy() / n
+        mean_y = sums['sum_y'].to_numpy() / n
+        sxx = sums['sum_xx'].to_numpy() - sums['sum_x'].to_numpy() * mean_x
+        sxy = sums['sum_xy'].to_numpy() - sums['sum_x'].to_numpy() * mean_y
+        syy = sums['sum_yy'].to_numpy() - sums['sum_y'].to_numpy() * mean_y
+
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        rss = np.clip(syy - slope * sxy, 0, None)
+        dof = n - 2
+        sigma2 = rss / dof
+        se_slope = np.sqrt(sigma2 / sxx)
+        se_intercept = np.sqrt(sigma2 * (1 / n + mean_x ** 2 / sxx))
+        r_squared = np.where(syy > 0, 1 - rss / syy, np.nan)
+        t_crit = stats.t.ppf((1 + confidence) / 2, dof)
+        p_value = 2 * stats.t.sf(np.abs(slope / se_slope), dof)
+
+    fits = pd.DataFrame({
+        'n': sums['n'].to_numpy(),
+        'slope': slope,
+        'intercept': intercept,
+        'se_slope': se_slope,
+        'se_intercept': se_intercept,
+        'r_squared': r_squared,
+        'ci_low': slope - t_crit * se_slope,
+        'ci_high': slope + t_crit * se_slope,
+        'p_value': p_value
+    }, index=sums.index)
+    # Too few points or no spread in x leaves the fit undefined
+    undefined = (n < max(min_count, 3)) | ~(sxx > 0)
+    fits.loc[undefined, fits.columns.drop('n')] = np.nan
+    return fits
+
+
+def grouped_ols(x, y, groups, confidence=0.95, min_count=3):
+    """Slopes, intercepts, standard errors, R^2 and confidence intervals for every group."""
+    return ols_from_sums(grouped_sums(x, y, groups), confidence=confidence, min_count=min_count)
@@ -0,0 +1,315 @@
+"""Render every dashboard figure, and every region and country drill-down, to standalone files.
+
+Usage: python report.py [--out reports] [--workers 4] [--force]
+
+Figures are drawn by the same builders as the dashboard (charts.py) over the whole dataset,
+with the filter panel at its defaults. Each figure is written as ``<name>.html``, which loads
+the ``plotly.min.js`` copied once into the output directory, and as ``<name>.json``, the full
+Plotly figure. Figures are built on a process pool; every worker receives the snapshot of the
+data once, when it starts, and derives the shared section inputs from it at most once.
+
+Every figure is keyed by the content it depends on: the fingerprint of the rows it reads (the
+whole dataset, one region, or the vintages compared) and the source of the figure code.
+``manifest.json`` in the output directory records the key each file was written for, and a
+figure whose key has not changed since the last run is skipped.
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import plotly.offline
+import scipy.stats as stats
+
+import charts
+from binning import PopulationBinner
+from bootstrap import bootstrap_means
+from geo import BASE_ZOOM, ClusterIndex, per_metro_positions
+from metro_data import COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from ranks import SORT_MEASURES
+from regression import grouped_ols
+from store import MetroSnapshot
+from vintages import VintageStore
+from weighted import grouped_weighted_stats
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = 'manifest.json'
+DEFAULT_SORT = "GDP per Capita (High to Low)"
+TOP_TEXT_TEMPLATES = {
+    GDP_PER_CAPITA: '$%{text:,.0f}',
+    GDP: '$%{text:,.1f}B',
+    POPULATION: '%{text:,.0f}'
+}
+# Fixed so the typical metros sampled for the quadrant chart are the same on every run
+RANDOM_STATE = 0
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-') or 'unnamed'
+
+
+class ReportInputs:
+    """Section inputs derived from one snapshot, computed on first use and shared by every figure."""
+
+    def __init__(self, snapshot):
+        self.df = snapshot.df
+        self.cube = snapshot.cube
+        self.rank_index = snapshot.rank_index
+        self.sort_measure = SORT_MEASURES[DEFAULT_SORT]
+        self.sort_label = DEFAULT_SORT.replace(" (High to Low)", "")
+
+    @cached_property
+    def population_binner(self):
+        return PopulationBinner(self.df[POPULATION])
+
+    @cached_property
+    def map_df(self):
+        map_df = self.df.copy()
+        map_df[GDP] = map_df[GDP].fillna(1)
+        map_df[GDP_PER_CAPITA] = map_df[GDP_PER_CAPITA].fillna(0)
+        return map_df
+
+    @cached_property
+    def top_metros(self):
+        return self.df.iloc[self.rank_index.top(self.sort_measure, 15)]
+
+    @cached_property
+    def scatter_df(self):
+        scatter_df = self.df.dropna(subset=[POPULATION, GDP_PER_CAPITA, GDP]).copy()
+        scatter_df['Population Size Category'] = self.population_binner.categorize('size_category').reindex(scatter_df.index).cat.remove_unused_categories()
+        return scatter_df
+
+    @cached_property
+    def size_stats(self):
+        return self.population_binner.grouped_stats(self.scatter_df[[GDP_PER_CAPITA, GDP]], ['size_category', 'size_trend'])
+
+    @cached_property
+    def size_efficiency(self):
+        trend_stats = self.size_stats['size_trend']
+        trend_groups = self.population_binner.categorize('size_trend').reindex(self.scatter_df.index)
+        trend_sketches = self.population_binner.bin_sketches(self.scatter_df[GDP_PER_CAPITA], 'size_trend')
+        trend_weighted = grouped_weighted_stats(self.scatter_df[GDP_PER_CAPITA], self.scatter_df[POPULATION], trend_groups).reindex(trend_stats.index)
+        size_efficiency = pd.DataFrame({
+            'Population_Size': trend_stats.index,
+            'Mean_GDP_Per_Capita': trend_stats[(GDP_PER_CAPITA, 'mean')].to_numpy(),
+            'Median_GDP_Per_Capita': [trend_sketches[label].median() for label in trend_stats.index],
+            'Std_GDP_Per_Capita': trend_stats[(GDP_PER_CAPITA, 'std')].to_numpy(),
+            'Count': trend_stats[(GDP_PER_CAPITA, 'count')].to_numpy(),
+            'Mean_GDP_Billion': trend_stats[(GDP, 'mean')].to_numpy(),
+            'Weighted_Mean_GDP_Per_Capita': trend_weighted['mean'].to_numpy()
+        })
+        return size_efficiency, bootstrap_means(self.scatter_df[GDP_PER_CAPITA], trend_groups)
+
+    @cached_property
+    def regional_summary(self):
+        return self.cube.summary('region')
+
+    @cached_property
+    def region_ci(self):
+        region_rows = self.df.dropna(subset=[GDP_PER_CAPITA, POPULATION, GDP])
+        return bootstrap_means(region_rows[GDP_PER_CAPITA], region_rows[REGION])
+
+    @cached_property
+    def outliers(self):
+        clean_df = self.df.dropna(subset=[GDP_PER_CAPITA, POPULATION, GDP]).copy()
+        clean_df['z_score'] = stats.zscore(clean_df[[GDP_PER_CAPITA]])
+        outliers_high = clean_df[clean_df['z_score'] > 2].sort_values('z_score', ascending=False)
+        outliers_low = clean_df[clean_df['z_score'] < -2].sort_values('z_score')
+        return clean_df, outliers_high, outliers_low
+
+
+def _scaling_figure(inputs):
+    scatter_df = inputs.scatter_df
+    fits = grouped_ols(np.log(scatter_df[POPULATION]), np.log(scatter_df[GDP_PER_CAPITA]), scatter_df[REGION])
+    return charts.scaling_chart(fits[fits['n'] >= 5].dropna(subset=['slope']).sort_values('slope'))
+
+
+def _outlier_scatter(inputs):
+    q25, q75 = inputs.cube.overall_sketch().quantile([0.25, 0.75])
+    return charts.outlier_scatter(inputs.outliers[0], q25, q75)
+
+
+def _world_map(inputs):
+    if per_metro_positions(inputs.df):
+        return charts.world_map(ClusterIndex(inputs.df).query(BASE_ZOOM))
+    return charts.metro_map(inputs.map_df)
+
+
+# Figures over the whole dataset: name -> builder called with the worker's ReportInputs
+FIGURES = {
+    'world-map': _world_map,
+    'globe': lambda inputs: charts.globe_view(inputs.map_df),
+    'bubble-chart': lambda inputs: charts.bubble_chart(inputs.map_df),
+    'top-metros': lambda inputs: charts.top_bar_chart(inputs.top_metros, inputs.sort_measure, inputs.sort_label, TOP_TEXT_TEMPLATES[inputs.sort_measure]),
+    'top-metros-radar': lambda inputs: charts.top_radar_chart(inputs.top_metros),
+    'top-metros-treemap': lambda inputs: charts.top_treemap(
+        inputs.cube.hierarchy(inputs.top_metros, inputs.sort_measure), inputs.sort_label, TOP_TEXT_TEMPLATES[inputs.sort_measure]
+    ),
+    'size-scatter': lambda inputs: charts.size_scatter(inputs.scatter_df),
+    'size-distribution': lambda inputs: charts.size_distribution(inputs.scatter_df, inputs.size_stats['size_category'][(GDP_PER_CAPITA, 'count')]),
+    'size-efficiency': lambda inputs: charts.size_efficiency_chart(*inputs.size_efficiency),
+    'scaling-by-region': _scaling_figure,
+    'regional-comparison': lambda inputs: charts.regional_comparison(inputs.regional_summary, inputs.region_ci),
+    'regional-composition': lambda inputs: charts.regional_composition(inputs.cube.sunburst(top_n=5)),
+    'regional-matrix': lambda inputs: charts.regional_matrix(inputs.regional_summary),
+    'outlier-distribution': _outlier_scatter,
+    'outlier-zscores': lambda inputs: charts.outlier_zscores(*inputs.outliers[1:]),
+    'outlier-quadrants': lambda inputs: charts.outlier_quadrants(*inputs.outliers, random_state=RANDOM_STATE),
+}
+
+
+def region_figure(inputs, region):
+    return charts.region_countries_chart(inputs.cube.summary('country', region=region), region)
+
+
+def country_figure(inputs, region, country):
+    return charts.country_metros_chart(inputs.cube.metros(region=region, country=country), country)
+
+
+def vintage_figures(vintages, start, end, sort_measure, sort_label):
+    """Builders for the vintage trends between `start` and `end`; their frames are computed here."""
+    region_growth = vintages.region_growth(start, end)
+    metro_growth = vintages.growth(start, end).dropna(subset=['GDP_per_capita_cagr'])
+    growth_extremes = pd.concat([metro_growth.nlargest(10, 'GDP_per_capita_cagr'), metro_growth.nsmallest(10, 'GDP_per_capita_cagr')]).drop_duplicates()
+    rank_changes = vintages.rank_change(start, end, sort_measure)
+    movers = pd.concat([rank_changes.nlargest(10, 'Rank_change'), rank_changes.nsmallest(10, 'Rank_change')]).drop_duplicates()
+    return {
+        'region-growth': (charts.region_growth_chart, (region_growth, start, end)),
+        'metro-growth': (charts.metro_growth_chart, (growth_extremes,)),
+        'rank-movers': (charts.rank_movers_chart, (movers, sort_label, start, end)),
+    }
+
+
+def code_version():
+    """Fingerprint of the code that draws the figures; changing it re-renders everything."""
+    digest = hashlib.sha1()
+    for module in (charts, sys.modules[__name__]):
+        digest.update(inspect.getsource(module).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _key(*parts):
+    return hashlib.sha1('\x00'.join(map(str, parts)).encode('utf-8')).hexdigest()[:16]
+
+
+def _frame_digest(args):
+    # Vintage figures get their frames passed in, so they are keyed by those frames' content
+    parts = [pd.util.hash_pandas_object(arg, index=True).to_numpy().tobytes() if isinstance(arg, pd.DataFrame) else str(arg).encode('utf-8') for arg in args]
+    return hashlib.sha1(b'\x00'.join(parts)).hexdigest()[:16]
+
+
+def report_jobs(snapshot, vintages=None):
+    """Every figure of the report as (name, content key, kind, arguments)."""
+    code = code_version()
+    jobs = [(name, _key(code, name, snapshot.version), 'figure', (name,)) for name in FIGURES]
+    countries = snapshot.df[[REGION, COUNTRY]].dropna().drop_duplicates().sort_values([REGION, COUNTRY])
+    for region in sorted(countries[REGION].unique()):
+        # A drill-down reads only its region's rows, so it is keyed by that region's fingerprint
+        region_version = snapshot.region_versions.get(region)
+        jobs.append((f'region-{slug(region)}', _key(code, region, region_version), 'region', (region,)))
+        for country in countries.loc[countries[REGION] == region, COUNTRY]:
+            jobs.append((f'country-{slug(country)}', _key(code, region, country, region_version), 'country', (region, country)))
+    if vintages is not None and len(vintages.years) >= 2:
+        start, end = vintages.years[0], vintages.years[-1]
+        sort_measure = SORT_MEASURES[DEFAULT_SORT]
+        for name, (builder, args) in vintage_figures(vintages, start, end, sort_measure, DEFAULT_SORT.replace(" (High to Low)", "")).items():
+            jobs.append((name, _key(code, name, _frame_digest(args)), 'vintage', (builder, args)))
+    return jobs
+
+
+_inputs = None
+
+
+def _start_worker(snapshot):
+    # Runs once per worker process: the snapshot arrives once and every job of the worker shares it
+    global _inputs
+    _inputs = ReportInputs(snapshot)
+
+
+def _render(job, out):
+    name, key, kind, args = job
+    if kind == 'figure':
+        fig = FIGURES[args[0]](_inputs)
+    elif kind == 'region':
+        fig = region_figure(_inputs, *args)
+    elif kind == 'country':
+        fig = country_figure(_inputs, *args)
+    else:
+        builder, builder_args = args
+        fig = builder(*builder_args)
+    fig.write_html(os.path.join(out, f'{name}.html'), include_plotlyjs='directory', full_html=True)
+    fig.write_json(os.path.join(out, f'{name}.json'))
+    return name, key
+
+
+def _load_manifest(out):
+    try:
+        with open(os.path.join(out, MANIFEST)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_current(out, manifest, name, key):
+    return manifest.get(name) == key and all(os.path.exists(os.path.join(out, f'{name}.{ext}')) for ext in ('html', 'json'))
+
+
+def build_report(snapshot, out, vintages=None, workers=None, force=False):
+    """Write every figure whose content key changed to `out`; return (written, skipped) names."""
+    os.makedirs(out, exist_ok=True)
+    plotly_js = os.path.join(out, 'plotly.min.js')
+    if not os.path.exists(plotly_js):
+        with open(plotly_js, 'w', encoding='utf-8') as handle:
+            handle.write(plotly.offline.get_plotlyjs())
+
+    manifest = {} if force else _load_manifest(out)
+    jobs = report_jobs(snapshot, vintages)
+    pending = [job for job in jobs if not _is_current(out, manifest, job[0], job[1])]
+    skipped = [job[0] for job in jobs if job not in pending]
+
+    written = []
+    if pending:
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(snapshot,)) as executor:
+            chunksize = max(1, len(pending) // (4 * workers))
+            for name, key in executor.map(_render, pending, [out] * len(pending), chunksize=chunksize):
+                manifest[name] = key
+                written.append(name)
+
+    # Figures that are no longer part of the report (a country that left the data) drop out
+    current = {job[0] for job in jobs}
+    manifest = {name: key for name, key in manifest.items() if name in current}
+    partial = os.path.join(out, f'{MANIFEST}.tmp')
+    with open(partial, 'w') as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+    os.replace(partial, os.path.join(out, MANIFEST))
+    return written, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=os.path.join(ROOT, 'dataset.csv'))
+    parser.add_argument('--vintages', default=os.path.join(ROOT, 'vintages'), help="Directory of <year>.csv vintages")
+    parser.add_argument('--out', default=os.path.join(ROOT, 'reports'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="Render every figure, even unchanged ones")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    snapshot = MetroSnapshot.build(clean_metros(pd.read_csv(args.data)))
+    vintages = VintageStore(args.vintages, base_csv=args.data)
+    vintages.refresh()
+    written, skipped = build_report(snapshot, args.out, vintages, workers=args.workers, force=args.force)
+    print(f"{len(written)} figures written, {len(skipped)} unchanged, to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Content-addressed result store in one SQLite file, shared by server restarts and workers.
+
+A result is stored under the digest of its key and the code version. Callers key results by
+what they are computed from, such as a dataset fingerprint and a filter state. The code
+version is a fingerprint of the dashboard's Python sources, so a deploy that changes any of
+them starts from fresh results instead of reading stale ones. Values are pickled, which for
+frames and numpy arrays is little more than a memory copy, so a cold worker reads an index
+or a figure back in milliseconds.
+
+The database runs in WAL mode, so several server processes can read it while one writes.
+"""
+import glob
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    created REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    value BLOB NOT NULL
+)
+'''
+
+
+def code_version(root=ROOT):
+    """Fingerprint of every Python source next to this module."""
+    digest = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(root, '*.py'))):
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as handle:
+            digest.update(handle.read())
+    return digest.hexdigest()[:16]
+
+
+_fingerprints = {}
+
+
+def file_fingerprint(path):
+    """Content fingerprint of a file, for keying results computed from it.
+
+    The content is hashed again only when the file's modification time or size has changed
+    since the last call for the same path.
+    """
+    # Taken before reading, so a write during the read changes it and is hashed next time
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    known = _fingerprints.get(os.path.abspath(path))
+    if known is not None and known[0] == signature:
+        return known[1]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    fingerprint = digest.hexdigest()[:16]
+    _fingerprints[os.path.abspath(path)] = (signature, fingerprint)
+    return fingerprint
+
+
+class ResultStore:
+    """Pickled results in SQLite, addressed by the digest of (namespace, key, code version)."""
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.code_version = version or code_version()
+        self.reads = self.writes = 0
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared across threads; Streamlit runs sessions on several
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def digest(self, namespace, key):
+        return hashlib.sha1(repr((namespace, key, self.code_version)).encode('utf-8')).hexdigest()
+
+    def get(self, namespace, key, max_age=None):
+        """The stored value of `key`, or None when it is missing, older than `max_age` seconds or unreadable."""
+        row = self._connection().execute(
+            'SELECT created, value FROM results WHERE digest = ?', (self.digest(namespace, key),)
+        ).fetchone()
+        if row is None or (max_age is not None and time.time() - row[0] > max_age):
+            return None
+        try:
+            stored_key, value = pickle.loads(row[1])
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if stored_key != key:
+            return None
+        self.reads += 1
+        return value
+
+    def put(self, namespace, key, value):
+        """Store `value` under `key`; return False when it cannot be pickled (connections, locks)."""
+        try:
+            blob = pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                (self.digest(namespace, key), namespace, self.code_version, time.time(), len(blob), sqlite3.Binary(blob))
+            )
+        self.writes += 1
+        return True
+
+    def prune(self, max_age=None):
+        """Delete results written by other code versions, and those older than `max_age` seconds."""
+        with self._connection() as connection:
+            deleted = connection.execute('DELETE FROM results WHERE code_version != ?', (self.code_version,)).rowcount
+            if max_age is not None:
+                deleted += connection.execute('DELETE FROM results WHERE created < ?', (time.time() - max_age,)).rowcount
+        return deleted
+
+    def summary(self):
+        """Results and bytes stored per namespace for the current code version."""
+        rows = self._connection().execute(
+            'SELECT namespace, COUNT(*), SUM(bytes) FROM results WHERE code_version = ? GROUP BY namespace', (self.code_version,)
+        ).fetchall()
+        return {namespace: {'results': count, 'bytes': size} for namespace, count, size in rows}
@@ -0,0 +1,262 @@
+"""Materialized Region -> Country -> Metro rollup of the metro dataset."""
+import numpy as np
+import pandas as pd
+
+from metro_data import CITY, COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, REGION
+from sketches import KLLSketch, sketch_by_group
+from weighted import WeightedMoments, grouped_weighted_stats, per_capita
+
+# Key columns identifying a node at each level of the hierarchy
+LEVELS = {
+    'region': [REGION],
+    'country': [REGION, COUNTRY],
+    'metro': [REGION, COUNTRY, CITY]
+}
+
+# Additive measures stored at every level; parents are plain sums of their children.
+# gpc_wsum and gpc_wsumsq are the population-weighted moments of GDP per capita.
+ADDITIVE = ['count', 'gdp', 'population', 'gpc_sum', 'gpc_sumsq', 'gpc_wsum', 'gpc_wsumsq']
+
+
+def _set_quartiles(frame, sketches):
+    quartiles = np.array([sketch.quantile([0.25, 0.5, 0.75]) for sketch in sketches]).reshape(-1, 3)
+    frame['gpc_q25'], frame['gpc_median'], frame['gpc_q75'] = quartiles.T
+
+
+def _metro_rows(df):
+    rows = df.dropna(subset=[GDP_PER_CAPITA, POPULATION, GDP, REGION])
+    gdp_per_capita = rows[GDP_PER_CAPITA].to_numpy(dtype=float)
+    population = rows[POPULATION].to_numpy(dtype=float)
+    return pd.DataFrame({
+        REGION: rows[REGION].to_numpy(),
+        COUNTRY: rows[COUNTRY].to_numpy(),
+        CITY: rows[CITY].to_numpy(),
+        'count': 1,
+        'gdp': rows[GDP].to_numpy(dtype=float),
+        'population': population,
+        'gpc_sum': gdp_per_capita,
+        'gpc_sumsq': gdp_per_capita ** 2,
+        'gpc_wsum': population * gdp_per_capita,
+        'gpc_wsumsq': population * gdp_per_capita ** 2
+    })
+
+
+def _matches(frame, wanted, keys):
+    """Boolean mask of rows of `frame` whose `keys` appear in the (small) frame `wanted`."""
+    # A cheap single-column prefilter keeps the multi-column comparison to a handful of rows
+    mask = frame[keys[-1]].isin(wanted[keys[-1]].unique()).to_numpy()
+    if mask.any():
+        candidates = pd.MultiIndex.from_frame(frame.loc[mask, keys])
+        mask[mask] = candidates.isin(pd.MultiIndex.from_frame(wanted[keys]))
+    return mask
+
+
+class RollupCube:
+    """Count, sums, sums of squares and sketch quantiles per hierarchy level, built once per dataset.
+
+    `country_sums` may hold the country level's additive columns precomputed by an analytics
+    backend for the same rows; otherwise they are summed from the metros here.
+    """
+
+    def __init__(self, df, sketch_k=200, country_sums=None):
+        metro = _metro_rows(df)
+        metro = metro.sort_values([REGION, COUNTRY, 'gdp'], ascending=[True, True, False]).reset_index(drop=True)
+
+        # Countries roll up from metros and regions roll up from countries
+        if country_sums is None:
+            country = metro.groupby(LEVELS['country'], sort=True)[ADDITIVE].sum().reset_index()
+        else:
+            country = country_sums[LEVELS['country'] + ADDITIVE].sort_values(LEVELS['country']).reset_index(drop=True)
+        region = country.groupby(LEVELS['region'], sort=True)[ADDITIVE].sum().reset_index()
+
+        self.sketch_k = sketch_k
+        self.sketches = {'country': {}, 'region': {}}
+        self._derive(metro, country, region)
+
+    def _derive(self, metro, country, region, touched=None):
+        """Fill sketches, quartiles and weighted medians, for every group or only `touched` countries."""
+        if touched is None:
+            rebuild = metro
+        else:
+            rebuild = metro[_matches(metro, pd.DataFrame(list(touched), columns=LEVELS['country']), LEVELS['country'])]
+
+        # Quantiles are not additive; country sketches are built from metros and merged upwards
+        country_sketches = dict(self.sketches['country'])
+        for key in touched or ():
+            country_sketches.pop(key, None)
+        country_sketches.update(sketch_by_group(rebuild['gpc_sum'], [rebuild[REGION], rebuild[COUNTRY]], k=self.sketch_k))
+        touched_regions = set(region[REGION]) if touched is None else {parent for parent, _ in touched}
+        region_sketches = {name: sketch for name, sketch in self.sketches['region'].items() if name not in touched_regions}
+        for region_name in touched_regions & set(region[REGION]):
+            region_sketches[region_name] = KLLSketch.merged(
+                [sketch for (parent, _), sketch in country_sketches.items() if parent == region_name], k=self.sketch_k
+            )
+        self.sketches = {'country': country_sketches, 'region': region_sketches}
+
+        country_keys = country[LEVELS['country']].itertuples(index=False, name=None)
+        _set_quartiles(country, [country_sketches[key] for key in country_keys])
+        _set_quartiles(region, [region_sketches[key] for key in region[REGION]])
+        metro['gpc_q25'] = metro['gpc_median'] = metro['gpc_q75'] = metro['gpc_sum']
+
+        # Weighted medians need the metro rows too; all groups of a level come from one pass
+        region_rows = metro if touched is None else metro[metro[REGION].isin(touched_regions)]
+        for frame, keys, rows in ((country, LEVELS['country'], rebuild), (region, LEVELS['region'], region_rows)):
+            groups = rows.groupby(keys, sort=True)
+            # ngroup() numbers groups in the same sorted order as the keys of size()
+            weighted = grouped_weighted_stats(rows['gpc_sum'], rows['population'], groups.ngroup(), quantiles=(0.5,))
+            medians = pd.Series(weighted['q50'].to_numpy(), index=groups.size().index)
+            medians = medians.reindex(frame.set_index(keys).index).to_numpy()
+            # Groups untouched by a delta keep the value carried over from the previous cube
+            frame['gpc_wmedian'] = medians if touched is None else np.where(np.isnan(medians), frame['gpc_wmedian'], medians)
+        metro['gpc_wmedian'] = metro['gpc_sum']
+
+        self.levels = {'region': region, 'country': country, 'metro': metro}
+
+    def apply_delta(self, removed, added):
+        """Return a new cube with the metro rows `removed` taken out and `added` put in.
+
+        Country and region sums are updated by subtracting and adding the changed rows only;
+        sketches are rebuilt just for the countries those rows belong to and merged again for
+        their regions. A patched metro is passed in both frames (old and new version).
+        """
+        old_rows, new_rows = _metro_rows(removed), _metro_rows(added)
+        keys = LEVELS['metro']
+        metro = self.levels['metro'][keys + ADDITIVE]
+        if len(old_rows):
+            metro = metro[~_matches(metro, old_rows, keys)]
+        # New rows go to the end; nothing reads the metro level in a particular order
+        metro = pd.concat([metro, new_rows], ignore_index=True)
+
+        change = pd.concat([new_rows, old_rows.assign(**{column: -old_rows[column] for column in ADDITIVE})])
+        country_change = change.groupby(LEVELS['country'], sort=True)[ADDITIVE].sum()
+        country = self.levels['country'].set_index(LEVELS['country'])[ADDITIVE]
+        country = country.add(country_change, fill_value=0)
+        country = country[country['count'] > 0].sort_index()
+        country['count'] = country['count'].astype(np.int64)
+        country['gpc_wmedian'] = self.levels['country'].set_index(LEVELS['country'])['gpc_wmedian'].reindex(country.index)
+        country = country.reset_index()
+        region = country.groupby(LEVELS['region'], sort=True)[ADDITIVE].sum().reset_index()
+        region['gpc_wmedian'] = self.levels['region'].set_index(REGION)['gpc_wmedian'].reindex(region[REGION]).to_numpy()
+
+        cube = RollupCube.__new__(RollupCube)
+        cube.sketch_k = self.sketch_k
+        cube.sketches = self.sketches
+        touched = set(change[LEVELS['country']].itertuples(index=False, name=None))
+        cube._derive(metro, country, region, touched=touched)
+        return cube
+
+    def _select(self, level, region=None, country=None):
+        frame = self.levels[level]
+        if region is not None:
+            frame = frame[frame[REGION] == region]
+        if country is not None:
+            frame = frame[frame[COUNTRY] == country]
+        return frame
+
+    def summary(self, level='region', region=None, country=None):
+        """Return the regional-summary columns for every node of `level`."""
+        frame = self._select(level, region, country)
+        n = frame['count'].to_numpy(dtype=float)
+        mean = frame['gpc_sum'].to_numpy() / n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (frame['gpc_sumsq'].to_numpy() - frame['gpc_sum'].to_numpy() * mean) / (n - 1)
+        std = np.where(n > 1, np.sqrt(np.clip(variance, 0, None)), np.nan)
+
+        summary = frame[LEVELS[level]].reset_index(drop=True)
+        summary['Metro_Count'] = frame['count'].to_numpy()
+        summary['Mean_GDP_per_capita'] = mean
+        summary['Median_GDP_per_capita'] = frame['gpc_median'].to_numpy()
+        summary['Std_GDP_per_capita'] = std
+        summary['IQR_GDP_per_capita'] = (frame['gpc_q75'] - frame['gpc_q25']).to_numpy()
+        summary['Total_Population'] = frame['population'].to_numpy()
+        summary['Total_GDP'] = frame['gdp'].to_numpy()
+
+        # Population-weighted counterparts, read from the additive weighted moments
+        moments = WeightedMoments(
+            frame['population'].to_numpy(), frame['gpc_wsum'].to_numpy(), frame['gpc_wsumsq'].to_numpy()
+        )
+        summary['Weighted_Mean_GDP_per_capita'] = moments.mean
+        summary['Weighted_Median_GDP_per_capita'] = frame['gpc_wmedian'].to_numpy()
+        summary['Weighted_Std_GDP_per_capita'] = moments.std
+        return summary
+
+    def overall_sketch(self):
+        """Return one GDP-per-capita sketch covering every metro in the cube."""
+        return KLLSketch.merged(self.sketches['region'].values(), k=self.sketch_k)
+
+    def metros(self, region=None, country=None):
+        """Return metro-level rows using the dataset's own column names."""
+        frame = self._select('metro', region, country)
+        return pd.DataFrame({
+            CITY: frame[CITY].to_numpy(),
+            COUNTRY: frame[COUNTRY].to_numpy(),
+            REGION: frame[REGION].to_numpy(),
+            GDP: frame['gdp'].to_numpy(),
+            POPULATION: frame['population'].to_numpy(),
+            GDP_PER_CAPITA: frame['gpc_sum'].to_numpy()
+        }, index=frame.index)
+
+    def sunburst(self, top_n=5):
+        """Top `top_n` metros by GDP per region plus an "Other" node holding the remainder.
+
+        The remainder is the region total minus its top metros, so no raw rows are re-read.
+        """
+        metro = self.levels['metro'].sort_values([REGION, 'gdp'], ascending=[True, False])
+        top = metro[metro.groupby(REGION).cumcount() < top_n]
+
+        region_totals = self.levels['region'].set_index(REGION)[['count', 'gdp', 'population']]
+        top_totals = top.groupby(REGION)[['count', 'gdp', 'population']].sum()
+        other = (region_totals - top_totals.reindex(region_totals.index, fill_value=0))
+        other = other[other['count'] > 0]
+
+        top_frame = pd.DataFrame({
+            'Region': top[REGION].to_numpy(),
+            'Metro': top[CITY].to_numpy(),
+            'GDP': top['gdp'].to_numpy(),
+            'Population': top['population'].to_numpy(),
+            'GDP_per_capita': top['gpc_sum'].to_numpy()
+        })
+        other_frame = pd.DataFrame({
+            'Region': other.index.to_numpy(),
+            'Metro': [f'Other {region} Metros' for region in other.index],
+            'GDP': other['gdp'].to_numpy(),
+            'Population': other['population'].to_numpy(),
+            'GDP_per_capita': per_capita(other['gdp'].to_numpy(), other['population'].to_numpy())
+        })
+        return pd.concat([top_frame, other_frame], ignore_index=True)
+
+    @staticmethod
+    def hierarchy(metros, value, root='All Regions'):
+        """Return ids/labels/parents/values/colors/countries for a root -> Region -> Metro tree of `metros`.
+
+        Parent values are the sums of their children and parent colors the value-weighted
+        mean of their children, matching what plotly express derives for a path treemap.
+        """
+        leaves = pd.DataFrame({
+            'id': root + '/' + metros[REGION] + '/' + metros[CITY],
+            'label': metros[CITY],
+            'parent': root + '/' + metros[REGION],
+            'value': metros[value],
+            'color': metros[value],
+            'country': metros[COUNTRY]
+        })
+        weighted = metros.assign(_weighted=metros[value] * metros[value])
+        regions = weighted.groupby(REGION, sort=True).agg(value=(value, 'sum'), weighted=('_weighted', 'sum'))
+        branches = pd.DataFrame({
+            'id': root + '/' + regions.index,
+            'label': regions.index,
+            'parent': root,
+            'value': regions['value'].to_numpy(),
+            'color': (regions['weighted'] / regions['value']).to_numpy(),
+            'country': ''
+        })
+        total = regions['value'].sum()
+        trunk = pd.DataFrame({
+            'id': [root],
+            'label': [root],
+            'parent': [''],
+            'value': [total],
+            'color': [regions['weighted'].sum() / total if total else np.nan],
+            'country': ['']
+        })
+        return pd.concat([trunk, branches, leaves], ignore_index=True)
@@ -0,0 +1,133 @@
+"""Autocomplete and fuzzy search over metro and country names."""
+import re
+import unicodedata
+
+import numpy as np
+
+from metro_data import CITY, COUNTRY, POPULATION, REGION
+
+_SEPARATORS = re.compile(r'[^0-9a-z]+')
+
+
+def fold(text):
+    """Lower-case, strip accents and collapse punctuation, so "A Coruña" matches "a coruna"."""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _SEPARATORS.sub(' ', stripped.casefold()).strip()
+
+
+def ngrams(text, n=3):
+    """Distinct character n-grams of `text`, padded so word starts and ends count too."""
+    padded = f' {text} '
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+class _TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []
+
+
+class SearchIndex:
+    """Prefix trie and n-gram index over metro names and their countries.
+
+    Every folded word of a metro's name and country is inserted into the trie, and each trie
+    node keeps the metros below it, so a prefix lookup costs one step per typed character.
+    Queries that do not prefix-match (typos, missing words) fall back to n-gram similarity
+    against the full folded name. Build once per dataset version and reuse for every keystroke.
+    """
+
+    def __init__(self, df, n=3):
+        self.n = n
+        frame = df[[CITY, COUNTRY, REGION, POPULATION]].drop_duplicates(subset=[CITY, COUNTRY])
+        self.frame = frame.reset_index(drop=True)
+        self._names = [fold(name) for name in self.frame[CITY]]
+        self._countries = [fold(country) for country in self.frame[COUNTRY]]
+        # Larger metros win ties, so "paris" lists the French capital first
+        self._population = self.frame[POPULATION].fillna(0).to_numpy(dtype=float)
+
+        self._root = _TrieNode()
+        for entry, (name, country) in enumerate(zip(self._names, self._countries)):
+            for word in set(name.split()) | set(country.split()):
+                self._insert(word, entry)
+
+        postings = {}
+        for entry, name in enumerate(self._names):
+            for gram in ngrams(name, n):
+                postings.setdefault(gram, []).append(entry)
+        self._postings = {gram: np.asarray(entries) for gram, entries in postings.items()}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _insert(self, word, entry):
+        node = self._root
+        for char in word:
+            node = node.children.setdefault(char, _TrieNode())
+            # Entries are inserted in order, so checking the last id is enough to avoid repeats
+            if not node.ids or node.ids[-1] != entry:
+                node.ids.append(entry)
+
+    def _prefix_ids(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return set(node.ids)
+
+    def _similarity(self, query):
+        """Share of the query's n-grams found in every folded name, so long names are not penalised."""
+        grams = ngrams(query, self.n)
+        shared = np.zeros(len(self.frame))
+        for gram in grams:
+            entries = self._postings.get(gram)
+            if entries is not None:
+                shared[entries] += 1
+        return shared / len(grams)
+
+    def rank(self, query, limit=10, fuzzy=True, min_similarity=0.4):
+        """Return positions in `frame` and scores of the best matches for `query`.
+
+        Exact names score highest, then names starting with the query, then names where every
+        query word prefixes a word of the name or country; n-gram similarity breaks ties and,
+        with `fuzzy`, also admits near misses such as misspellings once the query is long enough.
+        """
+        query = fold(query)
+        if not query or len(self.frame) == 0:
+            return np.empty(0, dtype=int), np.empty(0)
+
+        words = query.split()
+        matched = self._prefix_ids(words[0])
+        for word in words[1:]:
+            if not matched:
+                break
+            matched &= self._prefix_ids(word)
+        matched = np.fromiter(matched, dtype=int, count=len(matched))
+
+        similarity = self._similarity(query)
+        score = similarity.copy()
+        if len(matched):
+            score[matched] += 1
+            names = [self._names[entry] for entry in matched]
+            score[matched[[name.startswith(query) for name in names]]] += 1
+            score[matched[[name == query for name in names]]] += 1
+        candidates = matched
+        if fuzzy and len(query) > self.n:
+            candidates = np.union1d(candidates, np.flatnonzero(similarity >= min_similarity))
+
+        order = np.lexsort((-self._population[candidates], -score[candidates]))[:limit]
+        best = candidates[order]
+        return best, score[best]
+
+    def search(self, query, limit=10, fuzzy=True, min_similarity=0.4):
+        """Ranked matches for `query` as rows of `frame` with a Score column."""
+        positions, scores = self.rank(query, limit=limit, fuzzy=fuzzy, min_similarity=min_similarity)
+        return self.frame.iloc[positions].assign(Score=scores)
+
+    def complete(self, prefix, limit=10):
+        """Metro names with a word (of the name or country) starting with every typed word."""
+        positions, _ = self.rank(prefix, limit=limit, fuzzy=False)
+        return self.frame[CITY].to_numpy()[positions].tolist()
@@ -0,0 +1,140 @@
+"""Mergeable KLL quantile sketches for medians, IQRs and percentiles over streamed data."""
+import numpy as np
+import pandas as pd
+
+
+class KLLSketch:
+    """KLL quantile sketch with bounded memory.
+
+    Items live in levels of compactors where an item on level h stands for 2**h inputs. When a
+    level overflows it is sorted and every other item is promoted, so memory stays around 3k
+    items whatever the stream length, and the rank error shrinks roughly as 1/k. Sketches built
+    over separate chunks or partitions can be merged into one.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = int(k)
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def size(self):
+        """Number of items actually retained."""
+        return sum(len(items) for items in self._levels)
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        # Adding a level shrinks the capacity of every level below it, so repeat until all fit
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self._levels)):
+                items = self._levels[level]
+                if len(items) <= self._capacity(level):
+                    continue
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item stays behind so the promoted half stands for exactly twice its count
+                odd = len(items) % 2
+                promoted = items[odd:][self._rng.integers(2)::2]
+                self._levels[level] = items[:odd]
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+                compacted = True
+                break
+
+    def update(self, values):
+        """Add one value or an array of values (NaNs are ignored)."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one in place."""
+        if other.n == 0:
+            return self
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    @classmethod
+    def merged(cls, sketches, k=200, seed=0):
+        """Return a new sketch summarising all of `sketches`."""
+        result = cls(k=k, seed=seed)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    def _weighted_items(self):
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level) for level, level_items in enumerate(self._levels)])
+        order = np.argsort(items, kind='mergesort')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Return the q-quantile(s), interpolating like numpy's default 'linear' method."""
+        scalar = np.ndim(q) == 0
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if self.n == 0:
+            result = np.full(q.shape, np.nan)
+            return result[0] if scalar else result
+
+        items, cumulative = self._weighted_items()
+        total = cumulative[-1]
+        # Item i covers 0-based positions [cumulative[i] - weight, cumulative[i] - 1]
+        position = np.clip(q, 0, 1) * (total - 1)
+        lower = np.floor(position)
+        fraction = position - lower
+        lower_items = items[np.searchsorted(cumulative, lower, side='right')]
+        upper_items = items[np.minimum(np.searchsorted(cumulative, lower + 1, side='right'), len(items) - 1)]
+        result = lower_items + fraction * (upper_items - lower_items)
+        # The exact extremes are tracked separately
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+        return result[0] if scalar else result
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def iqr(self):
+        q25, q75 = self.quantile([0.25, 0.75])
+        return q75 - q25
+
+    def rank(self, value):
+        """Return the approximate fraction of inputs less than or equal to `value`."""
+        if self.n == 0:
+            return np.nan
+        items, cumulative = self._weighted_items()
+        position = np.searchsorted(items, value, side='right')
+        return cumulative[position - 1] / cumulative[-1] if position else 0.0
+
+
+def sketch_by_group(values, groups, k=200, seed=0):
+    """Build one sketch per group; `groups` is anything pandas can group a Series by."""
+    values = pd.Series(values)
+    data = values.to_numpy(dtype=float)
+    return {
+        key: KLLSketch(k=k, seed=seed).update(data[positions])
+        for key, positions in values.groupby(groups, sort=True).indices.items()
+    }
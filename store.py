@@ -0,0 +1,254 @@
+"""Versioned store of the cleaned metros, patched in place by small delta files.
+
+A delta is a CSV with some of the columns of ``dataset.csv``. Rows whose ``Index`` (or,
+without one, metro name) already exists replace the columns they carry; other rows are
+appended as new metros. Only the delta rows are cleaned, and the full-data rollup cube and
+rank index are updated from the changed rows rather than rebuilt. Every region keeps its own
+content fingerprint, so results cached for a region filter survive deltas to other regions.
+
+The store can also watch the source CSV. When its content changes, a background thread
+rebuilds everything from the file and publishes the result as the next snapshot, so a
+script run always works on one complete snapshot and never waits for a rebuild.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from binning import BUCKETINGS, bin_codes
+from metro_data import CITY, COUNTRY, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from ranks import RankIndex, region_partition
+from results import file_fingerprint
+from rollup import RollupCube
+
+INDEX = 'Index'
+# Columns clean_metros derives; a delta cannot set them directly
+DERIVED = (GDP_PER_CAPITA, REGION)
+
+
+def metro_partitions(df):
+    """Region and population-size partitions of the rank index."""
+    return {
+        'Region': region_partition(df[REGION]),
+        'Size': (bin_codes(df[POPULATION], 'pop_filter'), list(BUCKETINGS['pop_filter'][1]))
+    }
+
+
+def _digest(parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _region_versions(df, row_hashes, regions):
+    values = df[REGION].to_numpy()
+    return {region: _digest([row_hashes[values == region].tobytes()]) for region in regions}
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class MetroSnapshot:
+    """One consistent version of the cleaned metros and the indexes built over all of them.
+
+    `generation` counts the snapshots a store has published; `version` fingerprints the content.
+    """
+
+    def __init__(self, df, row_hashes, region_versions, rank_index, cube, generation=0):
+        self.generation = generation
+        self.df = df
+        self.row_hashes = row_hashes
+        self.region_versions = region_versions
+        self.rank_index = rank_index
+        self.cube = cube
+        self.version = _digest([','.join(map(str, df.columns))] + [
+            f'{region}={region_versions[region]};' for region in sorted(region_versions)
+        ])
+
+    def filter_version(self, regions):
+        """Fingerprint of the rows visible through a region filter, for keying per-filter caches."""
+        return _digest([f'{region}={self.region_versions.get(region)};' for region in sorted(regions)])
+
+    @classmethod
+    def build(cls, df, generation=0):
+        """Index every row of the cleaned frame `df` from scratch."""
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+        return cls(
+            df,
+            row_hashes,
+            _region_versions(df, row_hashes, df[REGION].unique()),
+            RankIndex(df, partitions=metro_partitions(df)),
+            RollupCube(df),
+            generation
+        )
+
+
+class MetroStore:
+    """Hold the current snapshot and swap in a new one for every delta or change of the source file.
+
+    `prepare`, if given, is called with every new snapshot before it is published, from the
+    thread that built it, so caches keyed by the new version can be filled ahead of viewers.
+    `snapshot`, if given, is an already built snapshot of `df`, such as one read from disk.
+    """
+
+    def __init__(self, df, prepare=None, snapshot=None):
+        self.snapshot = snapshot if snapshot is not None else MetroSnapshot.build(df)
+        self.source = None
+        self.last_error = None
+        self._prepare = prepare
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @classmethod
+    def from_csv(cls, path, read=None, build=None, prepare=None, interval=2.0):
+        """Load the store from the CSV at `path` and watch it for edits.
+
+        `read(path, fingerprint)` returns the cleaned frame (pandas and `clean_metros` by
+        default) and `build(df)`, if given, its snapshot. The file is fingerprinted before it
+        is read, so an edit made while loading is picked up by the watcher's first check.
+        """
+        fingerprint = file_fingerprint(path)
+        df = read(path, fingerprint) if read is not None else clean_metros(pd.read_csv(path))
+        store = cls(df, prepare=prepare, snapshot=build(df) if build is not None else None)
+        store.watch(path, fingerprint, interval)
+        return store
+
+    def _publish(self, snapshot):
+        # Called with the lock held; replacing one attribute is what makes the swap atomic
+        snapshot.generation = self.snapshot.generation + 1
+        if self._prepare is not None:
+            self._prepare(snapshot)
+        self.snapshot = snapshot
+
+    def reload(self, raw):
+        """Rebuild everything from the raw rows `raw` and publish it as the next snapshot."""
+        snapshot = MetroSnapshot.build(clean_metros(raw))
+        with self._lock:
+            self._publish(snapshot)
+        return snapshot.generation
+
+    def watch(self, path, fingerprint=None, interval=2.0):
+        """Start a daemon thread that reloads the store whenever the content of `path` changes.
+
+        `fingerprint` is the content fingerprint of the file the current snapshot was loaded
+        from, taken before it was read. An edit made after that, even before the watcher
+        starts, is then picked up on the first check. Without it, the file as it is when
+        watching starts is taken to be the loaded one.
+        """
+        if self._watcher is not None:
+            return
+        self.source = path
+        self._watcher = threading.Thread(target=self._watch, args=(path, fingerprint, interval), name='metro-store-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, path, fingerprint, interval):
+        seen = _signature(path)
+        if fingerprint is None:
+            built, fingerprint = seen, file_fingerprint(path)
+        else:
+            # Compare the content once the file is quiet, whatever its signature
+            built = None
+        while not self._stop.wait(interval):
+            try:
+                signature = _signature(path)
+            except OSError:
+                # Replaced by a rename or briefly missing; look again on the next tick
+                continue
+            if signature != seen:
+                # Wait for one quiet interval so a file that is still being written is not read
+                seen = signature
+                continue
+            if signature == built:
+                continue
+            built = signature
+            try:
+                content = file_fingerprint(path)
+                if content != fingerprint:
+                    self.reload(pd.read_csv(path))
+                    fingerprint = content
+                self.last_error = None
+            except Exception as error:
+                # Keep serving the previous snapshot; a later write to the file is tried again
+                self.last_error = f'{type(error).__name__}: {error}'
+
+    def apply_delta(self, raw):
+        """Merge a delta of added or changed rows and return a summary of what changed."""
+        with self._lock:
+            old = self.snapshot
+            key = INDEX if INDEX in raw.columns and INDEX in old.df.columns else CITY
+            if key not in raw.columns:
+                raise ValueError(f"Delta rows need an '{INDEX}' or '{CITY}' column")
+            source = [column for column in old.df.columns if column not in DERIVED]
+            unknown = [column for column in raw.columns if column not in source]
+            if unknown:
+                raise ValueError(f"Unknown delta columns: {', '.join(map(str, unknown))}")
+            delta = raw.drop_duplicates(subset=[key], keep='last')
+
+            existing = old.df[key]
+            lookup = pd.Series(np.arange(len(existing)), index=existing.to_numpy())
+            lookup = lookup[~lookup.index.duplicated(keep='last')]
+            matched = delta[key].isin(lookup.index).to_numpy()
+            updated = lookup.loc[delta.loc[matched, key]].to_numpy()
+
+            # Patched rows keep every column the delta does not carry
+            patched = old.df.iloc[updated][source].astype(object)
+            for column in delta.columns:
+                patched[column] = delta.loc[matched, column].to_numpy()
+            # Object columns like the patched rows', so concatenating them infers no dtype from all-NA columns
+            added = delta[~matched].reindex(columns=source).astype(object)
+            if added[[CITY, COUNTRY]].isna().any(axis=None):
+                raise ValueError(f"New metros need '{CITY}' and '{COUNTRY}'")
+            if INDEX in source:
+                start = int(pd.to_numeric(old.df[INDEX], errors='coerce').max()) + 1 if len(old.df) else 1
+                fill = pd.Series(np.arange(start, start + len(added)), index=added.index)
+                added[INDEX] = added[INDEX].fillna(fill)
+            next_label = old.df.index.max() + 1 if len(old.df) else 0
+            added.index = pd.RangeIndex(next_label, next_label + len(added))
+            # pandas no longer lets an empty frame take part in the result's dtypes, so leave it out
+            changed = clean_metros(pd.concat([frame for frame in (patched, added) if len(frame)] or [patched]))[old.df.columns]
+
+            positions = np.concatenate([updated, np.arange(len(old.df), len(old.df) + len(added))])
+            columns = {}
+            for column in old.df.columns:
+                before, after = old.df[column].to_numpy(), changed[column].infer_objects().to_numpy()
+                values = np.concatenate([before, after[len(updated):]]).astype(np.result_type(before, after), copy=False)
+                values[updated] = after[:len(updated)]
+                columns[column] = values
+            df = pd.DataFrame(columns, index=old.df.index.append(added.index))
+
+            removed = old.df.iloc[updated]
+            touched = set(removed[REGION]) | set(changed[REGION])
+            if (df.dtypes == old.df.dtypes).all():
+                row_hashes = np.concatenate([old.row_hashes, np.zeros(len(added), dtype=old.row_hashes.dtype)])
+                row_hashes[positions] = pd.util.hash_pandas_object(df.iloc[positions], index=True).to_numpy()
+                present = set(df[REGION].unique())
+                region_versions = {region: version for region, version in old.region_versions.items() if region in present}
+                region_versions.update(_region_versions(df, row_hashes, touched & present))
+            else:
+                # A column changed type (say int to float), which changes every row's hash and
+                # so every region's version
+                row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+                region_versions = _region_versions(df, row_hashes, df[REGION].unique())
+
+            self._publish(MetroSnapshot(
+                df,
+                row_hashes,
+                region_versions,
+                old.rank_index.apply_delta(df, positions, partitions=metro_partitions(df)),
+                old.cube.apply_delta(removed, changed)
+            ))
+            return {
+                'updated': len(updated),
+                'added': len(added),
+                'regions': sorted(touched),
+                'version': self.snapshot.version
+            }
@@ -0,0 +1,122 @@
+"""The API must answer over a real connection with 304 for a matching ETag, 400 for an invalid
+parameter, 500 for a failing endpoint and 413 for an oversized body, and gzip only what the
+client's Accept-Encoding allows."""
+import asyncio
+import gzip
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from api import MAX_REQUEST_BODY, AnalyticsAPI, MetroAnalytics, accepts_gzip
+from metro_data import clean_metros
+from store import MetroStore
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+
+
+@pytest.fixture(scope='module')
+def api():
+    api = AnalyticsAPI(MetroAnalytics(MetroStore(clean_metros(pd.read_csv(DATASET)))))
+
+    def failing(snapshot, params):
+        raise RuntimeError('failing endpoint')
+    api.routes['/failing'] = failing
+    return api
+
+
+async def _exchange(api, requests):
+    """Send raw `requests` on one connection; return (status, headers, body) per answer until it closes."""
+    server = await asyncio.start_server(api.handle, '127.0.0.1', 0)
+    reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+    answers = []
+    try:
+        for request in requests:
+            writer.write(request)
+            await writer.drain()
+            status = await reader.readline()
+            if not status:
+                break
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers['content-length']))
+            answers.append((int(status.split()[1]), headers, body))
+    finally:
+        writer.close()
+        server.close()
+        await server.wait_closed()
+    return answers
+
+
+def exchange(api, *requests):
+    return asyncio.run(_exchange(api, requests))
+
+
+def get(target, **headers):
+    lines = [f'GET {target} HTTP/1.1', 'Host: localhost'] + [f"{name.replace('_', '-')}: {value}" for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def test_matching_etag_is_not_modified(api):
+    (status, headers, body), = exchange(api, get('/rankings?page_size=5'))
+    assert status == 200 and headers['etag']
+    (status, _, body), (other, _, _) = exchange(
+        api, get('/rankings?page_size=5', If_None_Match=headers['etag']), get('/rankings?page_size=6', If_None_Match=headers['etag'])
+    )
+    assert (status, body) == (304, b'')
+    assert other == 200
+
+
+@pytest.mark.parametrize('target', ['/regions?region=Atlantis', '/regions?gdp_min=nan', '/rankings?page=0', '/rankings?sort=height', '/outliers?side=up'])
+def test_invalid_parameter_is_bad_request(api, target):
+    (status, _, body), = exchange(api, get(target))
+    assert status == 400
+    assert json.loads(body)['error']
+
+
+def test_failing_endpoint_answers_500_and_keeps_the_connection(api):
+    (status, _, body), (after, _, _) = exchange(api, get('/failing'), get('/'))
+    assert (status, json.loads(body)) == (500, {'error': 'Internal server error'})
+    assert after == 200
+
+
+@pytest.mark.parametrize('accept, compressed', [
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('*', True),
+    ('gzip;q=0', False),
+    ('gzip;q=0.0, br', False),
+    ('*;q=1, gzip;q=0', False),
+    ('identity', False),
+])
+def test_gzip_follows_accept_encoding(api, accept, compressed):
+    (status, headers, body), = exchange(api, get('/rankings?page_size=100', Accept_Encoding=accept))
+    assert status == 200
+    assert (headers.get('content-encoding') == 'gzip') == compressed
+    rows = json.loads(gzip.decompress(body) if compressed else body)['rows']
+    assert len(rows) == 100
+    assert headers['etag'].endswith('-gz"') == compressed
+
+
+def test_small_bodies_are_not_compressed(api):
+    (status, headers, _), = exchange(api, get('/rankings?page_size=1', Accept_Encoding='gzip'))
+    assert status == 200 and 'content-encoding' not in headers
+
+
+@pytest.mark.parametrize('accept, expected', [('', False), ('GZIP', True), ('x-gzip', True), ('gzip;q=abc', False), ('br;q=1, *;q=0.1', True)])
+def test_accepts_gzip(accept, expected):
+    assert accepts_gzip(accept) is expected
+
+
+def test_oversized_body_is_refused(api):
+    oversized = get('/').replace(b'\r\n\r\n', f'\r\nContent-Length: {MAX_REQUEST_BODY + 1}\r\n\r\n'.encode(), 1)
+    answers = exchange(api, oversized, get('/'))
+    # Answered without reading the body, then the connection is closed
+    assert [status for status, _, _ in answers] == [413]
+    assert answers[0][1]['connection'] == 'close'
+
+    within = get('/').replace(b'\r\n\r\n', b'\r\nContent-Length: 4\r\n\r\n', 1) + b'abcd'
+    assert [status for status, _, _ in exchange(api, within, get('/'))] == [200, 200]
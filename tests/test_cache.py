@@ -0,0 +1,141 @@
+"""A namespace must evict least recently used values first, over its entry and byte limits,
+and drop values older than its TTL when they are next read, by the clock it is given."""
+import threading
+
+import numpy as np
+import pytest
+
+from cache import CachePolicy, NamespaceCache
+from results import ResultStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def block(kilobytes):
+    return np.zeros(kilobytes * 1024, dtype=np.uint8)
+
+
+def test_least_recently_used_is_evicted_first(clock):
+    namespace = NamespaceCache('test', CachePolicy(max_entries=3), clock=clock)
+    for key in 'abc':
+        namespace.put(key, key.upper())
+    # Reading 'a' makes 'b' the least recently used
+    assert namespace.get('a') == 'A'
+    namespace.put('d', 'D')
+    assert list(namespace._entries) == ['c', 'a', 'd']
+    assert namespace.get('b') is None
+    namespace.put('e', 'E')
+    assert list(namespace._entries) == ['a', 'd', 'e']
+    assert namespace.stats()['evicted_lru'] == 2
+
+
+def test_replacing_a_value_is_not_an_eviction(clock):
+    namespace = NamespaceCache('test', CachePolicy(max_entries=2, max_bytes=8 * 1024), clock=clock)
+    namespace.put('a', block(4))
+    namespace.put('a', block(2))
+    assert len(namespace) == 1
+    assert namespace.bytes == 2 * 1024
+    assert namespace.stats()['evicted_lru'] == namespace.stats()['evicted_bytes'] == 0
+
+
+def test_values_expire_after_their_ttl(clock):
+    namespace = NamespaceCache('test', CachePolicy(ttl=60), clock=clock)
+    namespace.put('a', 1)
+    namespace.put('b', 2)
+    clock.now += 30
+    namespace.put('c', 3)
+    # Reading a value keeps it in memory longer but does not extend its TTL
+    assert namespace.get('a') == 1
+    clock.now += 30
+    assert namespace.get('a') == 1
+    clock.now += 0.001
+    assert namespace.get('a', 'gone') == 'gone'
+    assert namespace.get('b', 'gone') == 'gone'
+    assert namespace.get('c') == 3
+    assert namespace.stats()['expired'] == 2
+    clock.now += 60
+    assert namespace.get('c') is None
+
+
+def test_expired_values_are_dropped_only_when_read(clock):
+    namespace = NamespaceCache('test', CachePolicy(ttl=10), clock=clock)
+    namespace.put('a', block(1))
+    clock.now += 11
+    assert len(namespace) == 1 and namespace.bytes == 1024
+    assert namespace.get('a') is None
+    assert len(namespace) == 0 and namespace.bytes == 0
+
+
+def test_putting_again_restarts_the_ttl(clock):
+    namespace = NamespaceCache('test', CachePolicy(ttl=10), clock=clock)
+    namespace.put('a', 1)
+    clock.now += 8
+    namespace.put('a', 2)
+    clock.now += 8
+    assert namespace.get('a') == 2
+
+
+def test_byte_limit_evicts_least_recently_used(clock):
+    namespace = NamespaceCache('test', CachePolicy(max_bytes=10 * 1024), clock=clock)
+    for key in 'abc':
+        namespace.put(key, block(3))
+    namespace.get('a')
+    namespace.put('d', block(3))
+    assert list(namespace._entries) == ['c', 'a', 'd']
+    assert namespace.bytes == 9 * 1024
+    namespace.put('e', block(7))
+    assert list(namespace._entries) == ['d', 'e']
+    assert namespace.stats()['evicted_bytes'] == 3
+
+
+def test_oversized_value_is_kept_alone(clock):
+    namespace = NamespaceCache('test', CachePolicy(max_bytes=4 * 1024), clock=clock)
+    namespace.put('a', block(1))
+    namespace.put('big', block(8))
+    assert list(namespace._entries) == ['big']
+    assert namespace.get('big').nbytes == 8 * 1024
+
+
+def test_concurrent_misses_compute_once(clock):
+    namespace = NamespaceCache('test', CachePolicy(max_entries=4), clock=clock)
+    calls = []
+    started = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        return 'value'
+
+    def lookup():
+        started.wait()
+        results.append(namespace.get_or_compute('key', compute))
+
+    results = []
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 8
+    assert len(calls) == 1
+
+
+def test_persisted_values_are_read_back_after_eviction(tmp_path, clock):
+    store = ResultStore(str(tmp_path / 'results.sqlite'))
+    namespace = NamespaceCache('test', CachePolicy(max_entries=1, persist=True), store=store, clock=clock)
+    namespace.put('a', [1, 2])
+    namespace.put('b', [3])
+    assert list(namespace._entries) == ['b']
+    assert namespace.get('a') == [1, 2]
+    assert namespace.stats()['disk_hits'] == 1
+    assert list(namespace._entries) == ['a']
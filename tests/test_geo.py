@@ -0,0 +1,38 @@
+"""Map viewports must cover the longitudes they show, and clusters are only used when metros
+have positions of their own."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from geo import ClusterIndex, per_metro_positions, view_query
+from metro_data import clean_metros
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+
+
+@pytest.fixture(scope='module')
+def metros():
+    return clean_metros(pd.read_csv(DATASET))
+
+
+@pytest.fixture(scope='module')
+def placed(metros):
+    rng = np.random.default_rng(0)
+    return metros.assign(Latitude=rng.uniform(-60, 60, len(metros)), Longitude=rng.uniform(-180, 180, len(metros)))
+
+
+@pytest.mark.parametrize('scale', [1.01, 1.1, 1.2, 1.25])
+def test_wide_view_covers_every_longitude(placed, scale):
+    zoom, bounds = view_query({'lon': 0, 'lat': 0, 'scale': scale})
+    assert bounds[0] == -180 and bounds[2] == 180
+    assert ClusterIndex(placed).query(zoom, bounds)['count'].sum() == len(placed)
+
+
+def test_centroid_positions_are_not_clustered(metros, placed):
+    assert not ClusterIndex(metros).per_metro
+    assert ClusterIndex(placed).per_metro
+    # Checked before an index is built, so centroid-placed data never builds one
+    assert not per_metro_positions(metros)
+    assert per_metro_positions(placed)
@@ -0,0 +1,93 @@
+"""A RankIndex patched with a delta must answer every page, Top-N and rank lookup exactly like
+an index sorted from scratch over the patched rows."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from metro_data import CITY, GDP, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from ranks import RankIndex, region_partition
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+MEASURES = (GDP_PER_CAPITA, GDP, POPULATION)
+
+
+@pytest.fixture(scope='module')
+def metros():
+    return clean_metros(pd.read_csv(DATASET)).reset_index(drop=True)
+
+
+def random_delta(metros, seed, changes=25, additions=5):
+    """Return the patched frame and the positions of its changed and appended rows."""
+    rng = np.random.default_rng(seed)
+    df = metros.copy()
+    positions = rng.choice(len(df), changes, replace=False)
+    for measure in MEASURES:
+        values = df[measure].to_numpy(dtype=float)
+        new = values[positions] * rng.uniform(0.5, 1.5, changes)
+        # Some rows take another row's value, to exercise ties, and some lose their value
+        new[::5] = values[rng.choice(len(df), len(new[::5]))]
+        new[3::8] = np.nan
+        df[measure] = values
+        df.loc[positions, measure] = new
+    df.loc[positions[:3], REGION] = df[REGION].iloc[rng.choice(len(df), 3)].to_numpy()
+
+    added = df.iloc[rng.choice(len(df), additions)].copy()
+    added[CITY] = [f"Newtown {i}" for i in range(additions)]
+    added[GDP] = added[GDP].to_numpy() * rng.uniform(0.5, 1.5, additions)
+    added.index = pd.RangeIndex(len(df), len(df) + additions)
+    return pd.concat([df, added]), np.concatenate([positions, added.index.to_numpy()])
+
+
+def assert_same_answers(patched, rebuilt, df):
+    regions = sorted(df[REGION].unique())
+    cities = df[CITY].drop_duplicates(keep=False)
+    for measure in MEASURES:
+        for ascending in (False, True):
+            np.testing.assert_array_equal(
+                patched.page(measure, 0, len(df), ascending=ascending)[0],
+                rebuilt.page(measure, 0, len(df), ascending=ascending)[0]
+            )
+        mask = (df[REGION] == 'Europe').to_numpy()
+        (page, total), (expected, expected_total) = patched.page(measure, 2, 20, mask=mask), rebuilt.page(measure, 2, 20, mask=mask)
+        np.testing.assert_array_equal(page, expected)
+        assert total == expected_total
+        np.testing.assert_array_equal(patched.top(measure, 15, mask=~mask), rebuilt.top(measure, 15, mask=~mask))
+        for region in regions:
+            np.testing.assert_array_equal(
+                patched.top(measure, 10, partition='region', label=region),
+                rebuilt.top(measure, 10, partition='region', label=region)
+            )
+        for city in cities:
+            assert patched.rank(city, measure) == rebuilt.rank(city, measure), city
+            assert patched.rank(city, measure, partition='region') == rebuilt.rank(city, measure, partition='region'), city
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_delta_matches_full_sort(metros, seed):
+    index = RankIndex(metros, partitions={'region': region_partition(metros[REGION])})
+    df, positions = random_delta(metros, seed)
+    partitions = {'region': region_partition(df[REGION])}
+
+    patched = index.apply_delta(df, positions, partitions=partitions)
+    rebuilt = RankIndex(df, partitions=partitions)
+    assert_same_answers(patched, rebuilt, df)
+    for city in df[CITY].iloc[positions].drop_duplicates(keep=False):
+        assert patched.label_of(city, 'region') == rebuilt.label_of(city, 'region')
+
+
+def test_full_sort_matches_pandas(metros):
+    # The rebuilt index itself: descending, ties in row order, missing values last
+    index = RankIndex(metros)
+    for measure in MEASURES:
+        expected = metros[measure].reset_index(drop=True).sort_values(ascending=False, kind='mergesort', na_position='last')
+        np.testing.assert_array_equal(index.page(measure, 0, len(metros))[0], expected.index.to_numpy())
+
+
+def test_page_is_clamped(metros):
+    index = RankIndex(metros)
+    last, total = index.page(GDP, 10_000, 100)
+    assert total == len(metros)
+    np.testing.assert_array_equal(last, index.page(GDP, (len(metros) - 1) // 100, 100)[0])
+    np.testing.assert_array_equal(index.page(GDP, -3, 100)[0], index.page(GDP, 0, 100)[0])
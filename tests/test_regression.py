@@ -0,0 +1,91 @@
+"""Per-group OLS fits recovered from grouped sums must match fitting each group on its own, and
+groups too small or without spread in x must come back undefined instead of as a bogus line."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from metro_data import COUNTRY, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from regression import grouped_ols, grouped_sums, ols_from_sums
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+
+
+@pytest.fixture(scope='module')
+def scaling():
+    # log(GDP per capita) against log(population), as in the scaling tab
+    metros = clean_metros(pd.read_csv(DATASET)).dropna(subset=[GDP_PER_CAPITA, POPULATION])
+    return pd.DataFrame({
+        'x': np.log(metros[POPULATION].to_numpy(dtype=float)),
+        'y': np.log(metros[GDP_PER_CAPITA].to_numpy(dtype=float)),
+        REGION: metros[REGION].to_numpy(),
+        COUNTRY: metros[COUNTRY].to_numpy()
+    })
+
+
+@pytest.mark.parametrize('level', [REGION, COUNTRY])
+def test_fits_match_statsmodels(scaling, level):
+    fits = grouped_ols(scaling['x'], scaling['y'], scaling[level])
+    assert list(fits.index) == sorted(scaling[level].unique())
+    checked = 0
+    for group, rows in scaling.groupby(level):
+        fit = fits.loc[group]
+        assert fit['n'] == len(rows)
+        if len(rows) < 3 or rows['x'].nunique() < 2:
+            continue
+        model = sm.OLS(rows['y'].to_numpy(), sm.add_constant(rows['x'].to_numpy())).fit()
+        (ci_low, ci_high) = model.conf_int(0.05)[1]
+        np.testing.assert_allclose(
+            fit[['intercept', 'slope', 'se_intercept', 'se_slope', 'r_squared', 'ci_low', 'ci_high', 'p_value']].to_numpy(dtype=float),
+            [*model.params, *model.bse, model.rsquared, ci_low, ci_high, model.pvalues[1]],
+            rtol=1e-6, atol=1e-9
+        )
+        np.testing.assert_allclose(fit[['slope', 'intercept']].to_numpy(dtype=float), np.polyfit(rows['x'], rows['y'], 1), rtol=1e-8)
+        checked += 1
+    assert checked >= (6 if level == REGION else 20)
+
+
+def test_small_and_singular_groups_are_undefined():
+    groups = ['one'] * 1 + ['two'] * 2 + ['flat'] * 5 + ['line'] * 4
+    x = [1.0, 1.0, 2.0, 3.0, 3.0, 3.0, 3.0, 3.0, 0.0, 1.0, 2.0, 3.0]
+    y = [5.0, 1.0, 2.0, 1.0, 2.0, 3.0, 4.0, 5.0, 1.0, 3.0, 5.0, 7.0]
+    fits = grouped_ols(x, y, groups)
+    assert fits.loc[['one', 'two', 'flat'], fits.columns.drop('n')].isna().all(axis=None)
+    assert fits['n'].to_dict() == {'flat': 5, 'line': 4, 'one': 1, 'two': 2}
+    # An exact line has a defined slope with no residual spread
+    assert fits.loc['line', 'slope'] == pytest.approx(2.0)
+    assert fits.loc['line', 'intercept'] == pytest.approx(1.0)
+    assert fits.loc['line', 'r_squared'] == pytest.approx(1.0)
+    assert fits.loc['line', 'se_slope'] == pytest.approx(0.0, abs=1e-7)
+
+
+def test_min_count_leaves_out_small_groups(scaling):
+    fits = grouped_ols(scaling['x'], scaling['y'], scaling[COUNTRY], min_count=10)
+    assert fits.loc[fits['n'] < 10, 'slope'].isna().all()
+    assert fits.loc[fits['n'] >= 10, 'slope'].notna().all()
+
+
+def test_non_finite_rows_are_skipped(scaling):
+    rows = scaling.head(200)
+    x = rows['x'].to_numpy().copy()
+    x[::10] = np.nan
+    x[5::10] = np.inf
+    keep = np.isfinite(x)
+    pd.testing.assert_frame_equal(
+        grouped_ols(x, rows['y'], rows[REGION]),
+        grouped_ols(x[keep], rows['y'][keep], rows[REGION][keep])
+    )
+
+
+def test_sums_add_across_partitions(scaling):
+    # Sums of two partitions, aligned on their groups, fit like the sums of all rows
+    head, tail = scaling.iloc[:400], scaling.iloc[400:]
+    combined = grouped_sums(head['x'], head['y'], head[REGION]).add(grouped_sums(tail['x'], tail['y'], tail[REGION]), fill_value=0)
+    whole = grouped_sums(scaling['x'], scaling['y'], scaling[REGION])
+    pd.testing.assert_frame_equal(
+        ols_from_sums(combined.astype({'n': int})),
+        ols_from_sums(whole),
+        check_exact=False, rtol=1e-9
+    )
@@ -0,0 +1,87 @@
+"""KLL sketch quantiles and ranks must stay within the sketch's rank error of the exact values,
+and merging sketches of a split stream must answer like one sketch of the whole stream."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from metro_data import GDP_PER_CAPITA, clean_metros
+from sketches import KLLSketch
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+K = 200
+# KLL's rank error is about 1.7 / k with high probability; the seeds below are fixed
+EPSILON = 2 / K
+QUANTILES = np.linspace(0, 1, 41)
+
+
+def exact_rank(data, value):
+    return np.searchsorted(np.sort(data), value, side='right') / len(data)
+
+
+@pytest.fixture(scope='module', params=['lognormal', 'dataset'])
+def stream(request):
+    if request.param == 'dataset':
+        return clean_metros(pd.read_csv(DATASET))[GDP_PER_CAPITA].dropna().to_numpy()
+    return np.random.default_rng(1).lognormal(10, 1, 100_000)
+
+
+def test_small_stream_is_exact():
+    data = np.random.default_rng(2).normal(size=K // 2)
+    sketch = KLLSketch(k=K).update(data)
+    np.testing.assert_allclose(sketch.quantile(QUANTILES), np.quantile(data, QUANTILES))
+    assert sketch.size == len(data)
+
+
+def test_quantile_within_rank_error(stream):
+    sketch = KLLSketch(k=K).update(stream)
+    assert sketch.size < 3 * K + 64
+    estimates = sketch.quantile(QUANTILES)
+    exact = np.quantile(stream, QUANTILES)
+    # Compared by rank, as the error bound is stated, since values between ranks can be far apart
+    for q, estimate, value in zip(QUANTILES, estimates, exact):
+        assert abs(exact_rank(stream, estimate) - exact_rank(stream, value)) <= EPSILON, q
+    assert estimates[0] == stream.min() and estimates[-1] == stream.max()
+
+
+def test_rank_within_rank_error(stream):
+    sketch = KLLSketch(k=K).update(stream)
+    for value in np.quantile(stream, QUANTILES[1:-1]):
+        assert abs(sketch.rank(value) - exact_rank(stream, value)) <= EPSILON
+    assert sketch.rank(stream.min() - 1) == 0.0
+    assert sketch.rank(stream.max()) == 1.0
+
+
+def test_nans_are_ignored():
+    data = np.random.default_rng(3).normal(size=5_000)
+    with_nans = np.where(np.arange(len(data)) % 7 == 0, np.nan, data)
+    sketch = KLLSketch(k=K).update(with_nans)
+    assert len(sketch) == np.count_nonzero(~np.isnan(with_nans))
+
+
+@pytest.mark.parametrize('chunks', [2, 7, 50])
+def test_merged_chunks_match_one_stream(stream, chunks):
+    whole = KLLSketch(k=K).update(stream)
+    parts = [KLLSketch(k=K, seed=seed).update(chunk) for seed, chunk in enumerate(np.array_split(stream, chunks))]
+
+    folded = KLLSketch(k=K)
+    for part in parts:
+        folded.merge(part)
+    merged = KLLSketch.merged(parts, k=K)
+
+    assert len(merged) == len(folded) == len(whole) == len(stream)
+    assert (merged.min, merged.max) == (stream.min(), stream.max())
+    np.testing.assert_array_equal(merged.quantile(QUANTILES), folded.quantile(QUANTILES))
+    # Each of the two answers is within the error bound of the exact rank
+    for q, merged_value, whole_value in zip(QUANTILES, merged.quantile(QUANTILES), whole.quantile(QUANTILES)):
+        assert abs(exact_rank(stream, merged_value) - exact_rank(stream, whole_value)) <= 2 * EPSILON, q
+        assert abs(merged.rank(whole_value) - whole.rank(whole_value)) <= 2 * EPSILON, q
+
+
+def test_merging_an_empty_sketch_changes_nothing(stream):
+    sketch = KLLSketch(k=K).update(stream)
+    before = sketch.quantile(QUANTILES)
+    sketch.merge(KLLSketch(k=K))
+    np.testing.assert_array_equal(sketch.quantile(QUANTILES), before)
+    assert np.isnan(KLLSketch.merged([], k=K).median())
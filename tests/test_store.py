@@ -0,0 +1,109 @@
+"""A snapshot patched by a delta must match a snapshot rebuilt from its rows, and the watcher
+must reload any content other than the one the snapshot was loaded from, into the same store."""
+import functools
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from metro_data import CITY, COUNTRY, GDP, POPULATION, clean_metros
+from ranks import SORT_MEASURES
+from results import file_fingerprint
+from store import INDEX, MetroSnapshot, MetroStore
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+# Totals and moments are exact; medians and IQRs come from mergeable sketches and are approximate
+EXACT_COLUMNS = [
+    'Metro_Count', 'Mean_GDP_per_capita', 'Std_GDP_per_capita', 'Total_Population', 'Total_GDP',
+    'Weighted_Mean_GDP_per_capita', 'Weighted_Std_GDP_per_capita'
+]
+
+DELTAS = {
+    'patch gdp': pd.DataFrame({INDEX: [1, 2], GDP: [30.5, 20.0]}),
+    'add metro': pd.DataFrame({CITY: ['Newtown'], COUNTRY: ['Iceland'], GDP: [12.0], POPULATION: [250_000]}),
+    'move country': pd.DataFrame({INDEX: [3], COUNTRY: ['Japan']}),
+    # A blank population turns the integer column into float, which rehashes every row
+    'blank population': pd.DataFrame({INDEX: [4], POPULATION: [np.nan]}),
+}
+
+
+@pytest.fixture(scope='module')
+def metros():
+    return clean_metros(pd.read_csv(DATASET))
+
+
+@pytest.mark.filterwarnings('error::FutureWarning')
+@pytest.mark.parametrize('name', DELTAS)
+def test_delta_matches_rebuild(metros, name):
+    store = MetroStore(metros)
+    store.apply_delta(DELTAS[name])
+    patched = store.snapshot
+    rebuilt = MetroSnapshot.build(patched.df)
+
+    assert patched.version == rebuilt.version
+    assert patched.region_versions == rebuilt.region_versions
+    assert np.array_equal(patched.row_hashes, rebuilt.row_hashes)
+
+    total = len(patched.df)
+    for measure in SORT_MEASURES.values():
+        for ascending in (False, True):
+            positions, count = patched.rank_index.page(measure, 0, total, ascending=ascending)
+            expected, expected_count = rebuilt.rank_index.page(measure, 0, total, ascending=ascending)
+            assert count == expected_count
+            assert np.array_equal(positions, expected)
+
+    for level in ('region', 'country'):
+        summary = patched.cube.summary(level).reset_index(drop=True)
+        expected = rebuilt.cube.summary(level).reset_index(drop=True)
+        key = summary.columns[:2] if level == 'country' else summary.columns[:1]
+        pd.testing.assert_frame_equal(summary[list(key)], expected[list(key)])
+        pd.testing.assert_frame_equal(summary[EXACT_COLUMNS], expected[EXACT_COLUMNS], check_dtype=False)
+
+
+def test_watch_picks_up_edit_made_before_watching(tmp_path):
+    path = tmp_path / 'dataset.csv'
+    raw = pd.read_csv(DATASET)
+    raw.to_csv(path, index=False)
+    fingerprint = file_fingerprint(path)
+    store = MetroStore(clean_metros(pd.read_csv(path)))
+    # Edited after loading but before the watcher starts
+    raw.iloc[:-1].to_csv(path, index=False)
+    store.watch(str(path), fingerprint, interval=0.05)
+    try:
+        deadline = time.time() + 5
+        while store.snapshot.generation == 0 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        store.stop()
+    assert store.snapshot.generation == 1
+    assert len(store.snapshot.df) == len(raw) - 1
+
+
+def _watchers():
+    return sum(thread.name == 'metro-store-watcher' for thread in threading.enumerate())
+
+
+def test_edit_is_swapped_into_the_one_store_of_its_path(tmp_path):
+    path = str(tmp_path / 'dataset.csv')
+    raw = pd.read_csv(DATASET)
+    raw.to_csv(path, index=False)
+    # Keyed on the path alone, as the dashboard's st.cache_resource keys its store
+    open_store = functools.cache(lambda path: MetroStore.from_csv(path, interval=0.05))
+    before = _watchers()
+    store = open_store(path)
+    try:
+        raw.loc[0, GDP] = 99.0
+        raw.to_csv(path, index=False)
+        deadline = time.time() + 5
+        while store.snapshot.generation == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        assert store.snapshot.generation == 1
+        assert store.snapshot.df[GDP].iloc[0] == 99.0
+        # A rerun after the edit finds the same store, still watched by one thread
+        assert open_store(path) is store
+        assert _watchers() - before == 1
+    finally:
+        store.stop()
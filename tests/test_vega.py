@@ -0,0 +1,107 @@
+"""The tables vega.py sends for the dashboard's Altair views must match the same aggregates
+computed directly in pandas, and expressions must leave string literals as written."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from binning import BUCKETINGS, PopulationBinner
+from charts import regional_performance_view, size_efficiency_view, size_histogram_view
+from metro_data import GDP, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from vega import _Expression, evaluate
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+CATEGORY = 'Population Size Category'
+
+
+@pytest.fixture(scope='module')
+def metros():
+    return clean_metros(pd.read_csv(DATASET))
+
+
+@pytest.fixture(scope='module')
+def binner(metros):
+    return PopulationBinner(metros[POPULATION])
+
+
+@pytest.fixture(scope='module')
+def scatter_df(metros, binner):
+    # As the scatter section filters and categorizes the metros
+    scatter_df = metros.dropna(subset=[POPULATION, GDP_PER_CAPITA, GDP]).copy()
+    scatter_df[CATEGORY] = binner.categorize('size_category').reindex(scatter_df.index).cat.remove_unused_categories()
+    return scatter_df
+
+
+def layers(chart):
+    spec = evaluate(chart)
+    return [pd.DataFrame(view['data']['values']) for view in spec.get('layer', [spec])]
+
+
+def test_histogram_counts(scatter_df):
+    (table,) = layers(size_histogram_view(scatter_df))
+    steps = table['bin_GDP_per_capita_end'] - table['bin_GDP_per_capita']
+    assert steps.nunique() == 1
+    edges = np.arange(table['bin_GDP_per_capita'].min(), table['bin_GDP_per_capita_end'].max() + steps[0] / 2, steps[0])
+    bins = pd.cut(scatter_df[GDP_PER_CAPITA], edges, right=False, labels=edges[:-1])
+    expected = scatter_df.groupby([CATEGORY, bins], observed=True).size()
+    sent = table.set_index([CATEGORY, 'bin_GDP_per_capita'])['__count']
+    assert sent.to_dict() == {(str(category), float(start)): count for (category, start), count in expected.items()}
+
+
+def test_size_efficiency_aggregates(scatter_df, binner):
+    trend_rows = pd.DataFrame({
+        'Population_Size': binner.categorize('size_trend').reindex(scatter_df.index),
+        'GDP_per_capita': scatter_df[GDP_PER_CAPITA],
+        'Population': scatter_df[POPULATION]
+    })
+    ci = pd.DataFrame({'ci_low': [1.0, 2.0], 'ci_high': [3.0, 4.0]}, index=pd.Index(['a', 'b'], name='label'))
+    band, lines, rules = layers(size_efficiency_view(trend_rows, list(BUCKETINGS['size_trend'][1]), ci))
+
+    grouped = trend_rows.groupby('Population_Size', observed=True)
+    expected = pd.DataFrame({
+        'Mean': grouped['GDP_per_capita'].mean(),
+        'Median': grouped['GDP_per_capita'].median(),
+        'Population-weighted Mean': grouped.apply(lambda rows: np.average(rows['GDP_per_capita'], weights=rows['Population'])),
+        'std': grouped['GDP_per_capita'].std(),
+        'count': grouped.size()
+    })
+    expected.index = expected.index.astype(str)
+
+    band = band.set_index('Population_Size').loc[expected.index]
+    np.testing.assert_allclose(band['low'], expected['Mean'] - expected['std'], rtol=1e-9)
+    np.testing.assert_allclose(band['high'], expected['Mean'] + expected['std'], rtol=1e-9)
+
+    statistics = lines.pivot(index='Population_Size', columns='Statistic', values='GDP per Capita').loc[expected.index]
+    for statistic in ('Mean', 'Median', 'Population-weighted Mean'):
+        np.testing.assert_allclose(statistics[statistic], expected[statistic], rtol=1e-9)
+    counts = lines.drop_duplicates('Population_Size').set_index('Population_Size')['count'].loc[expected.index]
+    np.testing.assert_array_equal(counts, expected['count'])
+
+    pd.testing.assert_frame_equal(rules, ci.reset_index().rename(columns={'label': 'Population_Size'})[rules.columns])
+
+
+def test_regional_performance_aggregates(scatter_df):
+    region_order = sorted(scatter_df[REGION].unique())
+    bars, line = layers(regional_performance_view(scatter_df, region_order))
+    grouped = scatter_df.groupby(REGION)
+
+    bars = bars.set_index(REGION).loc[region_order]
+    np.testing.assert_allclose(bars['mean_GDP_per_capita'], grouped[GDP_PER_CAPITA].mean().loc[region_order], rtol=1e-9)
+    np.testing.assert_allclose(bars['median_GDP_per_capita'], grouped[GDP_PER_CAPITA].median().loc[region_order], rtol=1e-9)
+    np.testing.assert_array_equal(bars['__count'], grouped.size().loc[region_order])
+
+    weighted = grouped.apply(lambda rows: np.average(rows[GDP_PER_CAPITA], weights=rows[POPULATION]))
+    np.testing.assert_allclose(line.set_index(REGION)['weighted_mean'].loc[region_order], weighted.loc[region_order], rtol=1e-9)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("datum.Country != 'X!'", [False, True, True, True]),
+    ('datum.Country === "a && b"', [False, False, True, False]),
+    ("!(datum.Country == 'true') && datum.v > 1", [False, True, True, False]),
+    ("datum['Country'] == 'datum.v' || datum.v == 4", [False, False, False, True]),
+    (r"datum.Country != 'it\'s!'", [True, True, True, True]),
+])
+def test_string_literals_are_not_rewritten(text, expected):
+    frame = pd.DataFrame({'Country': ['X!', 'Y', 'a && b', 'true'], 'v': [1, 2, 3, 4]})
+    np.testing.assert_array_equal(_Expression(text)(frame), expected)
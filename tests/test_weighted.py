@@ -0,0 +1,94 @@
+"""Population-weighted statistics must match numpy and statsmodels on the rows they keep, and
+rows with a missing or zero weight must be left out rather than turn the result into NaN."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.stats.weightstats import DescrStatsW
+
+from metro_data import GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+from weighted import WeightedMoments, grouped_weighted_stats, weighted_mean, weighted_quantile, weighted_var
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset.csv')
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+# statsmodels 0.14 aggregates with np.sum, which pandas 2.1 warns about
+pytestmark = pytest.mark.filterwarnings('ignore:The provided callable:FutureWarning')
+
+
+@pytest.fixture(scope='module')
+def metros():
+    metros = clean_metros(pd.read_csv(DATASET))
+    # Blank a few populations and zero a few others, as in an incomplete vintage
+    population = metros[POPULATION].astype(float)
+    population.iloc[::50] = np.nan
+    population.iloc[7::50] = 0
+    return metros.assign(**{POPULATION: population})
+
+
+@pytest.fixture(scope='module')
+def kept(metros):
+    values, weights = metros[GDP_PER_CAPITA].to_numpy(dtype=float), metros[POPULATION].to_numpy()
+    keep = ~(np.isnan(values) | np.isnan(weights)) & (weights > 0)
+    assert (~keep).sum() >= 2 * (len(metros) // 50)
+    return values[keep], weights[keep]
+
+
+def test_mean_and_variance_match_numpy_and_statsmodels(metros, kept):
+    values, weights = kept
+    stats = DescrStatsW(values, weights, ddof=0)
+    mean = weighted_mean(metros[GDP_PER_CAPITA], metros[POPULATION])
+    variance = weighted_var(metros[GDP_PER_CAPITA], metros[POPULATION])
+    assert mean == pytest.approx(np.average(values, weights=weights), rel=1e-12)
+    assert mean == pytest.approx(stats.mean, rel=1e-12)
+    assert variance == pytest.approx(np.average((values - np.average(values, weights=weights)) ** 2, weights=weights), rel=1e-9)
+    assert variance == pytest.approx(stats.var, rel=1e-9)
+
+
+def test_quantiles_match_statsmodels(metros, kept):
+    # Populations are large and distinct, so no cumulative weight lands exactly on a quantile,
+    # where statsmodels would average the two neighbouring values
+    values, weights = kept
+    expected = DescrStatsW(values, weights, ddof=0).quantile(QUANTILES, return_pandas=False)
+    np.testing.assert_array_equal(weighted_quantile(metros[GDP_PER_CAPITA], metros[POPULATION], QUANTILES), expected)
+
+
+def test_quantiles_match_repeated_values():
+    # Integer weights are frequencies: the weighted quantile is numpy's inverted CDF of the repeated values
+    rng = np.random.default_rng(0)
+    values, weights = rng.normal(size=200), rng.integers(1, 6, size=200)
+    expected = np.quantile(np.repeat(values, weights), QUANTILES, method='inverted_cdf')
+    np.testing.assert_array_equal(weighted_quantile(values, weights, QUANTILES), expected)
+    assert weighted_quantile(values, weights, 0.5) == expected[49]
+
+
+def test_nothing_to_weigh_is_nan():
+    assert np.isnan(weighted_mean([1.0, 2.0], [0, np.nan]))
+    assert np.isnan(weighted_var([], []))
+    assert np.isnan(weighted_quantile([1.0], [0], [0.5])).all()
+
+
+def test_moments_add_and_subtract(kept):
+    values, weights = kept
+    whole = WeightedMoments.from_arrays(values, weights)
+    head = WeightedMoments.from_arrays(values[:300], weights[:300])
+    tail = WeightedMoments.from_arrays(values[300:], weights[300:])
+    assert (head + tail).mean == pytest.approx(whole.mean, rel=1e-12)
+    assert (head + tail).variance == pytest.approx(whole.variance, rel=1e-9)
+    assert (whole - head).mean == pytest.approx(tail.mean, rel=1e-9)
+    assert (whole - head).std == pytest.approx(DescrStatsW(values[300:], weights[300:], ddof=0).std, rel=1e-6)
+
+
+def test_grouped_stats_match_each_group(metros):
+    stats = grouped_weighted_stats(metros[GDP_PER_CAPITA], metros[POPULATION], metros[REGION])
+    assert list(stats.index) == sorted(metros[REGION].unique())
+    for region, rows in metros.groupby(REGION):
+        values, weights = rows[GDP_PER_CAPITA], rows[POPULATION]
+        assert stats.loc[region, 'mean'] == pytest.approx(weighted_mean(values, weights), rel=1e-12)
+        assert stats.loc[region, 'std'] == pytest.approx(np.sqrt(weighted_var(values, weights)), rel=1e-9)
+        np.testing.assert_array_equal(stats.loc[region, ['q25', 'q50', 'q75']].to_numpy(dtype=float), weighted_quantile(values, weights, [0.25, 0.5, 0.75]))
+
+    codes, labels = pd.factorize(metros[REGION], sort=True)
+    moments = WeightedMoments.by_group(metros[GDP_PER_CAPITA], metros[POPULATION], codes, len(labels))
+    np.testing.assert_allclose(moments.mean, stats['mean'].to_numpy(), rtol=1e-12)
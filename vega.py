@@ -0,0 +1,374 @@
+"""Server-side evaluation of Vega-Lite data transforms for Altair charts.
+
+An aggregate view is declared as an ordinary Altair chart over row-level data, with filter,
+calculate, bin, aggregate and fold transforms and encoding-level ``bin``/``aggregate``. `evaluate`
+runs those transforms in pandas and returns a Vega-Lite spec whose views carry only the
+resulting table, with the transforms removed and the encodings pointed at the computed
+fields (binned channels become ``bin: "binned"`` start/end pairs). The browser receives one
+row per group, so the payload does not grow with the number of metros behind the chart.
+
+Single and layered views are supported. A transform or expression outside the subset
+evaluated here raises ValueError instead of silently being drawn from unaggregated rows.
+"""
+import ast
+import json
+import math
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from figures import FigurePayload
+
+# Vega-Lite's default bin counts: fewer bins on channels that encode bins as discrete marks
+FEW_BIN_CHANNELS = ('color', 'fill', 'stroke', 'opacity', 'fillOpacity', 'strokeOpacity', 'shape', 'size', 'row', 'column', 'facet')
+SECOND_CHANNEL = {'x': 'x2', 'y': 'y2', 'theta': 'theta2', 'radius': 'radius2'}
+BIN_EPSILON = 1e-14
+
+_OPS = {
+    'count': lambda values: values.size(),
+    'valid': lambda values: values.count(),
+    'missing': lambda values: values.size() - values.count(),
+    'distinct': lambda values: values.nunique(dropna=False),
+    'sum': lambda values: values.sum(),
+    'mean': lambda values: values.mean(),
+    'average': lambda values: values.mean(),
+    'median': lambda values: values.median(),
+    'q1': lambda values: values.quantile(0.25),
+    'q3': lambda values: values.quantile(0.75),
+    'min': lambda values: values.min(),
+    'max': lambda values: values.max(),
+    'stdev': lambda values: values.std(),
+    'stdevp': lambda values: values.std(ddof=0),
+    'variance': lambda values: values.var(),
+    'variancep': lambda values: values.var(ddof=0)
+}
+_OP_TITLES = {'mean': 'Mean', 'average': 'Average', 'q1': 'Q1', 'q3': 'Q3', 'stdev': 'Standard deviation', 'variance': 'Variance'}
+
+_FUNCTIONS = {
+    'abs': np.abs, 'ceil': np.ceil, 'exp': np.exp, 'floor': np.floor, 'log': np.log,
+    'pow': np.power, 'round': np.round, 'sqrt': np.sqrt,
+    'isValid': lambda values: pd.notna(values)
+}
+_DATUM = re.compile(r'\bdatum\.([A-Za-z_]\w*)')
+# Single- or double-quoted string literals, with backslash escapes
+_STRING = re.compile(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')''')
+
+
+def _field(name):
+    # Vega-Lite escapes dots and brackets in field names with a backslash
+    return re.sub(r'\\(.)', r'\1', name)
+
+
+def bin_extent(start, stop, maxbins=10, step=None, steps=None, nice=True, base=10, divide=(5, 2), minstep=0, span=None):
+    """Return (start, stop, step) of the bins Vega would choose for the extent [start, stop]."""
+    span = span or (stop - start) or abs(start) or 1
+    logb = math.log(base)
+    if step is None and steps:
+        target = span / maxbins
+        step = next((candidate for candidate in sorted(steps) if candidate >= target), max(steps))
+    elif step is None:
+        level = math.ceil(math.log(maxbins) / logb)
+        step = max(minstep, base ** (round(math.log(span) / logb) - level))
+        while math.ceil(span / step) > maxbins:
+            step *= base
+        for divisor in divide:
+            candidate = step / divisor
+            if candidate >= minstep and span / candidate <= maxbins:
+                step = candidate
+    precision = 0 if math.log(step) >= 0 else int(-math.log(step) / logb) + 1
+    epsilon = base ** (-precision - 1)
+    if nice:
+        lower = math.floor(start / step + epsilon) * step
+        start = lower - step if start < lower else lower
+        stop = math.ceil(stop / step) * step
+    return start, (start + step if stop == start else stop), step
+
+
+def bin_values(values, params, maxbins):
+    """Bin starts and ends of `values` under Vega-Lite bin parameters (True or a dict)."""
+    params = dict(params) if isinstance(params, dict) else {}
+    values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    extent = params.pop('extent', None)
+    if extent is None:
+        valid = values[np.isfinite(values)]
+        extent = (valid.min(), valid.max()) if len(valid) else (0.0, 0.0)
+    params.pop('anchor', None)
+    params.pop('binned', None)
+    params.setdefault('maxbins', maxbins)
+    start, stop, step = bin_extent(float(extent[0]), float(extent[1]), **params)
+    clipped = np.clip(values, start, stop - step)
+    starts = start + step * np.floor(BIN_EPSILON + (clipped - start) / step)
+    starts[values < start] = -np.inf
+    starts[values > stop] = np.inf
+    return starts, starts + step
+
+
+class _Expression:
+    """A Vega expression translated to Python and evaluated column-wise over a frame."""
+
+    def __init__(self, text):
+        # Operators are rewritten between string literals only, so a literal such as 'X!' is kept as written
+        parts = _STRING.split(text)
+        source = ''.join(part if position % 2 else self._translate(part) for position, part in enumerate(parts))
+        try:
+            self.tree = ast.parse(source.strip(), mode='eval').body
+        except SyntaxError:
+            raise ValueError(f'Unsupported Vega expression: {text}') from None
+        self.text = text
+
+    @staticmethod
+    def _translate(code):
+        source = _DATUM.sub(lambda match: f'datum[{match.group(1)!r}]', code)
+        for vega, python in (('===', '=='), ('!==', '!='), ('&&', ' and '), ('||', ' or ')):
+            source = source.replace(vega, python)
+        source = re.sub(r'!(?!=)', ' not ', source)
+        return re.sub(r'\bnull\b', 'None', re.sub(r'\btrue\b', 'True', re.sub(r'\bfalse\b', 'False', source)))
+
+    def __call__(self, frame):
+        return self._eval(self.tree, frame)
+
+    def _eval(self, node, frame):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'datum':
+            return frame[_field(self._eval(node.slice, frame))]
+        if isinstance(node, ast.BoolOp):
+            values = [self._eval(value, frame) for value in node.values]
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = values[0]
+            for value in values[1:]:
+                result = combine(result, value)
+            return result
+        if isinstance(node, ast.UnaryOp):
+            operand = self._eval(node.operand, frame)
+            if isinstance(node.op, ast.Not):
+                return np.logical_not(operand)
+            return -operand if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            return _BINARY[type(node.op)](self._eval(node.left, frame), self._eval(node.right, frame))
+        if isinstance(node, ast.Compare):
+            result, left = True, node.left
+            for op, right in zip(node.ops, node.comparators):
+                result = np.logical_and(result, self._compare(op, left, right, frame))
+                left = right
+            return result
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS:
+            return _FUNCTIONS[node.func.id](*[self._eval(arg, frame) for arg in node.args])
+        raise ValueError(f'Unsupported Vega expression: {self.text}')
+
+    def _compare(self, op, left, right, frame):
+        if type(op) not in _COMPARE:
+            raise ValueError(f'Unsupported Vega expression: {self.text}')
+        for node, other in ((left, right), (right, left)):
+            # Comparing with null tests for missing values, as it does in JavaScript
+            if isinstance(node, ast.Constant) and node.value is None and isinstance(op, (ast.Eq, ast.NotEq)):
+                missing = pd.isna(self._eval(other, frame))
+                return missing if isinstance(op, ast.Eq) else np.logical_not(missing)
+        return _COMPARE[type(op)](self._eval(left, frame), self._eval(right, frame))
+
+
+_BINARY = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide, ast.Mod: np.mod
+}
+_COMPARE = {
+    ast.Eq: np.equal, ast.NotEq: np.not_equal, ast.Lt: np.less, ast.LtE: np.less_equal,
+    ast.Gt: np.greater, ast.GtE: np.greater_equal
+}
+
+
+def _predicate(frame, predicate):
+    """Boolean mask of the rows of `frame` that pass a Vega-Lite filter predicate."""
+    if isinstance(predicate, str):
+        mask = _Expression(predicate)(frame)
+        return np.broadcast_to(np.asarray(mask, dtype=bool), len(frame))
+    if 'and' in predicate:
+        return np.logical_and.reduce([_predicate(frame, part) for part in predicate['and']] + [np.ones(len(frame), dtype=bool)])
+    if 'or' in predicate:
+        return np.logical_or.reduce([_predicate(frame, part) for part in predicate['or']] + [np.zeros(len(frame), dtype=bool)])
+    if 'not' in predicate:
+        return ~_predicate(frame, predicate['not'])
+    if 'field' not in predicate:
+        raise ValueError(f'Unsupported filter predicate: {predicate}')
+    values = frame[_field(predicate['field'])]
+    if 'equal' in predicate:
+        return (values == predicate['equal']).to_numpy()
+    if 'oneOf' in predicate:
+        return values.isin(predicate['oneOf']).to_numpy()
+    if 'range' in predicate:
+        lower, upper = predicate['range']
+        mask = values.notna()
+        if lower is not None:
+            mask &= values >= lower
+        if upper is not None:
+            mask &= values <= upper
+        return mask.to_numpy()
+    if 'valid' in predicate:
+        valid = values.notna() & ~values.isin([np.inf, -np.inf])
+        return (valid if predicate['valid'] else ~valid).to_numpy()
+    for key, compare in (('lt', np.less), ('lte', np.less_equal), ('gt', np.greater), ('gte', np.greater_equal)):
+        if key in predicate:
+            return compare(values, predicate[key]).to_numpy(dtype=bool)
+    raise ValueError(f'Unsupported filter predicate: {predicate}')
+
+
+def _aggregate(frame, groupby, measures):
+    """Group `frame` by `groupby` and compute every (op, field, name) of `measures`."""
+    keys = [frame[column] for column in groupby] or [pd.Series(0, index=frame.index)]
+    grouped = frame.groupby(keys, dropna=False, sort=False, observed=True)
+    results = {}
+    for op, field, name in measures:
+        if op not in _OPS:
+            raise ValueError(f'Unsupported aggregate op: {op}')
+        if op == 'count' or field is None:
+            results[name] = grouped.size()
+        else:
+            results[name] = _OPS[op](grouped[_field(field)])
+    table = pd.DataFrame(results)
+    if groupby:
+        table.index.names = groupby
+        return table.reset_index()
+    return table.reset_index(drop=True)
+
+
+def _transform(frame, transform):
+    if 'filter' in transform:
+        return frame[_predicate(frame, transform['filter'])]
+    if 'calculate' in transform:
+        frame = frame.copy()
+        values = _Expression(transform['calculate'])(frame)
+        frame[transform['as']] = values if np.ndim(values) else np.full(len(frame), values)
+        return frame
+    if 'bin' in transform:
+        field = _field(transform['field'])
+        names = transform['as'] if isinstance(transform['as'], list) else [transform['as'], f"{transform['as']}_end"]
+        frame = frame.copy()
+        frame[names[0]], frame[names[1]] = bin_values(frame[field], transform['bin'], 10)
+        return frame
+    if 'aggregate' in transform:
+        measures = [(item['op'], item.get('field'), item['as']) for item in transform['aggregate']]
+        return _aggregate(frame, [_field(column) for column in transform.get('groupby', [])], measures)
+    if 'fold' in transform:
+        key, value = transform.get('as', ['key', 'value'])
+        fields = [_field(field) for field in transform['fold']]
+        return frame.melt(id_vars=[column for column in frame.columns if column not in fields], value_vars=fields, var_name=key, value_name=value)
+    raise ValueError(f'Unsupported transform: {", ".join(transform)}')
+
+
+def _encodings(encoding):
+    """(channel, definition) for every field definition of an encoding, including tooltip lists."""
+    for channel, definition in encoding.items():
+        for item in definition if isinstance(definition, list) else [definition]:
+            if isinstance(item, dict):
+                yield channel, item
+
+
+def _encode(frame, encoding):
+    """Compute encoding-level bins and aggregates; rewrite `encoding` in place and return the table."""
+    groupby, measures, seconds = [], [], {}
+    frame = frame.copy()
+    for channel, definition in list(_encodings(encoding)):
+        sort = definition.get('sort')
+        if isinstance(sort, dict) and 'op' in sort and 'field' in definition:
+            # A sort by an aggregate of the raw rows becomes an explicit order
+            measure = [(sort['op'], sort.get('field'), '__sort')]
+            order = _aggregate(frame, [_field(definition['field'])], measure).sort_values('__sort', ascending=sort.get('order') != 'descending')
+            definition['sort'] = order[_field(definition['field'])].tolist()
+        bin_params = definition.get('bin')
+        if bin_params and bin_params != 'binned':
+            field = _field(definition['field'])
+            start, end = f'bin_{field}', f'bin_{field}_end'
+            if start not in frame:
+                frame[start], frame[end] = bin_values(frame[field], bin_params, 6 if channel in FEW_BIN_CHANNELS else 10)
+                groupby += [start, end]
+            definition.update(field=start, bin='binned', title=definition.get('title', f'{field} (binned)'))
+            if channel in SECOND_CHANNEL and SECOND_CHANNEL[channel] not in encoding:
+                seconds[SECOND_CHANNEL[channel]] = {'field': end}
+        elif 'aggregate' in definition:
+            op, field = definition.pop('aggregate'), definition.get('field')
+            name = '__count' if op == 'count' else f'{op}_{_field(field)}'
+            measures.append((op, field, name))
+            title = 'Count of Records' if op == 'count' else f'{_OP_TITLES.get(op, op.title())} of {_field(field)}'
+            definition.update(field=name, title=definition.get('title', title))
+        elif 'field' in definition and _field(definition['field']) not in groupby:
+            groupby.append(_field(definition['field']))
+    encoding.update(seconds)
+    if not measures:
+        return frame
+    return _aggregate(frame, groupby, measures)
+
+
+def _records(frame):
+    # to_json writes NaN and infinities as null and numpy scalars as plain numbers
+    return json.loads(frame.to_json(orient='records', double_precision=10))
+
+
+def _views(chart):
+    return [chart] + list(getattr(chart, 'layer', None) or [])
+
+
+def _detach(chart):
+    """Copy `chart` with every DataFrame cut to its first row; return it and the full frames by view."""
+    chart = chart.copy(deep=True, ignore=['data'])
+    frames = {}
+    for position, view in enumerate(_views(chart)):
+        data = view._get('data')
+        if isinstance(data, pd.DataFrame):
+            frames[position] = data
+            # One row keeps the dtypes Altair infers field types from
+            view.data = data.head(1)
+    return chart, frames
+
+
+def _evaluate(spec, frames):
+    if any(key in spec for key in ('concat', 'hconcat', 'vconcat', 'facet', 'repeat')):
+        raise ValueError('Only single and layered views are evaluated server-side')
+    spec.pop('datasets', None)
+    spec.pop('data', None)
+    top_transforms = spec.pop('transform', [])
+    layers = spec.get('layer')
+    for position, view in enumerate(layers, start=1) if layers else [(0, spec)]:
+        view.pop('data', None)
+        frame = frames.get(position, frames.get(0))
+        if frame is None:
+            raise ValueError('Every view needs a DataFrame to evaluate')
+        for transform in top_transforms + view.pop('transform', []):
+            frame = _transform(frame, transform)
+        frame = _encode(frame, view.get('encoding', {}))
+        used = {_field(item['field']) for _, item in _encodings(view.get('encoding', {})) if 'field' in item}
+        view['data'] = {'values': _records(frame[[column for column in frame.columns if column in used]])}
+    return spec
+
+
+def evaluate(chart):
+    """Return the Vega-Lite spec of `chart` with its data reduced to the transformed, aggregated table."""
+    detached, frames = _detach(chart)
+    return _evaluate(detached.to_dict(), frames)
+
+
+def row_level_size(chart):
+    """Bytes of the spec Altair would send for `chart`, with every row inlined."""
+    detached, frames = _detach(chart)
+    spec = json.dumps(detached.to_dict(), separators=(',', ':'))
+    return len(spec.encode('utf-8')) + sum(len(frame.to_json(orient='records').encode('utf-8')) for frame in frames.values())
+
+
+def chart_name(spec):
+    title = spec.get('title')
+    if isinstance(title, dict):
+        title = title.get('text')
+    return title or 'chart'
+
+
+def render_chart(chart, measure=False):
+    """Draw `chart` across the page width from server-side aggregates.
+
+    With `measure`, return its FigurePayload; otherwise None.
+    """
+    spec = evaluate(chart)
+    st.vega_lite_chart(spec=spec, use_container_width=True)
+    if not measure:
+        return None
+    text = json.dumps(spec, separators=(',', ':'))
+    return FigurePayload(chart_name(spec), row_level_size(chart), len(text.encode('utf-8')))
@@ -0,0 +1,189 @@
+"""Annual vintages of the metro data, stored one partition per year.
+
+Each vintage is a raw CSV in the vintage directory named after its year (``2024.csv``);
+``dataset.csv`` stands in for its base year when that year has no partition of its own.
+Results that only depend on one year (cleaned rows, per-country sums, ranks and outlier
+scores) are computed once per partition and content fingerprint, so adding or replacing a
+vintage recomputes that year alone. Cross-year views (growth rates, rank changes) are read
+from the merged partition results.
+"""
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from backends import PandasBackend
+from metro_data import CITY, COUNTRY, GDP, GDP_PER_CAPITA, POPULATION, REGION, clean_metros
+
+YEAR = 'Year'
+BASE_YEAR = 2023
+RANKED = [GDP_PER_CAPITA, GDP, POPULATION]
+
+_PARTITION_NAME = re.compile(r'^(\d{4})\.csv$')
+
+
+def rank_column(measure):
+    return f'Rank_{measure}'
+
+
+class VintagePartition:
+    """Everything derived from a single year: cleaned rows, country sums, ranks and z-scores."""
+
+    def __init__(self, year, raw, fingerprint):
+        self.year = year
+        self.fingerprint = fingerprint
+        metros = clean_metros(raw).dropna(subset=[GDP_PER_CAPITA, POPULATION, GDP])
+        metros = metros.drop_duplicates(subset=[CITY, COUNTRY], keep='last').reset_index(drop=True)
+        for measure in RANKED:
+            metros[rank_column(measure)] = metros[measure].rank(ascending=False, method='first').astype(int)
+        values = metros[GDP_PER_CAPITA]
+        metros['z_score'] = (values - values.mean()) / values.std(ddof=0) if len(metros) > 1 else 0.0
+        metros.insert(0, YEAR, year)
+        self.metros = metros
+
+        country = PandasBackend(metros).country_sums()
+        country.insert(0, YEAR, year)
+        self.country_sums = country
+
+
+def _fingerprint(path):
+    with open(path, 'rb') as handle:
+        return hashlib.sha1(handle.read()).hexdigest()[:16]
+
+
+class VintageStore:
+    """Discover year partitions on disk and keep their results, recomputing only what changed."""
+
+    def __init__(self, directory, base_csv=None, base_year=BASE_YEAR):
+        self.directory = directory
+        self.base_csv = base_csv
+        self.base_year = base_year
+        self._partitions = {}
+        self._stats = {}
+        self._panel = None
+        self._lock = threading.Lock()
+
+    def _sources(self):
+        sources = {}
+        if self.base_csv and os.path.exists(self.base_csv):
+            sources[self.base_year] = self.base_csv
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                match = _PARTITION_NAME.match(name)
+                if match:
+                    sources[int(match.group(1))] = os.path.join(self.directory, name)
+        return sources
+
+    def refresh(self):
+        """Pick up new, changed or removed partitions; return the years that were recomputed."""
+        with self._lock:
+            sources = self._sources()
+            changed = []
+            for year, path in sources.items():
+                stat = os.stat(path)
+                signature = (path, stat.st_mtime_ns, stat.st_size)
+                if self._stats.get(year) == signature:
+                    continue
+                fingerprint = _fingerprint(path)
+                self._stats[year] = signature
+                partition = self._partitions.get(year)
+                if partition is None or partition.fingerprint != fingerprint:
+                    self._partitions[year] = VintagePartition(year, pd.read_csv(path), fingerprint)
+                    changed.append(year)
+            for year in set(self._partitions) - set(sources):
+                del self._partitions[year]
+                self._stats.pop(year, None)
+                changed.append(year)
+            if changed:
+                self._panel = None
+            return sorted(changed)
+
+    def add(self, year, raw):
+        """Store `raw` as the partition for `year` and compute that partition alone."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{int(year)}.csv')
+        partial = f'{path}.tmp'
+        raw.to_csv(partial, index=False)
+        os.replace(partial, path)
+        return self.refresh()
+
+    @property
+    def years(self):
+        return sorted(self._partitions)
+
+    def fingerprints(self, *years):
+        """Content fingerprints of the partitions of `years`, for keying results drawn from them."""
+        return tuple(self._partitions[year].fingerprint for year in years)
+
+    def panel(self):
+        """All vintages' metro rows stacked, with per-year ranks and z-scores."""
+        with self._lock:
+            if self._panel is None:
+                frames = [self._partitions[year].metros for year in sorted(self._partitions)]
+                self._panel = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            return self._panel
+
+    def region_totals(self):
+        """GDP, population and metro count per region and year, merged from the country sums."""
+        frames = [self._partitions[year].country_sums for year in self.years]
+        if not frames:
+            return pd.DataFrame(columns=[YEAR, REGION, 'count', 'gdp', 'population'])
+        sums = pd.concat(frames, ignore_index=True)
+        return sums.groupby([YEAR, REGION], sort=True)[['count', 'gdp', 'population']].sum().reset_index()
+
+    def _pair(self, start, end):
+        panel = self.panel()
+        keys = [CITY, COUNTRY]
+        first = panel[panel[YEAR] == start].set_index(keys)
+        last = panel[panel[YEAR] == end].set_index(keys)
+        # Only metros present in both vintages can be compared
+        common = first.index.intersection(last.index)
+        return first.loc[common], last.loc[common]
+
+    def growth(self, start, end):
+        """Per-metro total and annualized growth of GDP, population and GDP per capita."""
+        first, last = self._pair(start, end)
+        years = max(end - start, 1)
+        growth = last[[REGION]].copy()
+        for measure, label in [(GDP, 'GDP'), (POPULATION, 'Population'), (GDP_PER_CAPITA, 'GDP_per_capita')]:
+            ratio = last[measure] / first[measure]
+            growth[f'{label}_growth'] = (ratio - 1) * 100
+            growth[f'{label}_cagr'] = (np.power(ratio, 1 / years) - 1) * 100
+        return growth.reset_index()
+
+    def region_growth(self, start, end):
+        """Regional growth from summed totals, so per-capita growth is population-weighted.
+
+        Totals cover the metros present in both vintages, as in `growth`, so metros added to or
+        dropped from the dataset do not show up as growth.
+        """
+        columns = [REGION, 'GDP_growth', 'Population_growth', 'GDP_per_capita_growth']
+        if start not in self._partitions or end not in self._partitions:
+            return pd.DataFrame(columns=columns)
+        first, last = self._pair(start, end)
+        # Keyed by (metro, country), so both vintages put every common metro in the same region
+        first = first.groupby(last[REGION], sort=True)[[GDP, POPULATION]].sum()
+        last = last.groupby(REGION, sort=True)[[GDP, POPULATION]].sum()
+        per_capita_ratio = (last[GDP] / last[POPULATION]) / (first[GDP] / first[POPULATION])
+        return pd.DataFrame({
+            'GDP_growth': (last[GDP] / first[GDP] - 1) * 100,
+            'Population_growth': (last[POPULATION] / first[POPULATION] - 1) * 100,
+            'GDP_per_capita_growth': (per_capita_ratio - 1) * 100
+        }).rename_axis(REGION).reset_index()[columns]
+
+    def rank_change(self, start, end, measure=GDP_PER_CAPITA):
+        """Rank of every metro in both vintages; positive Rank_change means it climbed."""
+        first, last = self._pair(start, end)
+        column = rank_column(measure)
+        change = pd.DataFrame({
+            REGION: last[REGION],
+            'Rank_start': first[column],
+            'Rank_end': last[column],
+            'z_score_start': first['z_score'],
+            'z_score_end': last['z_score']
+        })
+        change['Rank_change'] = change['Rank_start'] - change['Rank_end']
+        return change.reset_index()
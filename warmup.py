@@ -0,0 +1,96 @@
+"""Warm-up stage run once when a server starts, precomputing the states most sessions open on.
+
+A `WarmUp` runs a list of named tasks in order on a daemon thread and records its progress:
+the tasks done out of the total, the one running, the ones that failed and the time taken.
+`status` returns all of it for display. ``ready`` is set once every task has run, whether or
+not it failed.
+
+The tasks fill the same caches that sessions read, so a session that opens on a warmed state
+finds its results already computed. Warm-up never gates a session. A session that arrives
+before warm-up is done computes what it needs itself. If the warm-up thread is computing the
+same key at that moment, the session waits for that result through the cache's per-key lock
+instead of computing it twice.
+
+`filter_states` lists the filter panel combinations worth precomputing, most common first:
+the default panel (every region, every population size), each population size over every
+region, and each region on its own. Set ``METRO_WARMUP=0`` to turn warm-up off.
+"""
+import os
+import threading
+import time
+
+from binning import BUCKETINGS
+from metro_data import REGION
+
+
+def warmup_enabled():
+    return os.environ.get('METRO_WARMUP', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def filter_states(df):
+    """(regions, population size) filter combinations, most common first."""
+    regions = sorted(df[REGION].unique().tolist())
+    states = [(regions, 'All')]
+    states += [(regions, label) for label in BUCKETINGS['pop_filter'][1]]
+    states += [([region], 'All') for region in regions]
+    return states
+
+
+class WarmUp:
+    """Run (label, callable) tasks in order on a background thread and track their progress."""
+
+    def __init__(self, tasks, name='metro-warmup'):
+        self.tasks = list(tasks)
+        self.done = 0
+        self.current = None
+        self.errors = []
+        self.started = self.finished = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    @property
+    def total(self):
+        return len(self.tasks)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 1.0
+
+    def start(self):
+        if self.started is None:
+            self.started = time.time()
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Block until every task has run or `timeout` seconds have passed; return readiness."""
+        return self._ready.wait(timeout)
+
+    def status(self):
+        end = self.finished or time.time()
+        return {
+            'ready': self.ready,
+            'done': self.done,
+            'total': self.total,
+            'progress': self.progress,
+            'current': self.current,
+            'errors': list(self.errors),
+            'elapsed': end - self.started if self.started is not None else 0.0
+        }
+
+    def _run(self):
+        for label, task in self.tasks:
+            self.current = label
+            try:
+                task()
+            except Exception as error:
+                # A failed task is retried by the first session that needs its result
+                self.errors.append(f'{label}: {error}')
+            self.done += 1
+        self.current = None
+        self.finished = time.time()
+        self._ready.set()
@@ -0,0 +1,134 @@
+"""Population-weighted statistics shared by every view of the dashboard."""
+import numpy as np
+import pandas as pd
+
+
+def per_capita(gdp_billion, population):
+    """Convert GDP in billion US$ and a head count into US$ per person."""
+    return gdp_billion * 1e9 / population
+
+
+def _valid(values, weights):
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    keep = ~(np.isnan(values) | np.isnan(weights)) & (weights > 0)
+    return values[keep], weights[keep]
+
+
+def weighted_mean(values, weights):
+    values, weights = _valid(values, weights)
+    return WeightedMoments.from_arrays(values, weights).mean
+
+
+def weighted_var(values, weights):
+    values, weights = _valid(values, weights)
+    return WeightedMoments.from_arrays(values, weights).variance
+
+
+def weighted_quantile(values, weights, q):
+    """Return the value where the cumulative weight first reaches q of the total."""
+    values, weights = _valid(values, weights)
+    scalar = np.ndim(q) == 0
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    if len(values) == 0:
+        result = np.full(q.shape, np.nan)
+    else:
+        order = np.argsort(values, kind='mergesort')
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        result = values[order][np.minimum(positions, len(values) - 1)]
+    return result[0] if scalar else result
+
+
+def weighted_median(values, weights):
+    return weighted_quantile(values, weights, 0.5)
+
+
+class WeightedMoments:
+    """Sufficient statistics (sum w, sum wx, sum wx^2) for weighted means and variances.
+
+    Moments are additive, so they can be kept per group, updated from streamed chunks,
+    merged across partitions, and have rows subtracted again without revisiting raw data.
+    Each field may be a scalar or an array holding one entry per group.
+    """
+
+    def __init__(self, sum_w=0.0, sum_wx=0.0, sum_wx2=0.0):
+        self.sum_w = sum_w
+        self.sum_wx = sum_wx
+        self.sum_wx2 = sum_wx2
+
+    @classmethod
+    def from_arrays(cls, values, weights):
+        values = np.asarray(values, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        return cls(weights.sum(), (weights * values).sum(), (weights * values ** 2).sum())
+
+    @classmethod
+    def by_group(cls, values, weights, codes, n_groups):
+        """Per-group moments for integer group codes in [0, n_groups); negative codes are skipped."""
+        values = np.asarray(values, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        codes = np.asarray(codes)
+        keep = (codes >= 0) & ~(np.isnan(values) | np.isnan(weights))
+        values, weights, codes = values[keep], weights[keep], codes[keep]
+        return cls(
+            np.bincount(codes, weights, minlength=n_groups),
+            np.bincount(codes, weights * values, minlength=n_groups),
+            np.bincount(codes, weights * values ** 2, minlength=n_groups)
+        )
+
+    def __add__(self, other):
+        return WeightedMoments(self.sum_w + other.sum_w, self.sum_wx + other.sum_wx, self.sum_wx2 + other.sum_wx2)
+
+    def __sub__(self, other):
+        return WeightedMoments(self.sum_w - other.sum_w, self.sum_wx - other.sum_wx, self.sum_wx2 - other.sum_wx2)
+
+    @property
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.sum_w > 0, np.divide(self.sum_wx, self.sum_w), np.nan)[()]
+
+    @property
+    def variance(self):
+        """Population-weighted variance (weights treated as frequencies)."""
+        mean = self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = np.divide(self.sum_wx2, self.sum_w) - mean ** 2
+        return np.clip(variance, 0, None)[()]
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+def grouped_weighted_stats(values, weights, groups, quantiles=(0.25, 0.5, 0.75)):
+    """Weighted mean, std and quantiles for every group in one vectorized pass.
+
+    Rows are sorted by (group, value) once; because the running weight total is monotonic
+    across the whole array, every quantile of every group is found by a single searchsorted
+    against group offset + q * group total.
+    """
+    codes, labels = pd.factorize(pd.Series(groups), sort=True)
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    keep = (codes >= 0) & ~(np.isnan(values) | np.isnan(weights)) & (weights > 0)
+    values, weights, codes = values[keep], weights[keep], codes[keep]
+    n_groups = len(labels)
+
+    moments = WeightedMoments.by_group(values, weights, codes, n_groups)
+    stats = pd.DataFrame({'weight': moments.sum_w, 'mean': moments.mean, 'std': moments.std}, index=labels)
+
+    order = np.lexsort((values, codes))
+    cumulative = np.cumsum(weights[order])
+    offsets = np.concatenate([[0.0], np.cumsum(moments.sum_w)[:-1]])
+    counts = np.bincount(codes, minlength=n_groups)
+    group_first = np.cumsum(counts) - counts
+    group_last = np.cumsum(counts) - 1
+    sorted_values = values[order]
+    for q in quantiles:
+        positions = np.searchsorted(cumulative, offsets + q * moments.sum_w, side='left')
+        # Rounding in the running total must never step into a neighbouring group
+        positions = np.clip(np.clip(positions, group_first, group_last), 0, max(len(values) - 1, 0))
+        quantile = sorted_values[positions] if len(values) else np.full(n_groups, np.nan)
+        stats[f'q{int(round(q * 100))}'] = np.where(moments.sum_w > 0, quantile, np.nan)
+    return stats